@@ -3,6 +3,7 @@ import os
 from theflow.settings import settings as flowsettings
 
 KH_APP_DATA_DIR = getattr(flowsettings, "KH_APP_DATA_DIR", ".")
+KH_THUMBNAIL_DIR = getattr(flowsettings, "KH_THUMBNAIL_DIR", None)
 GRADIO_TEMP_DIR = os.getenv("GRADIO_TEMP_DIR", None)
 # override GRADIO_TEMP_DIR if it's not set
 if GRADIO_TEMP_DIR is None:
@@ -20,5 +21,6 @@ demo.queue().launch(
     allowed_paths=[
         "libs/ktem/ktem/assets",
         GRADIO_TEMP_DIR,
+        *([KH_THUMBNAIL_DIR] if KH_THUMBNAIL_DIR else []),
     ],
 )
@@ -80,20 +80,60 @@ KH_FEATURE_USER_MANAGEMENT_PASSWORD = str(
 KH_ENABLE_ALEMBIC = False
 KH_DATABASE = f"sqlite:///{KH_USER_DATA_DIR / 'sql.db'}"
 KH_FILESTORAGE_PATH = str(KH_USER_DATA_DIR / "files")
+KH_THUMBNAIL_DIR = str(KH_USER_DATA_DIR / "files" / "thumbnails")
+# the page thumbnails are shared by the files with the same pages, the least
+# recently used are evicted beyond the size limit, 0 for no limit
+KH_THUMBNAIL_SIZE_MB = config("KH_THUMBNAIL_SIZE_MB", default=1024, cast=int)
 
 KH_DOCSTORE = {
     # "__type__": "kotaemon.storages.ElasticsearchDocumentStore",
     # "__type__": "kotaemon.storages.SimpleFileDocumentStore",
     "__type__": "kotaemon.storages.LanceDBDocumentStore",
     "path": str(KH_USER_DATA_DIR / "docstore"),
+    # refresh the full-text index once per indexed file instead of on every write
+    "fts_refresh": "deferred",
 }
 KH_VECTORSTORE = {
     # "__type__": "kotaemon.storages.LanceDBVectorStore",
     "__type__": "kotaemon.storages.ChromaVectorStore",
     # "__type__": "kotaemon.storages.MilvusVectorStore",
     # "__type__": "kotaemon.storages.QdrantVectorStore",
+    # "__type__": "kotaemon.storages.MemmapVectorStore",
     "path": str(KH_USER_DATA_DIR / "vectorstore"),
 }
+# cache the retrieved documents of recent questions, 0 to disable
+KH_RETRIEVAL_CACHE_SIZE = config("KH_RETRIEVAL_CACHE_SIZE", default=256, cast=int)
+KH_RETRIEVAL_CACHE_TTL = config("KH_RETRIEVAL_CACHE_TTL", default=600, cast=int)
+# reasoning pipelines reused across chat turns, 0 to disable
+KH_PIPELINE_POOL_SIZE = config("KH_PIPELINE_POOL_SIZE", default=64, cast=int)
+# seconds the answer tokens are buffered before being streamed to the chat and to
+# the chat_stream API, which needs gradio `auth` on launch with user management
+KH_CHAT_STREAM_INTERVAL = config("KH_CHAT_STREAM_INTERVAL", default=0.05, cast=float)
+# connection pool of each shared OpenAI client, over HTTP/2 if `h2` is installed
+KH_OPENAI_MAX_CONNECTIONS = config("KH_OPENAI_MAX_CONNECTIONS", default=64, cast=int)
+KH_OPENAI_MAX_KEEPALIVE_CONNECTIONS = config(
+    "KH_OPENAI_MAX_KEEPALIVE_CONNECTIONS", default=16, cast=int
+)
+KH_OPENAI_HTTP2 = config("KH_OPENAI_HTTP2", default=True, cast=bool)
+# embeddings of indexed chunks, keyed by the model and the chunk text
+KH_EMBEDDING_CACHE_PATH = str(KH_USER_DATA_DIR / "embedding_cache.db")
+# documents parsed from the indexed files, keyed by the file content and reader,
+# the least recently used are evicted beyond the size limit, empty to disable
+KH_PARSE_CACHE_DIR = config(
+    "KH_PARSE_CACHE_DIR", default=str(KH_USER_DATA_DIR / "parse_cache")
+)
+KH_PARSE_CACHE_SIZE_MB = config("KH_PARSE_CACHE_SIZE_MB", default=1024, cast=int)
+# files indexed at the same time, each parsed by its own copy of the reader. The
+# indexing threads take turns calling the shared embedding model and stores
+KH_INGESTION_CONCURRENCY = config("KH_INGESTION_CONCURRENCY", default=4, cast=int)
+# processes parsing the files, 0 to parse in the indexing threads. The processes
+# are spawned, they import the entry point of the app again
+KH_INGESTION_READER_PROCESSES = config(
+    "KH_INGESTION_READER_PROCESSES", default=0, cast=int
+)
+# chunks indexed in quick mode, embedded in the background by a worker pool
+KH_EMBEDDING_QUEUE_PATH = str(KH_USER_DATA_DIR / "embedding_queue.db")
+KH_EMBEDDING_QUEUE_WORKERS = config("KH_EMBEDDING_QUEUE_WORKERS", default=2, cast=int)
 KH_LLMS = {}
 KH_EMBEDDINGS = {}
 KH_RERANKINGS = {}
@@ -262,6 +302,8 @@ KH_VLM_ENDPOINT = "{0}/openai/deployments/{1}/chat/completions?api-version={2}".
     config("OPENAI_VISION_DEPLOYMENT_NAME", default="gpt-4o"),
     config("OPENAI_API_VERSION", default=""),
 )
+# figures captioned by the VLM at the same time when loading a file
+KH_VLM_MAX_CONCURRENCY = config("KH_VLM_MAX_CONCURRENCY", default=4, cast=int)
 
 
 SETTINGS_APP: dict[str, dict] = {}
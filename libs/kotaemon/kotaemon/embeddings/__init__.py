@@ -1,4 +1,5 @@
 from .base import BaseEmbeddings
+from .cache import EmbeddingCache
 from .endpoint_based import EndpointEmbeddings
 from .fastembed import FastEmbedEmbeddings
 from .langchain_based import (
@@ -12,6 +13,7 @@ from .tei_endpoint_embed import TeiEndpointEmbeddings
 
 __all__ = [
     "BaseEmbeddings",
+    "EmbeddingCache",
     "EndpointEmbeddings",
     "TeiEndpointEmbeddings",
     "LCOpenAIEmbeddings",
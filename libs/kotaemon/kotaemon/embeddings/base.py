@@ -1,7 +1,21 @@
 from __future__ import annotations
 
+import hashlib
+import json
+
 from kotaemon.base import BaseComponent, Document, DocumentWithEmbedding
 
+_MODEL_ID_IGNORED_PARAMS = {
+    "api_key",
+    "timeout",
+    "max_retries",
+    "default_headers",
+    "default_query",
+    "batch_size",
+    "max_batch_tokens",
+    "concurrency",
+}
+
 
 class BaseEmbeddings(BaseComponent):
     def run(
@@ -27,3 +41,18 @@ class BaseEmbeddings(BaseComponent):
         elif isinstance(text, list):
             return [Document(content=_) for _ in text]
         return text
+
+    def get_model_id(self) -> str:
+        """Identify the model producing the embeddings, e.g. to key caches
+
+        Two embedding components with the same class and the same parameters
+        (credentials and connection options aside) get the same model id.
+        """
+        dumped = self.dump()
+        params = {
+            key: value
+            for key, value in dumped.get("params", {}).items()
+            if key not in _MODEL_ID_IGNORED_PARAMS
+        }
+        raw = json.dumps([dumped.get("function"), params], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
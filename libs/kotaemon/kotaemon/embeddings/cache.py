@@ -0,0 +1,86 @@
+import hashlib
+import sqlite3
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """Persistent content-addressed store of embeddings, backed by SQLite
+
+    Each embedding is keyed by sha256(model id + text), so unchanged chunks are
+    never embedded twice by the same model, whichever file they come from.
+    Vectors are stored as float32 blobs.
+
+    Args:
+        path: path to the SQLite database file
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings "
+            "(key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model_id: str, text: str) -> str:
+        """Get the cache key of a text embedded by a model"""
+        return hashlib.sha256(f"{model_id}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get(self, keys: list[str]) -> dict[str, list[float]]:
+        """Get the cached embeddings of the keys, missing keys are left out"""
+        output: dict[str, list[float]] = {}
+        unique_keys = list(dict.fromkeys(keys))
+        # stay below the SQLite limit of host parameters per statement
+        batch_size = 500
+        with self._lock:
+            for i in range(0, len(unique_keys), batch_size):
+                batch = unique_keys[i : i + batch_size]
+                rows = self._conn.execute(
+                    "SELECT key, vector FROM embeddings WHERE key IN "
+                    f"({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for key, vector in rows:
+                    output[key] = np.frombuffer(vector, dtype=np.float32).tolist()
+        return output
+
+    def set(self, embeddings: dict[str, list[float]]):
+        """Store the embeddings, keyed by their cache keys"""
+        if not embeddings:
+            return
+        rows = [
+            (key, np.asarray(vector, dtype=np.float32).tobytes())
+            for key, vector in embeddings.items()
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows
+            )
+            self._conn.commit()
+
+    def count(self) -> int:
+        """Count the number of cached embeddings"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def clear(self):
+        """Remove all the cached embeddings"""
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+
+
+@lru_cache(maxsize=None)
+def get_embedding_cache(path: str) -> EmbeddingCache:
+    """Get the embedding cache stored at path, shared within the process"""
+    return EmbeddingCache(path)
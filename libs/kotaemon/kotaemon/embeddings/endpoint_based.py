@@ -1,8 +1,9 @@
-import requests
-
-from kotaemon.base import Document, DocumentWithEmbedding
+from kotaemon.base import Document, DocumentWithEmbedding, Param
+from kotaemon.utils.concurrency import map_concurrently
+from kotaemon.utils.http import post_json
 
 from .base import BaseEmbeddings
+from .transport import make_batches
 
 
 class EndpointEmbeddings(BaseEmbeddings):
@@ -14,6 +15,22 @@ class EndpointEmbeddings(BaseEmbeddings):
     """
 
     endpoint_url: str
+    batch_size: int = Param(32, help="Maximum number of texts per request")
+    max_batch_tokens: int = Param(
+        16384, help="Maximum estimated number of tokens per request"
+    )
+    concurrency: int = Param(4, help="Number of requests sent in parallel")
+    max_retries: int = Param(3, help="Number of retries of a failed request")
+    timeout: float = Param(60, help="Timeout of each request, in seconds")
+
+    def client_(self, inputs: list[str]) -> dict:
+        return post_json(
+            self.endpoint_url,
+            {"input": inputs},
+            timeout=self.timeout,
+            max_retries=self.max_retries,
+            pool_size=max(self.concurrency, 1),
+        )
 
     def run(
         self, text: str | list[str] | Document | list[Document]
@@ -28,19 +45,34 @@ class EndpointEmbeddings(BaseEmbeddings):
         if not isinstance(text, list):
             text = [text]
 
-        outputs = []
+        inputs = [str(item) for item in text]
+        batches = make_batches(inputs, self.batch_size, self.max_batch_tokens)
 
-        for item in text:
-            response = requests.post(
-                self.endpoint_url, json={"input": str(item)}
-            ).json()
-            outputs.append(
-                DocumentWithEmbedding(
-                    text=str(item),
-                    embedding=response["data"][0]["embedding"],
-                    total_tokens=response["usage"]["total_tokens"],
-                    prompt_tokens=response["usage"]["prompt_tokens"],
+        outputs = []
+        for (start, end), response in zip(
+            batches,
+            map_concurrently(
+                lambda batch: self.client_(inputs[batch[0] : batch[1]]),
+                batches,
+                self.concurrency,
+            ),
+        ):
+            data = sorted(response["data"], key=lambda x: x.get("index", 0))
+            if len(data) != end - start:
+                raise ValueError(
+                    f"Expected {end - start} embeddings from {self.endpoint_url}, "
+                    f"got {len(data)}"
+                )
+            for idx, (item, emb) in enumerate(zip(inputs[start:end], data)):
+                # the usage is reported per request, count it on its first text
+                usage = response.get("usage", {}) if idx == 0 else {}
+                outputs.append(
+                    DocumentWithEmbedding(
+                        text=item,
+                        embedding=emb["embedding"],
+                        total_tokens=usage.get("total_tokens", 0),
+                        prompt_tokens=usage.get("prompt_tokens", 0),
+                    )
                 )
-            )
 
         return outputs
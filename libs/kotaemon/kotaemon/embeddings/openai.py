@@ -13,6 +13,7 @@ from tenacity import (
 from theflow.utils.modules import import_dotted_string
 
 from kotaemon.base import Param
+from kotaemon.utils.http import get_openai_client
 
 from .base import BaseEmbeddings, Document, DocumentWithEmbedding
 
@@ -169,11 +170,11 @@ class OpenAIEmbeddings(BaseOpenAIEmbeddings):
         if async_version:
             from openai import AsyncOpenAI
 
-            return AsyncOpenAI(**params)
+            return get_openai_client(AsyncOpenAI, **params)
 
         from openai import OpenAI
 
-        return OpenAI(**params)
+        return get_openai_client(OpenAI, **params)
 
     @retry(
         retry=retry_if_not_exception_type(
@@ -232,11 +233,11 @@ class AzureOpenAIEmbeddings(BaseOpenAIEmbeddings):
         if async_version:
             from openai import AsyncAzureOpenAI
 
-            return AsyncAzureOpenAI(**params)
+            return get_openai_client(AsyncAzureOpenAI, **params)
 
         from openai import AzureOpenAI
 
-        return AzureOpenAI(**params)
+        return get_openai_client(AzureOpenAI, **params)
 
     @retry(
         retry=retry_if_not_exception_type(
@@ -1,11 +1,11 @@
-import aiohttp
-import requests
+import asyncio
 
 from kotaemon.base import Document, DocumentWithEmbedding, Param
+from kotaemon.utils.concurrency import map_concurrently
+from kotaemon.utils.http import post_json
 
 from .base import BaseEmbeddings
-
-session = requests.session()
+from .transport import make_batches
 
 
 class TeiEndpointEmbeddings(BaseEmbeddings):
@@ -32,44 +32,31 @@ class TeiEndpointEmbeddings(BaseEmbeddings):
         help="Truncate embeddings to a fixed/default length",
     )
 
-    async def client_(self, inputs: list[str]):
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                url=self.endpoint_url,
-                json={
-                    "inputs": inputs,
-                    "normalize": self.normalize,
-                    "truncate": self.truncate,
-                },
-            ) as resp:
-                embeddings = await resp.json()
-        return embeddings
+    batch_size: int = Param(32, help="Maximum number of texts per request")
+    max_batch_tokens: int = Param(
+        16384, help="Maximum estimated number of tokens per request"
+    )
+    concurrency: int = Param(4, help="Number of requests sent in parallel")
+    max_retries: int = Param(3, help="Number of retries of a failed request")
+    timeout: float = Param(60, help="Timeout of each request, in seconds")
+
+    def client_(self, inputs: list[str]) -> list[list[float]]:
+        return post_json(
+            self.endpoint_url,
+            {
+                "inputs": inputs,
+                "normalize": self.normalize,
+                "truncate": self.truncate,
+            },
+            timeout=self.timeout,
+            max_retries=self.max_retries,
+            pool_size=max(self.concurrency, 1),
+        )
 
     async def ainvoke(
         self, text: str | list[str] | Document | list[Document], *args, **kwargs
     ) -> list[DocumentWithEmbedding]:
-        if not isinstance(text, list):
-            text = [text]
-        text = self.prepare_input(text)
-
-        outputs = []
-        batch_size = 6
-        num_batch = max(len(text) // batch_size, 1)
-        for i in range(num_batch):
-            if i == num_batch - 1:
-                mini_batch = text[batch_size * i :]
-            else:
-                mini_batch = text[batch_size * i : batch_size * (i + 1)]
-            mini_batch = [x.content for x in mini_batch]
-            embeddings = await self.client_(mini_batch)  # type: ignore
-            outputs.extend(
-                [
-                    DocumentWithEmbedding(content=doc, embedding=embedding)
-                    for doc, embedding in zip(mini_batch, embeddings)
-                ]
-            )
-
-        return outputs
+        return await asyncio.to_thread(self.invoke, text, *args, **kwargs)
 
     def invoke(
         self, text: str | list[str] | Document | list[Document], *args, **kwargs
@@ -78,28 +65,27 @@ class TeiEndpointEmbeddings(BaseEmbeddings):
             text = [text]
 
         text = self.prepare_input(text)
+        inputs = [x.content for x in text]
 
+        batches = make_batches(inputs, self.batch_size, self.max_batch_tokens)
         outputs = []
-        batch_size = 6
-        num_batch = max(len(text) // batch_size, 1)
-        for i in range(num_batch):
-            if i == num_batch - 1:
-                mini_batch = text[batch_size * i :]
-            else:
-                mini_batch = text[batch_size * i : batch_size * (i + 1)]
-            mini_batch = [x.content for x in mini_batch]
-            embeddings = session.post(
-                url=self.endpoint_url,
-                json={
-                    "inputs": mini_batch,
-                    "normalize": self.normalize,
-                    "truncate": self.truncate,
-                },
-            ).json()
+        for (start, end), embeddings in zip(
+            batches,
+            map_concurrently(
+                lambda batch: self.client_(inputs[batch[0] : batch[1]]),
+                batches,
+                self.concurrency,
+            ),
+        ):
+            if len(embeddings) != end - start:
+                raise ValueError(
+                    f"Expected {end - start} embeddings from {self.endpoint_url}, "
+                    f"got {len(embeddings)}"
+                )
             outputs.extend(
                 [
                     DocumentWithEmbedding(content=doc, embedding=embedding)
-                    for doc, embedding in zip(mini_batch, embeddings)
+                    for doc, embedding in zip(inputs[start:end], embeddings)
                 ]
             )
         return outputs
@@ -0,0 +1,41 @@
+"""Batching of the texts sent to the endpoint-based embedding models
+
+Inputs are grouped into batches capped by size and by an estimated token budget,
+then sent concurrently with a bounded number in flight through the shared
+keep-alive sessions of `kotaemon.utils.http`.
+"""
+from typing import Optional
+
+# rough number of characters per token, the actual tokenizer of the remote model
+# is unknown
+CHARS_PER_TOKEN = 4
+
+
+def make_batches(
+    texts: list[str], batch_size: int, max_batch_tokens: Optional[int] = None
+) -> list[tuple[int, int]]:
+    """Split texts into consecutive batches
+
+    Args:
+        texts: the texts to split
+        batch_size: maximum number of texts per batch
+        max_batch_tokens: maximum estimated number of tokens per batch, a text
+            exceeding it on its own makes a batch of one
+
+    Returns:
+        the (start, end) indices of each batch
+    """
+    batches = []
+    start, tokens = 0, 0
+    for idx, text in enumerate(texts):
+        n_tokens = len(text) // CHARS_PER_TOKEN + 1
+        full = idx - start >= batch_size or (
+            max_batch_tokens is not None and tokens + n_tokens > max_batch_tokens
+        )
+        if idx > start and full:
+            batches.append((start, idx))
+            start, tokens = idx, 0
+        tokens += n_tokens
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    return batches
@@ -37,6 +37,9 @@ docling_reader = DoclingReader()
 adobe_reader.vlm_endpoint = (
     azure_reader.vlm_endpoint
 ) = docling_reader.vlm_endpoint = getattr(flowsettings, "KH_VLM_ENDPOINT", "")
+azure_reader.max_concurrent_captions = docling_reader.max_concurrent_captions = getattr(
+    flowsettings, "KH_VLM_MAX_CONCURRENCY", 4
+)
 
 
 KH_DEFAULT_FILE_EXTRACTORS: dict[str, BaseReader] = {
@@ -52,7 +55,11 @@ KH_DEFAULT_FILE_EXTRACTORS: dict[str, BaseReader] = {
     ".jpg": unstructured,
     ".tiff": unstructured,
     ".tif": unstructured,
-    ".pdf": PDFThumbnailReader(),
+    ".pdf": PDFThumbnailReader(
+        thumbnail_dir=getattr(flowsettings, "KH_THUMBNAIL_DIR", None),
+        thumbnail_max_size=getattr(flowsettings, "KH_THUMBNAIL_SIZE_MB", 1024)
+        * 1024**2,
+    ),
     ".txt": TxtReader(),
     ".md": TxtReader(),
 }
@@ -298,12 +298,13 @@ class AnswerWithContextPipeline(BaseComponent):
             return spans
 
         evidences = answer.metadata["citation"].evidences
-        for quote in evidences:
-            matched_excerpts = []
-            for doc in docs:
-                matches = find_text(quote, doc.text)
-
-                for start, end in matches:
+        # match the docs one at a time so each doc is indexed only once
+        doc_matches = [
+            [find_text(quote, doc.text) for quote in evidences] for doc in docs
+        ]
+        for quote_idx in range(len(evidences)):
+            for doc, matches in zip(docs, doc_matches):
+                for start, end in matches[quote_idx]:
                     if "|" not in doc.text[start:end]:
                         spans[doc.doc_id].append(
                             {
@@ -311,9 +312,7 @@ class AnswerWithContextPipeline(BaseComponent):
                                 "end": end,
                             }
                         )
-                        matched_excerpts.append(doc.text[start:end])
 
-            # print("Matched citation:", quote, matched_excerpts),
         return spans
 
     def prepare_citations(self, answer, docs) -> tuple[list[Document], list[Document]]:
@@ -237,23 +237,27 @@ class AnswerWithInlineCitation(AnswerWithContextPipeline):
 
         evidences = answer.metadata["citation"].evidences
 
-        for start_idx in range(0, len(evidences), 2):
-            start_phrase, end_phrase = evidences[start_idx : start_idx + 2]
-            best_match = None
-            best_match_length = 0
-            best_match_doc_idx = None
-
-            for doc in docs:
+        # best (match, match_length, doc_id) of each pair of phrases, iterating over
+        # the docs first so each doc is indexed only once
+        best_matches: dict[int, tuple] = {}
+        for doc in docs:
+            for start_idx in range(0, len(evidences), 2):
+                start_phrase, end_phrase = evidences[start_idx : start_idx + 2]
                 match, match_length = find_start_end_phrase(
                     start_phrase, end_phrase, doc.text
                 )
+                best_match, best_match_length, _ = best_matches.get(
+                    start_idx, (None, 0, None)
+                )
                 if best_match is None or (
                     match is not None and match_length > best_match_length
                 ):
-                    best_match = match
-                    best_match_length = match_length
-                    best_match_doc_idx = doc.doc_id
+                    best_matches[start_idx] = (match, match_length, doc.doc_id)
 
+        for start_idx in range(0, len(evidences), 2):
+            best_match, _, best_match_doc_idx = best_matches.get(
+                start_idx, (None, 0, None)
+            )
             if best_match is not None and best_match_doc_idx is not None:
                 spans[best_match_doc_idx].append(
                     {
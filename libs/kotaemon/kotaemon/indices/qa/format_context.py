@@ -1,10 +1,13 @@
 import html
-from functools import partial
+import re
+import sys
+from functools import lru_cache
 
 import tiktoken
 
 from kotaemon.base import BaseComponent, Document, RetrievedDocument
 from kotaemon.indices.splitters import TokenSplitter
+from kotaemon.loaders.pdf_loader import load_image_origin
 
 EVIDENCE_MODE_TEXT = 0
 EVIDENCE_MODE_TABLE = 1
@@ -12,6 +15,63 @@ EVIDENCE_MODE_CHATBOT = 2
 EVIDENCE_MODE_FIGURE = 3
 
 
+@lru_cache(maxsize=None)
+def _get_encoding(model_name: str) -> tiktoken.Encoding:
+    return tiktoken.encoding_for_model(model_name)
+
+
+class _EvidenceBuilder:
+    """Assemble the evidence segments within a token budget
+
+    Tokens are counted per segment as they are added, duplicated contents are
+    skipped by hash, and the segment crossing the budget is cut to fit at the last
+    whole word, so the whole evidence never needs to be tokenized at once.
+    """
+
+    def __init__(self, encoding: tiktoken.Encoding, max_tokens: int):
+        self.encoding = encoding
+        self.max_tokens = max_tokens
+        self.num_tokens = 0
+        self.truncated = False
+        self._parts: list[str] = []
+        self._seen: set[int] = set()
+
+    def is_seen(self, content: str) -> bool:
+        return hash(content) in self._seen
+
+    def add(self, segment: str, content: str | None = None):
+        if content is not None:
+            self._seen.add(hash(content))
+        if self.truncated:
+            return
+
+        tokens = self.encoding.encode_ordinary(segment)
+        remaining = self.max_tokens - self.num_tokens
+        if len(tokens) > remaining:
+            segment = self._cut(tokens, remaining)
+            tokens = self.encoding.encode_ordinary(segment)
+            self.truncated = True
+        self._parts.append(segment)
+        self.num_tokens += len(tokens)
+
+    def _cut(self, tokens: list[int], num_tokens: int) -> str:
+        """Decode the first tokens, without a partial character or word at the end"""
+        # a multi-byte character split across the tokens is dropped
+        text = self.encoding.decode_bytes(tokens[:num_tokens]).decode(
+            "utf-8", errors="ignore"
+        )
+        next_bytes = self.encoding.decode_bytes(tokens[num_tokens : num_tokens + 1])
+        if text and not text[-1].isspace() and not next_bytes[:1].isspace():
+            # cut within a word, back off to the last whitespace if there is one
+            match = re.search(r"\s\S*$", text)
+            if match:
+                text = text[: match.start()]
+        return text
+
+    def build(self) -> str:
+        return "".join(self._parts)
+
+
 class PrepareEvidencePipeline(BaseComponent):
     """Prepare the evidence text from the list of retrieved documents
 
@@ -19,31 +79,24 @@ class PrepareEvidencePipeline(BaseComponent):
 
     Args:
         trim_func: a callback function or a BaseComponent, that splits a large
-            chunk of text into smaller ones. The first one will be retained.
+            chunk of text into smaller ones. The first one will be retained. If
+            not set, the evidence is cut at `max_context_length` tokens.
+        tokenizer_model: the tiktoken model used to count the evidence tokens
     """
 
     max_context_length: int = 32000
     trim_func: TokenSplitter | None = None
+    tokenizer_model: str = "gpt-3.5-turbo"
 
     def run(self, docs: list[RetrievedDocument]) -> Document:
-        evidence = ""
         images = []
         table_found = 0
         evidence_modes = []
 
-        evidence_trim_func = (
-            self.trim_func
-            if self.trim_func
-            else TokenSplitter(
-                chunk_size=self.max_context_length,
-                chunk_overlap=0,
-                separator=" ",
-                tokenizer=partial(
-                    tiktoken.encoding_for_model("gpt-3.5-turbo").encode,
-                    allowed_special=set(),
-                    disallowed_special="all",
-                ),
-            )
+        builder = _EvidenceBuilder(
+            _get_encoding(self.tokenizer_model),
+            # trim_func does the trimming itself
+            self.max_context_length if not self.trim_func else sys.maxsize,
         )
 
         for _, retrieved_item in enumerate(docs):
@@ -58,17 +111,18 @@ class PrepareEvidencePipeline(BaseComponent):
                     retrieved_content = retrieved_item.metadata.get(
                         "table_origin", retrieved_item.text
                     )
-                    if retrieved_content not in evidence:
+                    if not builder.is_seen(retrieved_content):
                         table_found += 1
-                        evidence += (
+                        builder.add(
                             f"<br><b>Table from {source}</b>\n"
                             + retrieved_content
-                            + "\n<br>"
+                            + "\n<br>",
+                            retrieved_content,
                         )
             elif retrieved_item.metadata.get("type", "") == "chatbot":
                 evidence_modes.append(EVIDENCE_MODE_CHATBOT)
                 retrieved_content = retrieved_item.metadata["window"]
-                evidence += (
+                builder.add(
                     f"<br><b>Chatbot scenario from {filename} (Row {page})</b>\n"
                     + retrieved_content
                     + "\n<br>"
@@ -77,24 +131,25 @@ class PrepareEvidencePipeline(BaseComponent):
                 evidence_modes.append(EVIDENCE_MODE_FIGURE)
                 retrieved_content = retrieved_item.metadata.get("image_origin", "")
                 retrieved_caption = html.escape(retrieved_item.get_content())
-                evidence += (
+                builder.add(
                     f"<br><b>Figure from {source}</b>\n"
                     + "<img width='85%' src='<src>' "
                     + f"alt='{retrieved_caption}'/>"
                     + "\n<br>"
                 )
-                images.append(retrieved_content)
+                images.append(load_image_origin(retrieved_content))
             else:
                 if "window" in retrieved_item.metadata:
                     retrieved_content = retrieved_item.metadata["window"]
                 else:
                     retrieved_content = retrieved_item.text
                 retrieved_content = retrieved_content.replace("\n", " ")
-                if retrieved_content not in evidence:
-                    evidence += (
+                if not builder.is_seen(retrieved_content):
+                    builder.add(
                         f"<br><b>Content from {source}: </b> "
                         + retrieved_content
-                        + " \n<br>"
+                        + " \n<br>",
+                        retrieved_content,
                     )
 
         # resolve evidence mode
@@ -104,11 +159,17 @@ class PrepareEvidencePipeline(BaseComponent):
         elif EVIDENCE_MODE_TABLE in evidence_modes:
             evidence_mode = EVIDENCE_MODE_TABLE
 
-        # trim context by trim_len
-        print("len (original)", len(evidence))
-        if evidence:
-            texts = evidence_trim_func([Document(text=evidence)])
+        evidence = builder.build()
+        print("len (tokens)", builder.num_tokens, "truncated", builder.truncated)
+        if evidence and self.trim_func:
+            texts = self.trim_func([Document(text=evidence)])
             evidence = texts[0].text
             print("len (trimmed)", len(evidence))
 
-        return Document(content=(evidence_mode, evidence, images))
+        return Document(
+            content=(evidence_mode, evidence, images),
+            metadata={
+                "num_tokens": builder.num_tokens,
+                "truncated": builder.truncated,
+            },
+        )
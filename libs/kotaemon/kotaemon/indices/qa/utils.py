@@ -1,19 +1,118 @@
-from difflib import SequenceMatcher
+from functools import lru_cache
+
+
+class EvidenceIndex:
+    """Suffix automaton over a context to find the longest common substrings
+
+    The automaton is built once in linear time, then the longest substring shared
+    by any phrase and the context is found in time linear to the phrase length,
+    instead of the quadratic `difflib.SequenceMatcher` scan of the whole context.
+    On ties it returns the same block as `SequenceMatcher.find_longest_match`
+    with `autojunk=False`: the one starting earliest in the phrase, then
+    earliest in the context.
+
+    Args:
+        context: the text to search in, newlines are replaced with spaces
+    """
+
+    def __init__(self, context: str):
+        self.context = context.replace("\n", " ")
+
+        # state 0 is the initial state
+        self._next: list[dict[str, int]] = [{}]
+        self._link = [-1]
+        self._len = [0]
+        # end position of the first occurrence of the strings of each state
+        self._first_end = [-1]
+
+        last = 0
+        for pos, char in enumerate(self.context):
+            last = self._extend(last, char, pos)
+
+    def _extend(self, last: int, char: str, pos: int) -> int:
+        nxt, link, length, first_end = (
+            self._next,
+            self._link,
+            self._len,
+            self._first_end,
+        )
+
+        cur = len(length)
+        nxt.append({})
+        length.append(length[last] + 1)
+        link.append(0)
+        first_end.append(pos)
+
+        p = last
+        while p != -1 and char not in nxt[p]:
+            nxt[p][char] = cur
+            p = link[p]
+        if p == -1:
+            return cur
+
+        q = nxt[p][char]
+        if length[p] + 1 == length[q]:
+            link[cur] = q
+            return cur
+
+        clone = len(length)
+        nxt.append(dict(nxt[q]))
+        length.append(length[p] + 1)
+        link.append(link[q])
+        first_end.append(first_end[q])
+        while p != -1 and nxt[p].get(char) == q:
+            nxt[p][char] = clone
+            p = link[p]
+        link[q] = clone
+        link[cur] = clone
+        return cur
+
+    def longest_match(self, phrase: str) -> tuple[int, int]:
+        """Find the longest substring of phrase occurring in the context
+
+        Returns:
+            the start position in the context and the size of the match
+        """
+        nxt, link, length, first_end = (
+            self._next,
+            self._link,
+            self._len,
+            self._first_end,
+        )
+
+        state, matched = 0, 0
+        best_size, best_start = 0, 0
+        for char in phrase:
+            while state and char not in nxt[state]:
+                state = link[state]
+                matched = length[state]
+            if char in nxt[state]:
+                state = nxt[state][char]
+                matched += 1
+            if matched > best_size:
+                best_size = matched
+                best_start = first_end[state] - matched + 1
+
+        return best_start, best_size
+
+
+@lru_cache(maxsize=16)
+def get_evidence_index(context: str) -> EvidenceIndex:
+    """Get the evidence index of a context, reused across the quotes of an answer"""
+    return EvidenceIndex(context)
 
 
 def find_text(search_span, context, min_length=5):
     sentence_list = search_span.split("\n")
-    context = context.replace("\n", " ")
 
     matches = []
     # don't search for small text
     if len(search_span) > min_length:
+        index = get_evidence_index(context)
         for sentence in sentence_list:
-            match = SequenceMatcher(
-                None, sentence, context, autojunk=False
-            ).find_longest_match()
-            if match.size > max(len(sentence) * 0.35, min_length):
-                matches.append((match.b, match.b + match.size))
+            start, size = index.longest_match(sentence)
+            if size > max(len(sentence) * 0.35, min_length):
+                matches.append((start, start + size))
 
     return matches
 
@@ -21,17 +120,15 @@ def find_text(search_span, context, min_length=5):
 def find_start_end_phrase(
     start_phrase, end_phrase, context, min_length=5, max_excerpt_length=300
 ):
-    context = context.replace("\n", " ")
+    index = get_evidence_index(context)
 
     matches = []
     matched_length = 0
     for sentence in [start_phrase, end_phrase]:
-        match = SequenceMatcher(
-            None, sentence, context, autojunk=False
-        ).find_longest_match()
-        if match.size > max(len(sentence) * 0.35, min_length):
-            matches.append((match.b, match.b + match.size))
-            matched_length += match.size
+        start, size = index.longest_match(sentence)
+        if size > max(len(sentence) * 0.35, min_length):
+            matches.append((start, start + size))
+            matched_length += size
 
     # check if second match is before the first match
     if len(matches) == 2 and matches[1][0] < matches[0][0]:
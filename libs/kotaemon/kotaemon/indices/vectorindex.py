@@ -2,16 +2,24 @@ from __future__ import annotations
 
 import threading
 import uuid
+from collections import defaultdict
 from pathlib import Path
 from typing import Optional, Sequence, cast
 
 from theflow.settings import settings as flowsettings
 
-from kotaemon.base import BaseComponent, Document, RetrievedDocument
-from kotaemon.embeddings import BaseEmbeddings
+from kotaemon.base import (
+    BaseComponent,
+    Document,
+    DocumentWithEmbedding,
+    RetrievedDocument,
+)
+from kotaemon.embeddings import BaseEmbeddings, EmbeddingCache
+from kotaemon.embeddings.cache import get_embedding_cache
 from kotaemon.storages import BaseDocumentStore, BaseVectorStore
 
 from .base import BaseIndexing, BaseRetrieval
+from .cache import query_embedding_cache
 from .rankings import BaseReranking, LLMReranking
 
 VECTOR_STORE_FNAME = "vectorstore"
@@ -28,6 +36,10 @@ class VectorIndexing(BaseIndexing):
     """
 
     cache_dir: Optional[str] = getattr(flowsettings, "KH_CHUNKS_OUTPUT_DIR", None)
+    # persistent embedding cache, only the cache misses are sent to the embedding
+    embedding_cache_path: Optional[str] = getattr(
+        flowsettings, "KH_EMBEDDING_CACHE_PATH", None
+    )
     vector_store: BaseVectorStore
     doc_store: Optional[BaseDocumentStore] = None
     embedding: BaseEmbeddings
@@ -81,11 +93,47 @@ class VectorIndexing(BaseIndexing):
             print("Adding documents to doc store")
             self.doc_store.add(docs)
 
+    def embed(self, docs: list[Document]) -> list[DocumentWithEmbedding]:
+        """Embed the documents, reusing the cached embeddings when possible"""
+        if not self.embedding_cache_path:
+            return self.embedding(docs)
+
+        cache = get_embedding_cache(str(self.embedding_cache_path))
+        model_id = self.get_from_path("embedding").get_model_id()
+        # documents without text (e.g. images) are always embedded
+        keys = [
+            EmbeddingCache.make_key(model_id, doc.text) if doc.text else str(i)
+            for i, doc in enumerate(docs)
+        ]
+        vectors = cache.get([key for key, doc in zip(keys, docs) if doc.text])
+
+        # embed each distinct missing text once
+        missing: dict[str, Document] = {}
+        for key, doc in zip(keys, docs):
+            if key not in vectors and key not in missing:
+                missing[key] = doc
+        print(f"Found {len(docs) - len(missing)} cached embeddings")
+
+        if missing:
+            new_embeddings = self.embedding(list(missing.values()))
+            new_vectors = {
+                key: emb.embedding for key, emb in zip(missing, new_embeddings)
+            }
+            cache.set(
+                {key: new_vectors[key] for key, doc in missing.items() if doc.text}
+            )
+            vectors.update(new_vectors)
+
+        return [
+            DocumentWithEmbedding(embedding=vectors[key], content=doc)
+            for key, doc in zip(keys, docs)
+        ]
+
     def add_to_vectorstore(self, docs: list[Document]):
         # in case we want to skip embedding
         if self.vector_store:
             print(f"Getting embeddings for {len(docs)} nodes")
-            embeddings = self.embedding(docs)
+            embeddings = self.embed(docs)
             print("Adding embeddings to vector store")
             self.vector_store.add(
                 embeddings=embeddings,
@@ -122,7 +170,75 @@ class VectorRetrieval(BaseRetrieval):
     rerankers: Sequence[BaseReranking] = []
     top_k: int = 5
     first_round_top_k_mult: int = 10
-    retrieval_mode: str = "hybrid"  # vector, text, hybrid
+    retrieval_mode: str = "hybrid"  # vector, text, hybrid, fusion
+    # how to merge vector and text results in fusion mode: rrf, weighted
+    fusion_method: str = "rrf"
+    # relative weights of the vector and the text results in fusion mode
+    fusion_weights: tuple[float, float] = (1.0, 1.0)
+    rrf_k: int = 60
+    # reuse the embedding of recently asked queries
+    cache_query_embedding: bool = True
+
+    def _embed_query(self, text: str | Document) -> list[float]:
+        """Embed the query, looking up the process-wide query embedding cache"""
+        if not self.cache_query_embedding:
+            return self.embedding(text)[0].embedding
+
+        query = text.text if isinstance(text, Document) else text
+        model_id = self.get_from_path("embedding").get_model_id()
+        key = (model_id, " ".join(query.split()))
+        emb = query_embedding_cache.get(key)
+        if emb is None:
+            emb = self.embedding(text)[0].embedding
+            query_embedding_cache.set(key, emb)
+        return emb
+
+    def _fuse(
+        self,
+        vs_docs: list[Document],
+        vs_scores: list[float],
+        ds_docs: list[Document],
+    ) -> list[RetrievedDocument]:
+        """Merge the vector and full-text results into a single deduplicated list
+
+        With `rrf`, each document scores sum(weight / (rrf_k + rank)) over the result
+        lists it appears in. With `weighted`, the vector similarities are min-max
+        normalized, the full-text results (which come without a score) are scored
+        by their rank, and the weighted scores are summed.
+
+        Returns:
+            the documents sorted by their fused score, in descending order
+        """
+        vector_weight, text_weight = self.fusion_weights
+        n_vs, n_ds = len(vs_docs), len(ds_docs)
+
+        if self.fusion_method == "rrf":
+            vs_fused = [vector_weight / (self.rrf_k + rank + 1) for rank in range(n_vs)]
+            ds_fused = [text_weight / (self.rrf_k + rank + 1) for rank in range(n_ds)]
+        elif self.fusion_method == "weighted":
+            low, high = min(vs_scores, default=0.0), max(vs_scores, default=0.0)
+            vs_fused = [
+                vector_weight * ((score - low) / (high - low) if high > low else 1.0)
+                for score in vs_scores
+            ]
+            ds_fused = [text_weight * (1.0 - rank / n_ds) for rank in range(n_ds)]
+        else:
+            raise ValueError(f"Unknown fusion method {self.fusion_method}")
+
+        scores: dict[str, float] = defaultdict(float)
+        docs: dict[str, Document] = {}
+        for doc, score in zip(vs_docs + ds_docs, vs_fused + ds_fused):
+            scores[doc.doc_id] += score
+            docs.setdefault(doc.doc_id, doc)
+
+        return [
+            RetrievedDocument(
+                **docs[doc_id].to_dict(),
+                score=scores[doc_id],
+                retrieval_metadata={"fusion_method": self.fusion_method},
+            )
+            for doc_id in sorted(scores, key=scores.__getitem__, reverse=True)
+        ]
 
     def _filter_docs(
         self, documents: list[RetrievedDocument], top_k: int | None = None
@@ -163,10 +279,11 @@ class VectorRetrieval(BaseRetrieval):
         result: list[RetrievedDocument] = []
         # TODO: should declare scope directly in the run params
         scope = kwargs.pop("scope", None)
+        file_scope = kwargs.pop("file_scope", None)
         emb: list[float]
 
         if self.retrieval_mode == "vector":
-            emb = self.embedding(text)[0].embedding
+            emb = self._embed_query(text)
             _, scores, ids = self.vector_store.query(
                 embedding=emb, top_k=top_k_first_round, **kwargs
             )
@@ -177,29 +294,31 @@ class VectorRetrieval(BaseRetrieval):
             ]
         elif self.retrieval_mode == "text":
             query = text.text if isinstance(text, Document) else text
-            docs = self.doc_store.query(query, top_k=top_k_first_round, doc_ids=scope)
+            docs = self.doc_store.query(
+                query, top_k=top_k_first_round, doc_ids=scope, file_ids=file_scope
+            )
             result = [RetrievedDocument(**doc.to_dict(), score=-1.0) for doc in docs]
-        elif self.retrieval_mode == "hybrid":
+        elif self.retrieval_mode in ("hybrid", "fusion"):
             # similarity search section
-            emb = self.embedding(text)[0].embedding
-            vs_docs: list[RetrievedDocument] = []
-            vs_ids: list[str] = []
+            emb = self._embed_query(text)
+            vs_docs: list[Document] = []
             vs_scores: list[float] = []
 
             def query_vectorstore():
-                nonlocal vs_docs
-                nonlocal vs_scores
-                nonlocal vs_ids
-
                 assert self.doc_store is not None
-                _, vs_scores, vs_ids = self.vector_store.query(
+                _, scores, ids = self.vector_store.query(
                     embedding=emb, top_k=top_k_first_round, **kwargs
                 )
-                if vs_ids:
-                    vs_docs = self.doc_store.get(vs_ids)
+                if ids:
+                    # the docstore doesn't necessarily keep the order of the ids
+                    docs_by_id = {doc.doc_id: doc for doc in self.doc_store.get(ids)}
+                    for id_, score in zip(ids, scores):
+                        if id_ in docs_by_id:
+                            vs_docs.append(docs_by_id[id_])
+                            vs_scores.append(score)
 
             # full-text search section
-            ds_docs: list[RetrievedDocument] = []
+            ds_docs: list[Document] = []
 
             def query_docstore():
                 nonlocal ds_docs
@@ -207,7 +326,10 @@ class VectorRetrieval(BaseRetrieval):
                 assert self.doc_store is not None
                 query = text.text if isinstance(text, Document) else text
                 ds_docs = self.doc_store.query(
-                    query, top_k=top_k_first_round, doc_ids=scope
+                    query,
+                    top_k=top_k_first_round,
+                    doc_ids=scope,
+                    file_ids=file_scope,
                 )
 
             vs_query_thread = threading.Thread(target=query_vectorstore)
@@ -219,18 +341,23 @@ class VectorRetrieval(BaseRetrieval):
             vs_query_thread.join()
             ds_query_thread.join()
 
-            result = [
-                RetrievedDocument(**doc.to_dict(), score=-1.0)
-                for doc in ds_docs
-                if doc not in vs_ids
-            ]
-            result += [
-                RetrievedDocument(**doc.to_dict(), score=score)
-                for doc, score in zip(vs_docs, vs_scores)
-            ]
             print(f"Got {len(vs_docs)} from vectorstore")
             print(f"Got {len(ds_docs)} from docstore")
 
+            if self.retrieval_mode == "fusion":
+                result = self._fuse(vs_docs, vs_scores, ds_docs)
+            else:
+                vs_ids = {doc.doc_id for doc in vs_docs}
+                result = [
+                    RetrievedDocument(**doc.to_dict(), score=-1.0)
+                    for doc in ds_docs
+                    if doc.doc_id not in vs_ids
+                ]
+                result += [
+                    RetrievedDocument(**doc.to_dict(), score=score)
+                    for doc, score in zip(vs_docs, vs_scores)
+                ]
+
         # use additional reranker to re-order the document list
         if self.rerankers and text:
             for reranker in self.rerankers:
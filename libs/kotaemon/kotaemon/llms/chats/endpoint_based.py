@@ -1,5 +1,3 @@
-import requests
-
 from kotaemon.base import (
     AIMessage,
     BaseMessage,
@@ -8,6 +6,7 @@ from kotaemon.base import (
     Param,
     SystemMessage,
 )
+from kotaemon.utils.http import get_session
 
 from .base import ChatLLM
 
@@ -56,7 +55,11 @@ class EndpointChatLLM(ChatLLM):
             "messages": [{"content": m.text, "role": decide_role(m)} for m in input_]
         }
 
-        response = requests.post(self.endpoint_url, json=request_json).json()
+        response = (
+            get_session(self.endpoint_url)
+            .post(self.endpoint_url, json=request_json)
+            .json()
+        )
 
         content = ""
         candidates = []
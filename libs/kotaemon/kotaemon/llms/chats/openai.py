@@ -3,6 +3,7 @@ from typing import TYPE_CHECKING, AsyncGenerator, Iterator, Optional
 from theflow.utils.modules import import_dotted_string
 
 from kotaemon.base import AIMessage, BaseMessage, HumanMessage, LLMInterface, Param
+from kotaemon.utils.http import get_openai_client
 
 from .base import ChatLLM
 
@@ -284,11 +285,11 @@ class ChatOpenAI(BaseChatOpenAI):
         if async_version:
             from openai import AsyncOpenAI
 
-            return AsyncOpenAI(**params)
+            return get_openai_client(AsyncOpenAI, **params)
 
         from openai import OpenAI
 
-        return OpenAI(**params)
+        return get_openai_client(OpenAI, **params)
 
     def openai_response(self, client, **kwargs):
         """Get the openai response"""
@@ -355,11 +356,11 @@ class AzureChatOpenAI(BaseChatOpenAI):
         if async_version:
             from openai import AsyncAzureOpenAI
 
-            return AsyncAzureOpenAI(**params)
+            return get_openai_client(AsyncAzureOpenAI, **params)
 
         from openai import AzureOpenAI
 
-        return AzureOpenAI(**params)
+        return get_openai_client(AzureOpenAI, **params)
 
     def openai_response(self, client, **kwargs):
         """Get the openai response"""
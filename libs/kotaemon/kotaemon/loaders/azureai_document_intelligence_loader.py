@@ -1,6 +1,4 @@
-import base64
 import os
-from io import BytesIO
 from pathlib import Path
 from typing import Optional
 
@@ -9,7 +7,7 @@ from PIL import Image
 from kotaemon.base import Document, Param
 
 from .base import BaseReader
-from .utils.adobe import generate_single_figure_caption
+from .utils.figures import caption_figures, crop_figures, image_to_base64
 
 
 def crop_image(file_path: Path, bbox: list[float], page_number: int = 0) -> Image.Image:
@@ -23,37 +21,7 @@ def crop_image(file_path: Path, bbox: list[float], page_number: int = 0) -> Imag
     Returns:
         Image.Image: cropped image
     """
-    left, upper, right, lower = bbox
-
-    left, right = min(left, right), max(left, right)
-    upper, lower = min(upper, lower), max(upper, lower)
-
-    img: Image.Image
-    suffix = file_path.suffix.lower()
-    if suffix == ".pdf":
-        try:
-            import fitz
-        except ImportError:
-            raise ImportError("Please install PyMuPDF: 'pip install PyMuPDF'")
-
-        doc = fitz.open(file_path)
-        page = doc.load_page(page_number)
-        pm = page.get_pixmap(dpi=150)
-        img = Image.frombytes("RGB", [pm.width, pm.height], pm.samples)
-    elif suffix in [".tif", ".tiff"]:
-        img = Image.open(file_path)
-        img.seek(page_number)
-    else:
-        img = Image.open(file_path)
-
-    return img.crop(
-        (
-            int(left * img.width),
-            int(upper * img.height),
-            int(right * img.width),
-            int(lower * img.height),
-        )
-    )
+    return crop_figures(file_path, [(page_number, bbox)])[0]
 
 
 class AzureAIDocumentIntelligenceLoader(BaseReader):
@@ -106,6 +74,9 @@ class AzureAIDocumentIntelligenceLoader(BaseReader):
         None,
         help="Directory to cache the downloaded files. Default is None",
     )
+    max_concurrent_captions: int = Param(
+        4, help="Maximum number of figures captioned by the VLM at the same time"
+    )
 
     @Param.auto(depends_on=["endpoint", "credential"])
     def client_(self):
@@ -144,14 +115,14 @@ class AzureAIDocumentIntelligenceLoader(BaseReader):
         removed_spans: list[dict] = []
 
         # extract the figures
-        figures = []
+        figure_descs = []
+        figure_regions = []
         for figure_desc in result.get("figures", []):
             if not self.vlm_endpoint:
                 continue
             if file_path.suffix.lower() not in self.figure_friendly_filetypes:
                 continue
 
-            # read & crop the image
             page_number = figure_desc["boundingRegions"][0]["pageNumber"]
             page_width = result.pages[page_number - 1]["width"]
             page_height = result.pages[page_number - 1]["height"]
@@ -164,24 +135,28 @@ class AzureAIDocumentIntelligenceLoader(BaseReader):
                 max(xs) / page_width,
                 max(ys) / page_height,
             ]
-            img = crop_image(file_path, bbox, page_number - 1)
+            figure_descs.append(figure_desc)
+            figure_regions.append((page_number - 1, bbox))
 
-            # convert the image into base64
-            img_bytes = BytesIO()
-            img.save(img_bytes, format="PNG")
-            img_base64 = base64.b64encode(img_bytes.getvalue()).decode("utf-8")
-            img_base64 = f"data:image/png;base64,{img_base64}"
+        # read & crop the images, each page is rendered once
+        images = [
+            image_to_base64(img) for img in crop_figures(file_path, figure_regions)
+        ]
 
-            # caption the image
-            caption = generate_single_figure_caption(
-                figure=img_base64, vlm_endpoint=self.vlm_endpoint
-            )
+        # caption the images
+        captions = caption_figures(
+            self.vlm_endpoint, images, max_workers=self.max_concurrent_captions
+        )
 
+        figures = []
+        for figure_desc, (page_index, _), img_base64, caption in zip(
+            figure_descs, figure_regions, images, captions
+        ):
             # store the image into document
             figure_metadata = {
                 "image_origin": img_base64,
                 "type": "image",
-                "page_label": page_number,
+                "page_label": page_index + 1,
             }
             figure_metadata.update(metadata)
 
@@ -0,0 +1,149 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Optional
+
+from kotaemon.base import Document
+
+PARSE_CACHE_VERSION = 1
+
+
+class ParseCache:
+    """Persistent store of the documents parsed from files, keyed by content
+
+    Each entry is keyed by sha256(file hash + reader class + reader params), so a
+    file with the same content read by the same reader is never parsed twice.
+    The documents are stored as one gzipped JSON file per entry. Once the total
+    size exceeds `max_size`, the least recently used entries are evicted.
+
+    Args:
+        path: the directory to store the entries
+        max_size: maximum total size of the entries in bytes, 0 for no limit
+    """
+
+    def __init__(self, path: str | Path, max_size: int = 1024**3):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def reader_params(reader) -> Any:
+        """Get the params of a reader that the parsed documents depend on"""
+        if hasattr(reader, "__persist_flow__"):
+            return reader.__persist_flow__()
+        return {
+            key: value
+            for key, value in getattr(reader, "__dict__", {}).items()
+            if not key.startswith("_")
+        }
+
+    @classmethod
+    def make_key(cls, file_hash: str, reader) -> str:
+        """Get the cache key of a file, by its sha256, parsed by a reader"""
+        reader_cls = type(reader)
+        dumped = json.dumps(
+            [
+                PARSE_CACHE_VERSION,
+                file_hash,
+                f"{reader_cls.__module__}.{reader_cls.__qualname__}",
+                cls.reader_params(reader),
+            ],
+            sort_keys=True,
+            default=repr,
+        )
+        return hashlib.sha256(dumped.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.path / f"{key}.json.gz"
+
+    def get(self, key: str, extra_info: Optional[dict] = None) -> list[Document] | None:
+        """Get the cached documents of the key, None if missing
+
+        Args:
+            key: the cache key
+            extra_info: the metadata of the current file, overriding the cached
+                one (e.g. the file id and name)
+        """
+        entry_path = self._entry_path(key)
+        try:
+            with gzip.open(entry_path, "rt", encoding="utf-8") as fi:
+                records = json.load(fi)
+            # mark as recently used
+            os.utime(entry_path)
+        except (OSError, ValueError):
+            return None
+
+        # the thumbnails stored as files may have been evicted since, parse again
+        for record in records:
+            image_origin = record["metadata"].get("image_origin")
+            if (
+                record["metadata"].get("type") == "thumbnail"
+                and isinstance(image_origin, str)
+                and not image_origin.startswith(("data:", "http://", "https://"))
+                and not Path(image_origin).is_file()
+            ):
+                return None
+
+        # new ids, the documents of different files must not share them
+        return [
+            Document(
+                text=record["text"],
+                metadata={**record["metadata"], **(extra_info or {})},
+            )
+            for record in records
+        ]
+
+    def set(self, key: str, docs: list[Document]):
+        """Store the documents parsed from a file
+
+        Nothing is stored when there are no documents, as a failed or partial
+        parse would otherwise be reused for every file with the same content.
+        """
+        if not docs:
+            return
+
+        records = [{"text": doc.text, "metadata": doc.metadata} for doc in docs]
+        entry_path = self._entry_path(key)
+        tmp_path = entry_path.with_name(f"{entry_path.name}.{threading.get_ident()}")
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as fo:
+            json.dump(records, fo, default=str)
+        os.replace(tmp_path, entry_path)
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries exceeding the maximum size"""
+        if not self.max_size:
+            return
+
+        with self._lock:
+            entries = []
+            for entry_path in self.path.glob("*.json.gz"):
+                try:
+                    stat = entry_path.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry_path))
+
+            total_size = sum(size for _, size, _ in entries)
+            for _, size, entry_path in sorted(entries, key=lambda entry: entry[0]):
+                if total_size <= self.max_size:
+                    break
+                entry_path.unlink(missing_ok=True)
+                total_size -= size
+
+    def clear(self):
+        """Remove all the cached documents"""
+        with self._lock:
+            for entry_path in self.path.glob("*.json.gz"):
+                entry_path.unlink(missing_ok=True)
+
+
+@lru_cache(maxsize=None)
+def get_parse_cache(path: str, max_size: int = 1024**3) -> ParseCache:
+    """Get the parse cache stored at path, shared within the process"""
+    return ParseCache(path, max_size)
@@ -1,14 +1,12 @@
-import base64
 from collections import defaultdict
-from io import BytesIO
 from pathlib import Path
 from typing import List, Optional
 
 from kotaemon.base import Document, Param
 
-from .azureai_document_intelligence_loader import crop_image
 from .base import BaseReader
-from .utils.adobe import generate_single_figure_caption, make_markdown_table
+from .utils.adobe import make_markdown_table
+from .utils.figures import caption_figures, crop_figures, image_to_base64
 
 
 class DoclingReader(BaseReader):
@@ -31,6 +29,10 @@ class DoclingReader(BaseReader):
         ),
     )
 
+    max_concurrent_captions: int = Param(
+        4, help="Maximum number of figures captioned by the VLM at the same time"
+    )
+
     figure_friendly_filetypes: list[str] = Param(
         [".pdf", ".jpeg", ".jpg", ".png", ".bmp", ".tiff", ".heif", ".tif"],
         help=(
@@ -69,8 +71,8 @@ class DoclingReader(BaseReader):
         file_name = file_path.name
 
         # extract the figures
-        figures = []
-        gen_caption_count = 0
+        figure_regions = []
+        figure_captions = []
         for figure_obj in result_dict.get("pictures", []):
             if not self.vlm_endpoint:
                 continue
@@ -89,7 +91,7 @@ class DoclingReader(BaseReader):
                     print(e)
                     continue
 
-            # read & crop image
+            # locate the image
             page_number = figure_obj["prov"][0]["page_no"]
 
             try:
@@ -106,27 +108,31 @@ class DoclingReader(BaseReader):
                 ]
                 if bbox_obj["coord_origin"] == "BOTTOMLEFT":
                     bbox = self._convert_bbox_bl_tl(bbox, page_width, page_height)
-
-                img = crop_image(file_path, bbox, page_number - 1)
             except KeyError as e:
                 print(e, list(result_dict["pages"].keys()))
                 continue
 
-            # convert img to base64
-            img_bytes = BytesIO()
-            img.save(img_bytes, format="PNG")
-            img_base64 = base64.b64encode(img_bytes.getvalue()).decode("utf-8")
-            img_base64 = f"data:image/png;base64,{img_base64}"
-
-            # generate the generative caption
-            if gen_caption_count >= self.max_figure_to_caption:
-                gen_caption = ""
-            else:
-                gen_caption_count += 1
-                gen_caption = generate_single_figure_caption(
-                    img_base64, self.vlm_endpoint
-                )
+            figure_regions.append((page_number - 1, bbox))
+            figure_captions.append(extractive_captions)
 
+        # read & crop the images, each page is rendered once
+        images = [
+            image_to_base64(img) for img in crop_figures(file_path, figure_regions)
+        ]
+
+        # generate the generative captions, the figures beyond the limit are
+        # indexed without them
+        gen_captions = caption_figures(
+            self.vlm_endpoint,
+            images[: self.max_figure_to_caption],
+            max_workers=self.max_concurrent_captions,
+        )
+        gen_captions += [""] * (len(images) - len(gen_captions))
+
+        figures = []
+        for (page_index, _), extractive_captions, img_base64, gen_caption in zip(
+            figure_regions, figure_captions, images, gen_captions
+        ):
             # join the extractive and generative captions
             caption = "\n".join(extractive_captions + [gen_caption])
 
@@ -134,7 +140,7 @@ class DoclingReader(BaseReader):
             figure_metadata = {
                 "image_origin": img_base64,
                 "type": "image",
-                "page_label": page_number,
+                "page_label": page_index + 1,
                 "file_name": file_name,
                 "file_path": file_path,
             }
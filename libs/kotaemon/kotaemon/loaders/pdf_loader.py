@@ -1,4 +1,12 @@
 import base64
+import hashlib
+import mimetypes
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
 from io import BytesIO
 from pathlib import Path
 from typing import Dict, List, Optional
@@ -43,6 +51,171 @@ def get_page_thumbnails(
     return output_imgs
 
 
+def _render_pages_to_files(
+    file_path: Path, pages: list[int], output_dir: Path, dpi: int, image_format: str
+) -> list[str]:
+    import fitz
+
+    doc = fitz.open(file_path)
+
+    output_paths = []
+    for page_number in pages:
+        page = doc.load_page(page_number)
+        pm = page.get_pixmap(dpi=dpi)
+        img = Image.frombytes("RGB", [pm.width, pm.height], pm.samples)
+
+        img_bytes = BytesIO()
+        img.save(img_bytes, format=image_format, quality=80)
+        content = img_bytes.getvalue()
+
+        # content-addressed, the same page is stored once across files
+        digest = hashlib.sha256(content).hexdigest()
+        output_path = output_dir / f"{digest}.{image_format.lower()}"
+        if output_path.exists():
+            # mark as recently used, it's evicted last
+            os.utime(output_path)
+        else:
+            tmp_path = output_path.with_suffix(f".{os.getpid()}.tmp")
+            tmp_path.write_bytes(content)
+            os.replace(tmp_path, output_path)
+        output_paths.append(str(output_path))
+
+    return output_paths
+
+
+@lru_cache(maxsize=None)
+def _get_render_pool(max_workers: int) -> ProcessPoolExecutor:
+    """Get the pool of rendering processes, created on first use and shared by
+    all the PDF files, as spawning the processes costs more than rendering a few
+    pages"""
+    return ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+_evict_lock = threading.Lock()
+
+
+def evict_page_thumbnails(output_dir: str | Path, max_size: int):
+    """Remove the least recently used thumbnails exceeding the maximum size
+
+    The thumbnails are content-addressed and can be shared by several files, so
+    they are removed by size rather than when a file is deleted. The documents
+    still referencing a removed thumbnail show no image until they are reindexed.
+
+    Args:
+        output_dir: the directory storing the thumbnails
+        max_size: maximum total size of the thumbnails in bytes, 0 for no limit
+    """
+    if not max_size:
+        return
+
+    with _evict_lock:
+        entries = []
+        for entry_path in Path(output_dir).iterdir():
+            if entry_path.suffix == ".tmp" or not entry_path.is_file():
+                continue
+            try:
+                stat = entry_path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry_path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries, key=lambda entry: entry[0]):
+            if total_size <= max_size:
+                break
+            entry_path.unlink(missing_ok=True)
+            total_size -= size
+
+
+def save_page_thumbnails(
+    file_path: Path,
+    pages: list[int],
+    output_dir: str | Path,
+    dpi: int = 80,
+    image_format: str = "JPEG",
+    max_workers: Optional[int] = None,
+    pages_per_worker: int = 64,
+) -> List[str]:
+    """Render the thumbnails of the pages in the PDF file to image files.
+
+    The pages are split into ranges rendered by a pool of processes shared by all
+    the files, as PyMuPDF doesn't support multi-threading. A file with a single
+    range of pages is rendered in-process. Each thumbnail is written as soon as
+    it's rendered, so the images are never held in memory all at once.
+
+    Args:
+        file_path (Path): path to the PDF file
+        pages (list[int]): list of page numbers to extract
+        output_dir (str | Path): directory to store the thumbnails
+        dpi (int): resolution of the thumbnails
+        image_format (str): format of the thumbnails, e.g. "JPEG" or "WEBP"
+        max_workers (int): number of processes of the rendering pool, default to
+            the number of CPUs
+        pages_per_worker (int): number of pages rendered by a process at a time,
+            files with fewer pages are rendered in-process
+
+    Returns:
+        list[str]: paths to the page thumbnails
+    """
+    assert file_path.suffix.lower() == ".pdf", "This function only supports PDF files."
+    try:
+        import fitz  # noqa: F401
+    except ImportError:
+        raise ImportError("Please install PyMuPDF: 'pip install PyMuPDF'")
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    page_ranges = [
+        pages[i : i + pages_per_worker] for i in range(0, len(pages), pages_per_worker)
+    ]
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers <= 1 or len(page_ranges) <= 1:
+        return _render_pages_to_files(file_path, pages, output_dir, dpi, image_format)
+
+    output_paths: list[str] = []
+    try:
+        for paths in _get_render_pool(max_workers).map(
+            _render_pages_to_files,
+            [file_path] * len(page_ranges),
+            page_ranges,
+            [output_dir] * len(page_ranges),
+            [dpi] * len(page_ranges),
+            [image_format] * len(page_ranges),
+        ):
+            output_paths.extend(paths)
+    except BrokenProcessPool:
+        # a process died, e.g. out of memory, the next files get a new pool
+        _get_render_pool.cache_clear()
+        return _render_pages_to_files(file_path, pages, output_dir, dpi, image_format)
+
+    return output_paths
+
+
+def load_image_origin(image_origin: str) -> str:
+    """Get the image as a data URI or URL, reading it if it's stored as a file
+
+    Args:
+        image_origin: the `image_origin` metadata of a document, either a data
+            URI, an URL or the path to an image file
+
+    Returns:
+        str: the image, usable by the VLMs
+    """
+    if not image_origin or image_origin.startswith(("data:", "http://", "https://")):
+        return image_origin
+
+    path = Path(image_origin)
+    if not path.is_file():
+        return image_origin
+
+    mime_type = mimetypes.guess_type(path.name)[0] or "image/png"
+    img_base64 = base64.b64encode(path.read_bytes()).decode("utf-8")
+    return f"data:{mime_type};base64,{img_base64}"
+
+
 def convert_image_to_base64(img: Image.Image) -> str:
     # convert the image into base64
     img_bytes = BytesIO()
@@ -54,13 +227,28 @@ def convert_image_to_base64(img: Image.Image) -> str:
 
 
 class PDFThumbnailReader(PDFReader):
-    """PDF parser with thumbnail for each page."""
+    """PDF parser with thumbnail for each page.
+
+    Args:
+        thumbnail_dir: directory to store the thumbnails as image files, referenced
+            by path in the `image_origin` metadata. If not set, the thumbnails are
+            embedded as base64 data URIs.
+        thumbnail_max_size: maximum total size of the thumbnails stored in
+            `thumbnail_dir` in bytes, the least recently used are evicted beyond
+            it. 0 for no limit.
+    """
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        thumbnail_dir: Optional[str | Path] = None,
+        thumbnail_max_size: int = 0,
+    ) -> None:
         """
         Initialize PDFReader.
         """
         super().__init__(return_full_document=False)
+        self.thumbnail_dir = thumbnail_dir
+        self.thumbnail_max_size = thumbnail_max_size
 
     def load_data(
         self,
@@ -91,7 +279,13 @@ class PDFThumbnailReader(PDFReader):
         page_numbers = list(range(len(page_numbers_str)))
 
         print("Page numbers:", len(page_numbers))
-        page_thumbnails = get_page_thumbnails(file, page_numbers)
+        if self.thumbnail_dir:
+            page_thumbnails = save_page_thumbnails(
+                file, page_numbers, self.thumbnail_dir
+            )
+            evict_page_thumbnails(self.thumbnail_dir, self.thumbnail_max_size)
+        else:
+            page_thumbnails = get_page_thumbnails(file, page_numbers)
 
         documents.extend(
             [
@@ -6,7 +6,6 @@ import logging
 import os
 import tempfile
 import zipfile
-from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List, Union
 
@@ -235,16 +234,10 @@ def generate_figure_captions(
         results (List[str]): list of all figure captions and empty strings for
         ignored figures.
     """
+    from .figures import caption_figures
+
     to_gen_figures = figures[:max_figures_to_process]
     other_figures = figures[max_figures_to_process:]
 
-    with ThreadPoolExecutor() as executor:
-        futures = [
-            executor.submit(
-                lambda: generate_single_figure_caption(vlm_endpoint, figure)
-            )
-            for figure in to_gen_figures
-        ]
-
-    results = [future.result() for future in futures]
+    results = caption_figures(vlm_endpoint, to_gen_figures)
     return results + [""] * len(other_figures)
@@ -0,0 +1,132 @@
+"""Crop and caption the figures found by the layout-aware loaders
+
+The pages are rendered once however many figures they hold, and the figures are
+captioned concurrently by the VLM. The captions are cached by image hash, so the
+same figure is never captioned twice by the same endpoint.
+"""
+import base64
+import hashlib
+import threading
+from collections import OrderedDict, defaultdict
+from io import BytesIO
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image
+
+from kotaemon.utils.concurrency import map_concurrently
+
+from .adobe import generate_single_figure_caption
+
+CAPTION_CACHE_SIZE = 4096
+
+_captions: OrderedDict[str, str] = OrderedDict()
+_captions_lock = threading.Lock()
+
+
+def _crop(img: Image.Image, bbox: list[float]) -> Image.Image:
+    left, upper, right, lower = bbox
+
+    left, right = min(left, right), max(left, right)
+    upper, lower = min(upper, lower), max(upper, lower)
+
+    return img.crop(
+        (
+            int(left * img.width),
+            int(upper * img.height),
+            int(right * img.width),
+            int(lower * img.height),
+        )
+    )
+
+
+def crop_figures(
+    file_path: Path, figures: list[tuple[int, list[float]]], dpi: int = 150
+) -> list[Image.Image]:
+    """Crop the figures of a file, rendering each page only once
+
+    Args:
+        file_path: path to the pdf or image file
+        figures: the (page number starting from 0, bounding box) of each figure,
+            the bounding box in percentage [x0, y0, x1, y1]
+        dpi: resolution to render the pdf pages
+
+    Returns:
+        the cropped images, in the order of `figures`
+    """
+    if not figures:
+        return []
+
+    by_page: dict[int, list[int]] = defaultdict(list)
+    for idx, (page_number, _) in enumerate(figures):
+        by_page[page_number].append(idx)
+
+    output: list[Optional[Image.Image]] = [None] * len(figures)
+    suffix = file_path.suffix.lower()
+    if suffix == ".pdf":
+        try:
+            import fitz
+        except ImportError:
+            raise ImportError("Please install PyMuPDF: 'pip install PyMuPDF'")
+
+        with fitz.open(file_path) as doc:
+            for page_number, indices in by_page.items():
+                pm = doc.load_page(page_number).get_pixmap(dpi=dpi)
+                img = Image.frombytes("RGB", [pm.width, pm.height], pm.samples)
+                for idx in indices:
+                    output[idx] = _crop(img, figures[idx][1])
+    else:
+        with Image.open(file_path) as img:
+            for page_number, indices in by_page.items():
+                if suffix in [".tif", ".tiff"]:
+                    img.seek(page_number)
+                for idx in indices:
+                    output[idx] = _crop(img, figures[idx][1])
+
+    return output  # type: ignore
+
+
+def image_to_base64(img: Image.Image) -> str:
+    """Encode an image as a base64 PNG data URI"""
+    img_bytes = BytesIO()
+    img.save(img_bytes, format="PNG")
+    img_base64 = base64.b64encode(img_bytes.getvalue()).decode("utf-8")
+    return f"data:image/png;base64,{img_base64}"
+
+
+def caption_figure(vlm_endpoint: str, figure: str) -> str:
+    """Caption a base64 image, reusing the caption of an identical image"""
+    key = hashlib.sha256(f"{vlm_endpoint}\x00{figure}".encode("utf-8")).hexdigest()
+    with _captions_lock:
+        if key in _captions:
+            _captions.move_to_end(key)
+            return _captions[key]
+
+    caption = generate_single_figure_caption(vlm_endpoint, figure)
+    # empty captions may come from a failed request, they are retried next time
+    if caption:
+        with _captions_lock:
+            _captions[key] = caption
+            while len(_captions) > CAPTION_CACHE_SIZE:
+                _captions.popitem(last=False)
+    return caption
+
+
+def caption_figures(
+    vlm_endpoint: str, figures: list[str], max_workers: int = 4
+) -> list[str]:
+    """Caption base64 images concurrently
+
+    Args:
+        vlm_endpoint: endpoint to the vision language model service
+        figures: the base64 images
+        max_workers: maximum number of concurrent requests to the VLM
+
+    Returns:
+        the captions, in the order of `figures`
+    """
+    return list(
+        map_concurrently(
+            lambda figure: caption_figure(vlm_endpoint, figure), figures, max_workers
+        )
+    )
@@ -2,9 +2,10 @@ import json
 import logging
 from typing import Any, List
 
-import requests
 from decouple import config
 
+from kotaemon.utils.http import get_session
+
 logger = logging.getLogger(__name__)
 
 
@@ -45,7 +46,7 @@ def generate_gpt4v(
     if len(images) > max_images:
         print(f"Truncated to {max_images} images (original {len(images)} images")
 
-    response = requests.post(endpoint, headers=headers, json=payload)
+    response = get_session(endpoint).post(endpoint, headers=headers, json=payload)
 
     try:
         response.raise_for_status()
@@ -95,8 +96,11 @@ def stream_gpt4v(
     }
     if len(images) > max_images:
         print(f"Truncated to {max_images} images (original {len(images)} images")
+    response = None
     try:
-        response = requests.post(endpoint, headers=headers, json=payload, stream=True)
+        response = get_session(endpoint).post(
+            endpoint, headers=headers, json=payload, stream=True
+        )
         assert response.status_code == 200, str(response.content)
         output = ""
         logprobs = []
@@ -131,5 +135,9 @@ def stream_gpt4v(
         logger.error(f"Error streaming gpt4v {e}")
         logprobs = []
         output = ""
+    finally:
+        # release the connection to the pool even if the stream stopped early
+        if response is not None:
+            response.close()
 
     return output, logprobs
@@ -2,14 +2,12 @@ from __future__ import annotations
 
 from typing import Optional
 
-import requests
-
 from kotaemon.base import Document, Param
+from kotaemon.utils.concurrency import map_concurrently
+from kotaemon.utils.http import post_json
 
 from .base import BaseReranking
 
-session = requests.session()
-
 
 class TeiFastReranking(BaseReranking):
     """Text Embeddings Inference (TEI) Reranking model
@@ -29,17 +27,23 @@ class TeiFastReranking(BaseReranking):
         ),
     )
     is_truncated: Optional[bool] = Param(True, help="Whether to truncate the inputs")
+    batch_size: int = Param(32, help="Maximum number of texts per request")
+    concurrency: int = Param(4, help="Number of requests sent in parallel")
+    max_retries: int = Param(3, help="Number of retries of a failed request")
+    timeout: float = Param(60, help="Timeout of each request, in seconds")
 
     def client(self, query, texts):
-        response = session.post(
-            url=self.endpoint_url,
-            json={
+        return post_json(
+            self.endpoint_url,
+            {
                 "query": query,
                 "texts": texts,
                 "is_truncated": self.is_truncated,  # default is True
             },
-        ).json()
-        return response
+            timeout=self.timeout,
+            max_retries=self.max_retries,
+            pool_size=max(self.concurrency, 1),
+        )
 
     def run(self, documents: list[Document], query: str) -> list[Document]:
         """Use the deployed TEI rerankings service to re-order documents
@@ -56,16 +60,16 @@ class TeiFastReranking(BaseReranking):
         if isinstance(documents[0], str):
             documents = self.prepare_input(documents)
 
-        batch_size = 6
-        num_batch = max(len(documents) // batch_size, 1)
-        for i in range(num_batch):
-            if i == num_batch - 1:
-                mini_batch = documents[batch_size * i :]
-            else:
-                mini_batch = documents[batch_size * i : batch_size * (i + 1)]
-
-            _docs = [d.content for d in mini_batch]
-            rerank_resp = self.client(query, _docs)
+        batch_size = max(self.batch_size, 1)
+        mini_batches = [
+            documents[i : i + batch_size] for i in range(0, len(documents), batch_size)
+        ]
+        rerank_resps = map_concurrently(
+            lambda mini_batch: self.client(query, [d.content for d in mini_batch]),
+            mini_batches,
+            self.concurrency,
+        )
+        for mini_batch, rerank_resp in zip(mini_batches, rerank_resps):
             for r in rerank_resp:
                 doc = mini_batch[r["index"]]
                 doc.metadata["reranking_score"] = r["score"]
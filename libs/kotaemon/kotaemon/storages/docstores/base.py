@@ -43,16 +43,37 @@ class BaseDocumentStore(ABC):
 
     @abstractmethod
     def query(
-        self, query: str, top_k: int = 10, doc_ids: Optional[list] = None
+        self,
+        query: str,
+        top_k: int = 10,
+        doc_ids: Optional[list] = None,
+        file_ids: Optional[list] = None,
     ) -> List[Document]:
-        """Search document store using search query"""
+        """Search document store using search query
+
+        Args:
+            query: the search query
+            top_k: number of documents to return
+            doc_ids: restrict the search to these document ids
+            file_ids: restrict the search to documents whose `file_id` metadata is
+                in this list. Only used by the stores that `supports_file_filter`,
+                the other stores fall back to `doc_ids`.
+        """
         ...
 
+    def supports_file_filter(self) -> bool:
+        """Whether `query` can filter on the `file_id` metadata natively"""
+        return False
+
     @abstractmethod
     def delete(self, ids: Union[List[str], str]):
         """Delete document by id"""
         ...
 
+    def flush_indices(self):
+        """Bring the search indices up to date with the deferred writes"""
+        ...
+
     @abstractmethod
     def drop(self):
         """Drop the document store"""
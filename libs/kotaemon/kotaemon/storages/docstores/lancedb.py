@@ -1,17 +1,41 @@
 import json
-from typing import List, Optional, Union
+import threading
+import time
+from typing import List, Literal, Optional, Union
 
 from kotaemon.base import Document
 
+from ..utils import lance_in_filter
 from .base import BaseDocumentStore
 
 MAX_DOCS_TO_GET = 10**4
 
 
 class LanceDBDocumentStore(BaseDocumentStore):
-    """LancdDB document store which support full-text search query"""
-
-    def __init__(self, path: str = "lancedb", collection_name: str = "docstore"):
+    """LancdDB document store which support full-text search query
+
+    Args:
+        path: the path of the lancedb database
+        collection_name: the name of the table
+        fts_refresh: "immediate" to refresh the full-text index on every write,
+            "deferred" to only mark it as outdated and refresh it once in
+            `flush_indices`, e.g. at the end of a file
+        query_consistency: with deferred refresh, "strong" to refresh the
+            outdated full-text index before querying, "eventual" to query it as
+            is. The native index of lancedb still searches the unindexed rows,
+            only slower
+        refresh_interval: with deferred refresh, the number of seconds between
+            the background refreshes of the outdated index, 0 to disable
+    """
+
+    def __init__(
+        self,
+        path: str = "lancedb",
+        collection_name: str = "docstore",
+        fts_refresh: Literal["immediate", "deferred"] = "immediate",
+        query_consistency: Literal["strong", "eventual"] = "strong",
+        refresh_interval: float = 0,
+    ):
         try:
             import lancedb
         except ImportError:
@@ -21,8 +45,16 @@ class LanceDBDocumentStore(BaseDocumentStore):
 
         self.db_uri = path
         self.collection_name = collection_name
+        self.fts_refresh = fts_refresh
+        self.query_consistency = query_consistency
+        self.refresh_interval = refresh_interval
         self.db_connection = lancedb.connect(self.db_uri)  # type: ignore
 
+        self._fts_dirty = False
+        self._fts_lock = threading.Lock()
+        if fts_refresh == "deferred" and refresh_interval > 0:
+            threading.Thread(target=self._refresh_periodically, daemon=True).start()
+
     def add(
         self,
         docs: Union[Document, List[Document]],
@@ -37,6 +69,7 @@ class LanceDBDocumentStore(BaseDocumentStore):
                 "id": doc_id,
                 "text": doc.text,
                 "attributes": json.dumps(doc.metadata),
+                "file_id": str(doc.metadata.get("file_id", "")),
             }
             for doc_id, doc in zip(doc_ids, docs)
         ]
@@ -50,25 +83,94 @@ class LanceDBDocumentStore(BaseDocumentStore):
             # add data to existing table
             document_collection = self.db_connection.open_table(self.collection_name)
             if data:
+                if not self._has_file_id(document_collection):
+                    # table created before the `file_id` column was introduced
+                    for item in data:
+                        item.pop("file_id")
                 document_collection.add(data)
 
         if refresh_indices:
+            self._refresh_fts(document_collection)
+
+    def flush_indices(self):
+        """Refresh the full-text index if writes were deferred since the last one"""
+        if not self._fts_dirty:
+            return
+        with self._fts_lock:
+            if not self._fts_dirty:
+                return
+            self._fts_dirty = False
+            try:
+                document_collection = self.db_connection.open_table(
+                    self.collection_name
+                )
+                self._update_fts(document_collection)
+            except BaseException:
+                self._fts_dirty = True
+                raise
+
+    def _refresh_fts(self, document_collection):
+        if self.fts_refresh == "deferred":
+            self._fts_dirty = True
+            return
+        with self._fts_lock:
+            self._update_fts(document_collection)
+
+    @staticmethod
+    def _update_fts(document_collection):
+        """Add the new rows to the native full-text index, or build it"""
+        has_native_fts = any(
+            idx.index_type == "FTS" and list(idx.columns) == ["text"]
+            for idx in getattr(document_collection, "list_indices", list)()
+        )
+        if has_native_fts:
+            document_collection.optimize()
+        else:
             document_collection.create_fts_index(
                 "text",
                 tokenizer_name="en_stem",
                 replace=True,
             )
 
+    def _refresh_periodically(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                self.flush_indices()
+            except Exception as e:
+                print(f"Failed to refresh the full-text index: {e}")
+
+    @staticmethod
+    def _has_file_id(document_collection) -> bool:
+        return "file_id" in document_collection.schema.names
+
+    def supports_file_filter(self) -> bool:
+        try:
+            document_collection = self.db_connection.open_table(self.collection_name)
+        except (ValueError, FileNotFoundError):
+            # nothing to search yet
+            return True
+        return self._has_file_id(document_collection)
+
     def query(
-        self, query: str, top_k: int = 10, doc_ids: Optional[list] = None
+        self,
+        query: str,
+        top_k: int = 10,
+        doc_ids: Optional[list] = None,
+        file_ids: Optional[list] = None,
     ) -> List[Document]:
-        if doc_ids:
-            id_filter = ", ".join([f"'{_id}'" for _id in doc_ids])
-            query_filter = f"id in ({id_filter})"
-        else:
-            query_filter = None
+        if self.query_consistency == "strong":
+            self.flush_indices()
+
         try:
             document_collection = self.db_connection.open_table(self.collection_name)
+            if file_ids and self._has_file_id(document_collection):
+                query_filter = lance_in_filter("file_id", file_ids)
+            elif doc_ids:
+                query_filter = lance_in_filter("id", doc_ids)
+            else:
+                query_filter = None
+
             if query_filter:
                 docs = (
                     document_collection.search(query, query_type="fts")
@@ -98,10 +200,9 @@ class LanceDBDocumentStore(BaseDocumentStore):
         if not isinstance(ids, list):
             ids = [ids]
 
-        id_filter = ", ".join([f"'{_id}'" for _id in ids])
         try:
             document_collection = self.db_connection.open_table(self.collection_name)
-            query_filter = f"id in ({id_filter})"
+            query_filter = lance_in_filter("id", ids)
             docs = (
                 document_collection.search()
                 .where(query_filter)
@@ -125,20 +226,15 @@ class LanceDBDocumentStore(BaseDocumentStore):
             ids = [ids]
 
         document_collection = self.db_connection.open_table(self.collection_name)
-        id_filter = ", ".join([f"'{_id}'" for _id in ids])
-        query_filter = f"id in ({id_filter})"
-        document_collection.delete(query_filter)
+        document_collection.delete(lance_in_filter("id", ids))
 
         if refresh_indices:
-            document_collection.create_fts_index(
-                "text",
-                tokenizer_name="en_stem",
-                replace=True,
-            )
+            self._refresh_fts(document_collection)
 
     def drop(self):
         """Drop the document store"""
         self.db_connection.drop_table(self.collection_name)
+        self._fts_dirty = False
 
     def count(self) -> int:
         raise NotImplementedError
@@ -150,4 +246,7 @@ class LanceDBDocumentStore(BaseDocumentStore):
         return {
             "db_uri": self.db_uri,
             "collection_name": self.collection_name,
+            "fts_refresh": self.fts_refresh,
+            "query_consistency": self.query_consistency,
+            "refresh_interval": self.refresh_interval,
         }
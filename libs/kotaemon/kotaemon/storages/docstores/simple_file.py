@@ -1,22 +1,192 @@
+import json
+import os
+import threading
 from pathlib import Path
-from typing import List, Optional, Union
+from typing import Iterator, List, Optional, Union
 
 from kotaemon.base import Document
 
 from .in_memory import InMemoryDocumentStore
 
+_OP_ADD = b"a"
+_OP_DELETE = b"d"
+
+
+class _SegmentLog:
+    """Append-only segment file with an in-memory offset index
+
+    Each record is a single line `<json id>\\t<op>\\t<json payload>\\n`. Only the
+    id and the op are decoded when the segment is scanned on open, so the
+    documents themselves are parsed lazily when they are requested.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.index: dict[str, tuple[int, int]] = {}
+        self.dead_bytes = 0
+        self.path.touch(exist_ok=True)
+        self._scan()
+        self._fp = open(self.path, "r+b")
+        self._fp.seek(0, os.SEEK_END)
+
+    @staticmethod
+    def encode(op: bytes, doc_id: str, payload: Optional[dict] = None) -> bytes:
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        return b"\t".join([json.dumps(doc_id).encode("utf-8"), op, body]) + b"\n"
+
+    @staticmethod
+    def decode(line: bytes) -> tuple[str, bytes, bytes]:
+        raw_id, op, body = line.rstrip(b"\n").split(b"\t", 2)
+        return json.loads(raw_id), op, body
+
+    def _apply(self, index: dict, line: bytes, offset: int) -> int:
+        """Apply a record to `index`, return the number of bytes it made dead"""
+        doc_id, op, _ = self.decode(line)
+        dead = 0
+        if doc_id in index:
+            dead += index.pop(doc_id)[1]
+        if op == _OP_ADD:
+            index[doc_id] = (offset, len(line))
+        else:
+            dead += len(line)
+        return dead
+
+    def _scan(self):
+        offset = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # torn write from an interrupted process, drop it
+                    break
+                self.dead_bytes += self._apply(self.index, line, offset)
+                offset += len(line)
+
+        if offset != self.path.stat().st_size:
+            os.truncate(self.path, offset)
+
+    @property
+    def size(self) -> int:
+        return self._fp.seek(0, os.SEEK_END)
+
+    def append(self, records: list[bytes]):
+        with self.lock:
+            offset = self.size
+            self._fp.write(b"".join(records))
+            self._fp.flush()
+            for line in records:
+                self.dead_bytes += self._apply(self.index, line, offset)
+                offset += len(line)
+
+    def read(self, doc_id: str) -> dict:
+        with self.lock:
+            offset, length = self.index[doc_id]
+            self._fp.seek(offset)
+            line = self._fp.read(length)
+        return json.loads(self.decode(line)[2])
+
+    def iter_live(self) -> Iterator[tuple[str, dict]]:
+        with self.lock:
+            items = sorted(self.index.items(), key=lambda item: item[1][0])
+            for doc_id, (offset, length) in items:
+                self._fp.seek(offset)
+                yield doc_id, json.loads(self.decode(self._fp.read(length))[2])
+
+    def compact(self):
+        """Rewrite the live records into a fresh segment
+
+        Live records are copied without holding the lock, so writers can keep
+        appending meanwhile; whatever was appended during the copy is replayed
+        into the new segment before it atomically replaces the old one.
+        """
+        tmp_path = self.path.with_suffix(self.path.suffix + ".compact")
+        with self.lock:
+            snapshot_end = self.size
+            snapshot = sorted(self.index.items(), key=lambda item: item[1][0])
+
+        new_index: dict[str, tuple[int, int]] = {}
+        new_offset = 0
+        src = open(self.path, "rb")
+        dst = open(tmp_path, "wb")
+        try:
+            for doc_id, (offset, length) in snapshot:
+                src.seek(offset)
+                dst.write(src.read(length))
+                new_index[doc_id] = (new_offset, length)
+                new_offset += length
+
+            with self.lock:
+                dead_bytes = 0
+                src.seek(snapshot_end)
+                for line in src:
+                    dead_bytes += self._apply(new_index, line, new_offset)
+                    dst.write(line)
+                    new_offset += len(line)
+                dst.flush()
+                os.fsync(dst.fileno())
+                src.close()
+                dst.close()
+
+                self._fp.close()
+                os.replace(tmp_path, self.path)
+                self._fp = open(self.path, "r+b")
+                self._fp.seek(0, os.SEEK_END)
+                self.index = new_index
+                self.dead_bytes = dead_bytes
+        finally:
+            src.close()
+            dst.close()
+            tmp_path.unlink(missing_ok=True)
+
+    def close(self):
+        with self.lock:
+            if not self._fp.closed:
+                self._fp.close()
+
 
 class SimpleFileDocumentStore(InMemoryDocumentStore):
-    """Improve InMemoryDocumentStore by auto saving whenever the corpus is changed"""
+    """Improve InMemoryDocumentStore by auto saving whenever the corpus is changed
 
-    def __init__(self, path: str | Path, collection_name: str = "default"):
+    Args:
+        path: directory to store the collection
+        collection_name: name of the collection, used as the file name
+        append_only: if True, persist mutations incrementally to an append-only
+            `<collection_name>.log` segment instead of rewriting the whole JSON
+            file, and read documents lazily from it. An existing
+            `<collection_name>.json` is imported on first open.
+        compact_ratio: (append_only) compact the segment in background once this
+            fraction of it is made of overwritten or deleted records
+        compact_min_bytes: (append_only) don't compact segments whose dead
+            records are smaller than this
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        collection_name: str = "default",
+        append_only: bool = False,
+        compact_ratio: float = 0.5,
+        compact_min_bytes: int = 16 * 1024 * 1024,
+    ):
         super().__init__()
         self._path = path
         self._collection_name = collection_name
+        self._append_only = append_only
+        self._compact_ratio = compact_ratio
+        self._compact_min_bytes = compact_min_bytes
+        self._compact_thread: Optional[threading.Thread] = None
 
         Path(path).mkdir(parents=True, exist_ok=True)
         self._save_path = Path(path) / f"{collection_name}.json"
-        if self._save_path.is_file():
+        self._log_path = Path(path) / f"{collection_name}.log"
+        self._log: Optional[_SegmentLog] = None
+
+        if append_only:
+            import_json = not self._log_path.is_file() and self._save_path.is_file()
+            self._log = _SegmentLog(self._log_path)
+            if import_json:
+                self.load(self._save_path)
+        elif self._save_path.is_file():
             self.load(self._save_path)
 
     def get(self, ids: Union[List[str], str]) -> List[Document]:
@@ -24,6 +194,9 @@ class SimpleFileDocumentStore(InMemoryDocumentStore):
         if not isinstance(ids, list):
             ids = [ids]
 
+        if self._log is not None:
+            return [Document.from_dict(self._log.read(doc_id)) for doc_id in ids]
+
         for doc_id in ids:
             if doc_id not in self._store:
                 self.load(self._save_path)
@@ -31,6 +204,18 @@ class SimpleFileDocumentStore(InMemoryDocumentStore):
 
         return [self._store[doc_id] for doc_id in ids]
 
+    def get_all(self) -> List[Document]:
+        """Get all documents"""
+        if self._log is not None:
+            return [Document.from_dict(value) for _, value in self._log.iter_live()]
+        return super().get_all()
+
+    def count(self) -> int:
+        """Count number of documents"""
+        if self._log is not None:
+            return len(self._log.index)
+        return super().count()
+
     def add(
         self,
         docs: Union[Document, List[Document]],
@@ -46,18 +231,106 @@ class SimpleFileDocumentStore(InMemoryDocumentStore):
             exist_ok: raise error when duplicate doc-id
                 found in the docstore (default to False)
         """
-        super().add(docs=docs, ids=ids, **kwargs)
-        self.save(self._save_path)
+        if self._log is None:
+            super().add(docs=docs, ids=ids, **kwargs)
+            self.save(self._save_path)
+            return
+
+        exist_ok: bool = kwargs.pop("exist_ok", False)
+        if ids and not isinstance(ids, list):
+            ids = [ids]
+        if not isinstance(docs, list):
+            docs = [docs]
+        doc_ids = ids if ids else [doc.doc_id for doc in docs]
+
+        if not exist_ok:
+            for doc_id in doc_ids:
+                if doc_id in self._log.index:
+                    raise ValueError(f"Document with id {doc_id} already exist")
+
+        self._log.append(
+            [
+                _SegmentLog.encode(_OP_ADD, doc_id, doc.to_dict())
+                for doc_id, doc in zip(doc_ids, docs)
+            ]
+        )
+        self._maybe_compact()
 
     def delete(self, ids: Union[List[str], str]):
         """Delete document by id"""
-        super().delete(ids=ids)
-        self.save(self._save_path)
+        if self._log is None:
+            super().delete(ids=ids)
+            self.save(self._save_path)
+            return
+
+        if not isinstance(ids, list):
+            ids = [ids]
+        for doc_id in ids:
+            if doc_id not in self._log.index:
+                raise KeyError(doc_id)
+
+        self._log.append([_SegmentLog.encode(_OP_DELETE, doc_id) for doc_id in ids])
+        self._maybe_compact()
+
+    def save(self, path: Union[str, Path]):
+        """Save document to path"""
+        if self._log is None:
+            return super().save(path)
+
+        store = {key: value for key, value in self._log.iter_live()}
+        with open(path, "w") as f:
+            json.dump(store, f)
+
+    def load(self, path: Union[str, Path]):
+        """Load document store from path"""
+        if self._log is None:
+            return super().load(path)
+
+        with open(path) as f:
+            store = json.load(f)
+        with self._log.lock:
+            self._log.append(
+                [_SegmentLog.encode(_OP_DELETE, key) for key in list(self._log.index)]
+            )
+            self._log.append(
+                [
+                    _SegmentLog.encode(_OP_ADD, key, value)
+                    for key, value in store.items()
+                ]
+            )
+        self._maybe_compact()
+
+    def compact(self):
+        """Reclaim the space used by overwritten and deleted documents"""
+        if self._log is None:
+            return
+
+        if self._compact_thread is not None:
+            self._compact_thread.join()
+        self._log.compact()
+
+    def _maybe_compact(self):
+        log = self._log
+        if log is None or log.dead_bytes < self._compact_min_bytes:
+            return
+        if log.dead_bytes < self._compact_ratio * log.size:
+            return
+        if self._compact_thread is not None and self._compact_thread.is_alive():
+            return
+
+        self._compact_thread = threading.Thread(target=log.compact, daemon=True)
+        self._compact_thread.start()
 
     def drop(self):
         """Drop the document store"""
         super().drop()
         self._save_path.unlink(missing_ok=True)
+        if self._log is not None:
+            if self._compact_thread is not None:
+                self._compact_thread.join()
+            self._log.close()
+            self._log_path.unlink(missing_ok=True)
+            self._log = _SegmentLog(self._log_path)
 
     def __persist_flow__(self):
         from theflow.utils.modules import serialize
@@ -65,4 +338,7 @@ class SimpleFileDocumentStore(InMemoryDocumentStore):
         return {
             "path": serialize(self._path),
             "collection_name": self._collection_name,
+            "append_only": self._append_only,
+            "compact_ratio": self._compact_ratio,
+            "compact_min_bytes": self._compact_min_bytes,
         }
@@ -0,0 +1,10 @@
+from typing import Iterable
+
+
+def lance_in_filter(column: str, values: Iterable[str]) -> str:
+    """Lance SQL filter matching the rows whose `column` is in `values`
+
+    The values are quoted as SQL string literals, with their quotes escaped.
+    """
+    quoted = ", ".join("'{}'".format(str(value).replace("'", "''")) for value in values)
+    return f"{column} in ({quoted})"
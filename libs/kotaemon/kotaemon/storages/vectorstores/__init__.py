@@ -2,6 +2,7 @@ from .base import BaseVectorStore
 from .chroma import ChromaVectorStore
 from .in_memory import InMemoryVectorStore
 from .lancedb import LanceDBVectorStore
+from .memmap import MemmapVectorStore
 from .milvus import MilvusVectorStore
 from .qdrant import QdrantVectorStore
 from .simple_file import SimpleFileVectorStore
@@ -12,6 +13,7 @@ __all__ = [
     "InMemoryVectorStore",
     "SimpleFileVectorStore",
     "LanceDBVectorStore",
+    "MemmapVectorStore",
     "MilvusVectorStore",
     "QdrantVectorStore",
 ]
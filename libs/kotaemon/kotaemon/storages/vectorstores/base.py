@@ -4,7 +4,12 @@ from abc import ABC, abstractmethod
 from typing import Any, Optional
 
 from llama_index.core.schema import NodeRelationship, RelatedNodeInfo
-from llama_index.core.vector_stores.types import BasePydanticVectorStore
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+)
 from llama_index.core.vector_stores.types import VectorStore as LIVectorStore
 from llama_index.core.vector_stores.types import VectorStoreQuery
 
@@ -46,6 +51,17 @@ class BaseVectorStore(ABC):
         """
         ...
 
+    def delete_by_file_ids(self, file_ids: list[str], **kwargs):
+        """Delete the vector embeddings whose `file_id` metadata is in `file_ids`
+
+        Args:
+            file_ids: List of ids of the files whose embeddings are to be deleted
+            kwargs: meant for vectorstore-specific parameters
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} does not support deleting by file ids"
+        )
+
     @abstractmethod
     def query(
         self,
@@ -135,8 +151,30 @@ class LlamaIndexVectorStore(BaseVectorStore):
         return self._client.add(nodes=nodes)
 
     def delete(self, ids: list[str], **kwargs):
-        for id_ in ids:
-            self._client.delete(ref_doc_id=id_, **kwargs)
+        if not ids:
+            return
+
+        try:
+            # the node ids are also their ref doc ids, see `add`
+            self._client.delete_nodes(node_ids=ids, **kwargs)
+        except NotImplementedError:
+            for id_ in ids:
+                self._client.delete(ref_doc_id=id_, **kwargs)
+
+    def delete_by_file_ids(self, file_ids: list[str], **kwargs):
+        if not file_ids:
+            return
+
+        self._client.delete_nodes(
+            filters=MetadataFilters(
+                filters=[
+                    MetadataFilter(
+                        key="file_id", value=file_ids, operator=FilterOperator.IN
+                    )
+                ]
+            ),
+            **kwargs,
+        )
 
     def query(
         self,
@@ -64,7 +64,18 @@ class ChromaVectorStore(LlamaIndexVectorStore):
             ids: List of ids of the embeddings to be deleted
             kwargs: meant for vectorstore-specific parameters
         """
-        self._client.client.delete(ids=ids)
+        if ids:
+            self._client.client.delete(ids=ids)
+
+    def delete_by_file_ids(self, file_ids: List[str], **kwargs):
+        """Delete the vector embeddings whose `file_id` metadata is in `file_ids`
+
+        Args:
+            file_ids: List of ids of the files whose embeddings are to be deleted
+            kwargs: meant for vectorstore-specific parameters
+        """
+        if file_ids:
+            self._client.client.delete(where={"file_id": {"$in": file_ids}})
 
     def drop(self):
         """Delete entire collection from vector stores"""
@@ -4,6 +4,7 @@ from llama_index.core.vector_stores.types import MetadataFilters
 from llama_index.vector_stores.lancedb import LanceDBVectorStore as LILanceDBVectorStore
 from llama_index.vector_stores.lancedb import base as base_lancedb
 
+from ..utils import lance_in_filter
 from .base import LlamaIndexVectorStore
 
 # custom monkey patch for LanceDB
@@ -17,7 +18,9 @@ def custom_to_lance_filter(
         if isinstance(filter.value, list):
             # quote string values if filter are list of strings
             if filter.value and isinstance(filter.value[0], str):
-                filter.value = [f"'{v}'" for v in filter.value]
+                filter.value = [
+                    "'{}'".format(v.replace("'", "''")) for v in filter.value
+                ]
 
     return original_to_lance_filter(standard_filters, metadata_keys)
 
@@ -49,7 +52,7 @@ class LanceDBVectorStore(LlamaIndexVectorStore):
         db_connection = lancedb.connect(path)  # type: ignore
         try:
             table = db_connection.open_table(collection_name)
-        except FileNotFoundError:
+        except (ValueError, FileNotFoundError):
             table = None
 
         self._kwargs = kwargs
@@ -71,7 +74,18 @@ class LanceDBVectorStore(LlamaIndexVectorStore):
             ids: List of ids of the embeddings to be deleted
             kwargs: meant for vectorstore-specific parameters
         """
-        self._client.delete_nodes(ids)
+        if ids and self._client._table is not None:
+            self._client._table.delete(lance_in_filter("id", ids))
+
+    def delete_by_file_ids(self, file_ids: List[str], **kwargs):
+        """Delete the vector embeddings whose `file_id` metadata is in `file_ids`
+
+        Args:
+            file_ids: List of ids of the files whose embeddings are to be deleted
+            kwargs: meant for vectorstore-specific parameters
+        """
+        if file_ids and self._client._table is not None:
+            self._client._table.delete(lance_in_filter("metadata.file_id", file_ids))
 
     def drop(self):
         """Delete entire collection from vector stores"""
@@ -0,0 +1,404 @@
+import json
+import os
+import threading
+import uuid
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+from llama_index.core.vector_stores.types import (
+    FilterCondition,
+    FilterOperator,
+    MetadataFilters,
+)
+
+from kotaemon.base import DocumentWithEmbedding
+
+from .base import BaseVectorStore
+
+
+class MemmapVectorStore(BaseVectorStore):
+    """File-backed vector store keeping the embeddings in a float32 matrix
+
+    The embeddings are appended to `<collection_name>.f32` as a contiguous
+    row-major float32 matrix which is memory-mapped for querying, while the ids and
+    metadata are appended to a `<collection_name>.jsonl` sidecar. Neither file is
+    rewritten on `add` or `delete`: deleted rows are masked out until `compact` is
+    called.
+
+    Args:
+        path: directory to store the collection
+        collection_name: name of the collection, used as the file names
+    """
+
+    def __init__(self, path: str | Path, collection_name: str = "default"):
+        self._path = path
+        self._collection_name = collection_name
+        Path(path).mkdir(parents=True, exist_ok=True)
+        self._matrix_path = Path(path) / f"{collection_name}.f32"
+        self._sidecar_path = Path(path) / f"{collection_name}.jsonl"
+        self._lock = threading.RLock()
+        self._load()
+
+    def _reset(self):
+        self._dim: Optional[int] = None
+        self._ids: list[Optional[str]] = []
+        self._metadatas: list[Optional[dict]] = []
+        self._rows: dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._matrix: Optional[np.memmap] = None
+        self._inverted: dict[str, dict[Any, np.ndarray]] = {}
+
+    def _load(self):
+        self._reset()
+        if not self._sidecar_path.is_file():
+            return
+
+        with open(self._sidecar_path, "rb+") as f:
+            content = f.read()
+            # drop the torn last line of an interrupted write, or the next record
+            # would be appended to it
+            size = content.rfind(b"\n") + 1
+            if size < len(content):
+                f.truncate(size)
+        records = [json.loads(line) for line in content[:size].splitlines()]
+        if not records:
+            self._matrix_path.unlink(missing_ok=True)
+            return
+
+        self._dim = records[0]["dim"]
+        n_rows = 0
+        if self._matrix_path.is_file():
+            size = self._matrix_path.stat().st_size
+            n_rows = size // (4 * self._dim)
+            if size != n_rows * 4 * self._dim:
+                # drop the partial last row, or the next rows would be misaligned
+                with open(self._matrix_path, "rb+") as f:
+                    f.truncate(n_rows * 4 * self._dim)
+
+        self._ids = [None] * n_rows
+        self._metadatas = [None] * n_rows
+        for record in records[1:]:
+            self._mark_deleted(record["id"])
+            if "row" not in record or record["row"] >= n_rows:
+                # deletion, or vectors which were never fully written
+                continue
+            self._rows[record["id"]] = record["row"]
+            self._ids[record["row"]] = record["id"]
+            self._metadatas[record["row"]] = record["metadata"]
+
+        self._alive = np.array([id_ is not None for id_ in self._ids], dtype=bool)
+        self._refresh_matrix(n_rows)
+        self._norms = np.zeros(n_rows, dtype=np.float32)
+        chunk = 65536
+        for start in range(0, n_rows, chunk):
+            self._norms[start : start + chunk] = np.linalg.norm(
+                self._matrix[start : start + chunk], axis=1  # type: ignore
+            )
+
+    def _refresh_matrix(self, n_rows: int):
+        if n_rows == 0:
+            self._matrix = None
+            return
+        self._matrix = np.memmap(
+            self._matrix_path, dtype=np.float32, mode="r", shape=(n_rows, self._dim)
+        )
+
+    def _mark_deleted(self, id_: str):
+        row = self._rows.pop(id_, None)
+        if row is not None:
+            self._ids[row] = None
+            self._metadatas[row] = None
+            if row < len(self._alive):
+                self._alive[row] = False
+
+    def _append_sidecar(self, records: list[dict]):
+        with open(self._sidecar_path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(record) + "\n" for record in records))
+
+    def add(
+        self,
+        embeddings: list[list[float]] | list[DocumentWithEmbedding],
+        metadatas: Optional[list[dict]] = None,
+        ids: Optional[list[str]] = None,
+    ) -> list[str]:
+        if not embeddings:
+            return []
+
+        if isinstance(embeddings[0], list):
+            vectors = embeddings
+            if metadatas is None:
+                metadatas = [{} for _ in embeddings]
+            if ids is None:
+                ids = [str(uuid.uuid4()) for _ in embeddings]
+        else:
+            docs: list[DocumentWithEmbedding] = embeddings  # type: ignore
+            vectors = [doc.embedding for doc in docs]
+            if metadatas is None:
+                metadatas = [doc.metadata for doc in docs]
+            if ids is None:
+                ids = [doc.doc_id for doc in docs]
+
+        matrix = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self._dim is None:
+                self._dim = matrix.shape[1]
+                self._append_sidecar([{"dim": self._dim}])
+            elif matrix.shape[1] != self._dim:
+                raise ValueError(
+                    f"Expected embeddings of dimension {self._dim}, "
+                    f"got {matrix.shape[1]}"
+                )
+
+            start = len(self._ids)
+            with open(self._matrix_path, "ab") as f:
+                f.write(matrix.tobytes())
+
+            records = []
+            for offset, (id_, metadata) in enumerate(zip(ids, metadatas)):
+                self._mark_deleted(id_)
+                records.append({"id": id_, "row": start + offset, "metadata": metadata})
+                self._rows[id_] = start + offset
+            self._append_sidecar(records)
+
+            self._ids.extend(ids)
+            self._metadatas.extend(metadatas)
+            self._alive = np.concatenate([self._alive, np.ones(len(ids), dtype=bool)])
+            self._norms = np.concatenate(
+                [self._norms, np.linalg.norm(matrix, axis=1).astype(np.float32)]
+            )
+            self._refresh_matrix(len(self._ids))
+            self._inverted = {}
+
+        return ids
+
+    def delete(self, ids: list[str], **kwargs):
+        """Delete vector embeddings from vector stores
+
+        Args:
+            ids: List of ids of the embeddings to be deleted
+            kwargs: meant for vectorstore-specific parameters
+        """
+        with self._lock:
+            ids = [id_ for id_ in ids if id_ in self._rows]
+            for id_ in ids:
+                self._mark_deleted(id_)
+            if ids:
+                self._append_sidecar([{"id": id_} for id_ in ids])
+                self._inverted = {}
+
+    def delete_by_file_ids(self, file_ids: list[str], **kwargs):
+        """Delete the vector embeddings whose `file_id` metadata is in `file_ids`
+
+        Args:
+            file_ids: List of ids of the files whose embeddings are to be deleted
+            kwargs: meant for vectorstore-specific parameters
+        """
+        with self._lock:
+            inverted = self._inverted_index("file_id")
+            rows = [row for file_id in file_ids for row in inverted.get(file_id, [])]
+            ids = [self._ids[row] for row in rows if self._ids[row] is not None]
+            self.delete(ids)
+
+    def _inverted_index(self, key: str) -> dict[Any, np.ndarray]:
+        """Map each value of the metadata `key` to the rows holding it"""
+        if key not in self._inverted:
+            rows: dict[Any, list[int]] = {}
+            for row, metadata in enumerate(self._metadatas):
+                if metadata is not None and key in metadata:
+                    value = metadata[key]
+                    if isinstance(value, (list, dict)):
+                        value = json.dumps(value)
+                    rows.setdefault(value, []).append(row)
+            self._inverted[key] = {
+                value: np.asarray(value_rows, dtype=np.int64)
+                for value, value_rows in rows.items()
+            }
+        return self._inverted[key]
+
+    def _filter_mask(self, filters: MetadataFilters) -> np.ndarray:
+        n_rows = len(self._ids)
+        masks = []
+        for filter_ in filters.filters:
+            if isinstance(filter_, MetadataFilters):
+                masks.append(self._filter_mask(filter_))
+                continue
+
+            mask = np.zeros(n_rows, dtype=bool)
+            if filter_.operator in (FilterOperator.EQ, FilterOperator.IN):
+                index = self._inverted_index(filter_.key)
+                values = (
+                    filter_.value
+                    if isinstance(filter_.value, list)
+                    else [filter_.value]
+                )
+                for value in values:
+                    if value in index:
+                        mask[index[value]] = True
+            elif filter_.operator in (FilterOperator.NE, FilterOperator.NIN):
+                values = (
+                    filter_.value
+                    if isinstance(filter_.value, list)
+                    else [filter_.value]
+                )
+                mask[:] = True
+                index = self._inverted_index(filter_.key)
+                for value in values:
+                    if value in index:
+                        mask[index[value]] = False
+            else:
+                raise NotImplementedError(
+                    f"Filter operator {filter_.operator} is not supported"
+                )
+            masks.append(mask)
+
+        if not masks:
+            return np.ones(n_rows, dtype=bool)
+        if filters.condition == FilterCondition.OR:
+            return np.logical_or.reduce(masks)
+        return np.logical_and.reduce(masks)
+
+    def _candidates(
+        self, ids: Optional[list[str]], filters: Optional[MetadataFilters]
+    ) -> np.ndarray:
+        mask = self._alive.copy()
+        if ids is not None:
+            id_mask = np.zeros_like(mask)
+            id_mask[[self._rows[id_] for id_ in ids if id_ in self._rows]] = True
+            mask &= id_mask
+        if filters is not None:
+            mask &= self._filter_mask(filters)
+        return mask
+
+    def query_batch(
+        self,
+        embeddings: list[list[float]],
+        top_k: int = 1,
+        ids: Optional[list[str]] = None,
+        **kwargs,
+    ) -> list[tuple[list[list[float]], list[float], list[str]]]:
+        """Return the top k most similar vector embeddings for each query
+
+        The similarity of all the queries is computed with a single matrix
+        multiplication against the memory-mapped embeddings.
+
+        Args:
+            embeddings: List of query embeddings
+            top_k: Number of most similar embeddings to return per query
+            ids: List of ids of the embeddings to be queried
+            kwargs: `filters` (llama-index MetadataFilters) restrict the query to
+                the embeddings whose metadata match. Other parameters are ignored.
+
+        Returns:
+            for each query, the matched embeddings, the similarity scores, and the ids
+        """
+        queries = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        with self._lock:
+            matrix, norms = self._matrix, self._norms
+            if matrix is None:
+                return [([], [], []) for _ in queries]
+
+            mask = self._candidates(ids, kwargs.get("filters"))
+            candidates = np.flatnonzero(mask)
+            if len(candidates) == 0:
+                return [([], [], []) for _ in queries]
+
+            # only gather the candidate rows when it is cheaper than scanning all
+            if len(candidates) * 2 < len(mask):
+                scores = queries @ matrix[candidates].T
+                scores /= np.maximum(norms[candidates], 1e-12)
+                rows = candidates
+            else:
+                scores = queries @ matrix.T
+                scores /= np.maximum(norms, 1e-12)
+                scores[:, ~mask] = -np.inf
+                rows = np.arange(len(mask))
+            scores /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+            k = min(top_k, len(candidates))
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            output = []
+            for query_scores, query_top in zip(scores, top):
+                query_top = query_top[np.argsort(-query_scores[query_top])]
+                top_rows = rows[query_top]
+                output.append(
+                    (
+                        matrix[top_rows].tolist(),
+                        query_scores[query_top].tolist(),
+                        [self._ids[row] for row in top_rows],
+                    )
+                )
+        return output  # type: ignore
+
+    def query(
+        self,
+        embedding: list[float],
+        top_k: int = 1,
+        ids: Optional[list[str]] = None,
+        **kwargs,
+    ) -> tuple[list[list[float]], list[float], list[str]]:
+        """Return the top k most similar vector embeddings
+
+        Args:
+            embedding: List of embeddings
+            top_k: Number of most similar embeddings to return
+            ids: List of ids of the embeddings to be queried
+            kwargs: see `query_batch`
+
+        Returns:
+            the matched embeddings, the similarity scores, and the ids
+        """
+        return self.query_batch([embedding], top_k=top_k, ids=ids, **kwargs)[0]
+
+    def get(self, id_: str) -> list[float]:
+        """Get the embedding of an id"""
+        with self._lock:
+            return self._matrix[self._rows[id_]].tolist()  # type: ignore
+
+    def count(self) -> int:
+        return len(self._rows)
+
+    def compact(self):
+        """Rewrite the matrix and the sidecar without the deleted rows"""
+        with self._lock:
+            if self._matrix is None:
+                return
+
+            live = np.flatnonzero(self._alive)
+            matrix_tmp = self._matrix_path.with_suffix(".f32.compact")
+            sidecar_tmp = self._sidecar_path.with_suffix(".jsonl.compact")
+            chunk = 65536
+            with open(matrix_tmp, "wb") as f:
+                for start in range(0, len(live), chunk):
+                    rows = live[start : start + chunk]
+                    f.write(np.ascontiguousarray(self._matrix[rows]).tobytes())
+            with open(sidecar_tmp, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"dim": self._dim}) + "\n")
+                for new_row, row in enumerate(live):
+                    record = {
+                        "id": self._ids[row],
+                        "row": new_row,
+                        "metadata": self._metadatas[row],
+                    }
+                    f.write(json.dumps(record) + "\n")
+
+            # release the memory map before replacing the file
+            self._matrix = None
+            os.replace(matrix_tmp, self._matrix_path)
+            os.replace(sidecar_tmp, self._sidecar_path)
+            self._load()
+
+    def drop(self):
+        """Delete entire collection from vector stores"""
+        with self._lock:
+            self._matrix = None
+            self._matrix_path.unlink(missing_ok=True)
+            self._sidecar_path.unlink(missing_ok=True)
+            self._reset()
+
+    def __persist_flow__(self):
+        return {
+            "path": str(self._path),
+            "collection_name": self._collection_name,
+        }
@@ -94,6 +94,10 @@ class MilvusVectorStore(LlamaIndexVectorStore):
         self._lazy_init()
         super().delete(ids=ids, **kwargs)
 
+    def delete_by_file_ids(self, file_ids: list[str], **kwargs):
+        self._lazy_init()
+        super().delete_by_file_ids(file_ids=file_ids, **kwargs)
+
     def drop(self):
         self._client.client.drop_collection(self._collection_name)
 
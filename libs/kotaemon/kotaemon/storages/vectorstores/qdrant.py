@@ -55,6 +55,9 @@ class QdrantVectorStore(LlamaIndexVectorStore):
         """
         from qdrant_client import models
 
+        if not ids:
+            return
+
         self._client.client.delete(
             collection_name=self._collection_name,
             points_selector=models.PointIdsList(
@@ -63,6 +66,32 @@ class QdrantVectorStore(LlamaIndexVectorStore):
             **kwargs,
         )
 
+    def delete_by_file_ids(self, file_ids: List[str], **kwargs):
+        """Delete the vector embeddings whose `file_id` metadata is in `file_ids`
+
+        Args:
+            file_ids: List of ids of the files whose embeddings are to be deleted
+            kwargs: meant for vectorstore-specific parameters
+        """
+        from qdrant_client import models
+
+        if not file_ids:
+            return
+
+        self._client.client.delete(
+            collection_name=self._collection_name,
+            points_selector=models.FilterSelector(
+                filter=models.Filter(
+                    must=[
+                        models.FieldCondition(
+                            key="file_id", match=models.MatchAny(any=file_ids)
+                        )
+                    ]
+                )
+            ),
+            **kwargs,
+        )
+
     def drop(self):
         """Delete entire collection from vector stores"""
         self._client.client.delete_collection(self._collection_name)
@@ -58,6 +58,11 @@ class SimpleFileVectorStore(LlamaIndexVectorStore):
         self._client.persist(str(self._save_path), self._fs)
         return r
 
+    def delete_by_file_ids(self, file_ids: list[str], **kwargs):
+        r = super().delete_by_file_ids(file_ids, **kwargs)
+        self._client.persist(str(self._save_path), self._fs)
+        return r
+
     def drop(self):
         self._data = SimpleVectorStoreData()
         self._save_path.unlink(missing_ok=True)
@@ -0,0 +1,9 @@
+from .concurrency import map_concurrently
+from .http import get_openai_client, get_session, post_json
+
+__all__ = [
+    "get_openai_client",
+    "get_session",
+    "map_concurrently",
+    "post_json",
+]
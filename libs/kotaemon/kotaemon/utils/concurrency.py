@@ -0,0 +1,40 @@
+"""Helpers to run blocking calls, e.g. HTTP requests, concurrently"""
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def map_concurrently(
+    func: Callable[[T], R], items: Iterable[T], concurrency: int = 4
+) -> Iterator[R]:
+    """Apply func to the items in threads, yielding the results in order
+
+    At most `concurrency` calls are in flight, the next item is only taken once a
+    call finishes.
+    """
+    if concurrency <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending: dict[int, Future] = {}
+        done_results: dict[int, R] = {}
+        next_to_yield = 0
+        for idx, item in enumerate(items):
+            if len(pending) >= concurrency:
+                done, _ = wait(pending.values(), return_when=FIRST_COMPLETED)
+                for key in [k for k, f in pending.items() if f in done]:
+                    done_results[key] = pending.pop(key).result()
+                while next_to_yield in done_results:
+                    yield done_results.pop(next_to_yield)
+                    next_to_yield += 1
+            pending[idx] = executor.submit(func, item)
+
+        for key in sorted(pending):
+            done_results[key] = pending[key].result()
+        while next_to_yield in done_results:
+            yield done_results.pop(next_to_yield)
+            next_to_yield += 1
@@ -0,0 +1,151 @@
+"""Keep-alive HTTP clients shared by the models calling remote endpoints
+
+Requests to the same host reuse the connections of a process-wide session. The
+OpenAI clients are likewise kept process-wide, each with its own pool.
+"""
+import asyncio
+import importlib.util
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from tenacity import (
+    retry,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_random_exponential,
+)
+from theflow.settings import settings as flowsettings
+
+RETRY_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+OPENAI_CLIENTS_CACHE_SIZE = 32
+
+_sessions: dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(url: str, pool_size: int = 16) -> requests.Session:
+    """Get the keep-alive session shared by all requests to the host of url"""
+    parts = urlsplit(url)
+    host = f"{parts.scheme}://{parts.netloc}"
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount(host, adapter)
+            _sessions[host] = session
+        return session
+
+
+_openai_clients: OrderedDict[tuple, Any] = OrderedDict()
+_async_openai_clients: "weakref.WeakKeyDictionary[Any, OrderedDict[tuple, Any]]" = (
+    weakref.WeakKeyDictionary()
+)
+_openai_clients_lock = threading.Lock()
+
+
+def _make_httpx_client(async_version: bool) -> Any:
+    """Make the keep-alive HTTP client of an OpenAI client"""
+    import httpx
+    from openai import DefaultAsyncHttpxClient, DefaultHttpxClient
+
+    limits = httpx.Limits(
+        max_connections=getattr(flowsettings, "KH_OPENAI_MAX_CONNECTIONS", 64),
+        max_keepalive_connections=getattr(
+            flowsettings, "KH_OPENAI_MAX_KEEPALIVE_CONNECTIONS", 16
+        ),
+        keepalive_expiry=getattr(flowsettings, "KH_OPENAI_KEEPALIVE_EXPIRY", 60),
+    )
+    # HTTP/2 needs the optional `h2` package
+    http2 = (
+        getattr(flowsettings, "KH_OPENAI_HTTP2", True)
+        and importlib.util.find_spec("h2") is not None
+    )
+    client_class = DefaultAsyncHttpxClient if async_version else DefaultHttpxClient
+    return client_class(limits=limits, http2=http2)
+
+
+def get_openai_client(client_class: type, **params) -> Any:
+    """Get the process-wide OpenAI client of the class and parameters
+
+    The clients are kept per class and parameters (base url, api key,
+    organization, timeout...), so the requests made with the same ones reuse the
+    keep-alive connections. The async clients are also kept per event loop, as
+    their connections are bound to it. Only the `OPENAI_CLIENTS_CACHE_SIZE` most
+    recently used clients are kept, e.g. when the api keys are edited.
+
+    Args:
+        client_class: the class of the client, e.g. `openai.OpenAI`
+        params: the parameters to construct the client
+    """
+    from openai import AsyncOpenAI
+
+    key = (client_class, tuple(sorted(params.items())))
+    try:
+        hash(key)
+    except TypeError:
+        return client_class(**params)
+
+    async_version = issubclass(client_class, AsyncOpenAI)
+    with _openai_clients_lock:
+        if async_version:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return client_class(**params)
+            clients = _async_openai_clients.setdefault(loop, OrderedDict())
+        else:
+            clients = _openai_clients
+
+        client = clients.get(key)
+        if client is None:
+            client = client_class(
+                http_client=_make_httpx_client(async_version), **params
+            )
+            clients[key] = client
+            # the evicted clients are closed once the models using them are gone
+            while len(clients) > OPENAI_CLIENTS_CACHE_SIZE:
+                clients.popitem(last=False)
+        else:
+            clients.move_to_end(key)
+        return client
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code in RETRY_STATUS_CODES
+    return False
+
+
+def post_json(
+    url: str,
+    payload: dict,
+    timeout: Optional[float] = 60,
+    max_retries: int = 3,
+    pool_size: int = 16,
+) -> Any:
+    """POST a JSON payload and return the decoded response
+
+    Connection errors, timeouts, rate limits and server errors are retried with a
+    randomized exponential backoff, other errors are raised immediately.
+    """
+
+    @retry(
+        retry=retry_if_exception(_is_retryable),
+        wait=wait_random_exponential(multiplier=0.5, max=20),
+        stop=stop_after_attempt(max_retries + 1),
+        reraise=True,
+    )
+    def _post():
+        response = get_session(url, pool_size).post(url, json=payload, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    return _post()
@@ -0,0 +1,80 @@
+import random
+import time
+from difflib import SequenceMatcher
+
+from kotaemon.indices.qa.utils import EvidenceIndex, find_start_end_phrase, find_text
+
+
+def _sequence_matcher_longest_match(phrase, context):
+    match = SequenceMatcher(
+        None, phrase, context.replace("\n", " "), autojunk=False
+    ).find_longest_match()
+    return match.b, match.size
+
+
+def test_evidence_index_same_as_sequence_matcher():
+    rng = random.Random(0)
+    for _ in range(200):
+        context = "".join(rng.choice("ab c\n") for _ in range(rng.randint(0, 80)))
+        phrase = "".join(rng.choice("abc ") for _ in range(rng.randint(0, 20)))
+        assert EvidenceIndex(context).longest_match(
+            phrase
+        ) == _sequence_matcher_longest_match(phrase, context)
+
+
+def test_find_text():
+    context = "The quick brown fox\njumps over the lazy dog. It barked."
+    span = "quick brown fox jumps\nthe lazy dog barked"
+
+    matches = find_text(span, context)
+
+    assert [context.replace("\n", " ")[s:e] for s, e in matches] == [
+        "quick brown fox jumps",
+        "the lazy dog",
+    ]
+    assert find_text("fox", context) == [], "Expect short spans skipped"
+
+
+def test_find_start_end_phrase():
+    context = "Alpha beta gamma delta. Epsilon zeta eta theta."
+
+    match, length = find_start_end_phrase("beta gamma", "zeta eta", context)
+
+    assert match == (6, 40)
+    assert length == len("beta gamma") + len("zeta eta")
+
+
+def benchmark(n_docs: int = 10, doc_words: int = 1500, n_quotes: int = 5):
+    """Compare the evidence index with the SequenceMatcher scan it replaces"""
+    rng = random.Random(0)
+    vocab = [
+        "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(6))
+        for _ in range(2000)
+    ]
+    docs = [" ".join(rng.choices(vocab, k=doc_words)) for _ in range(n_docs)]
+    quotes = []
+    for _ in range(n_quotes):
+        doc = rng.choice(docs)
+        start = rng.randint(0, len(doc) - 200)
+        quotes.append(doc[start : start + 200])
+
+    s_time = time.time()
+    expected = [
+        _sequence_matcher_longest_match(quote, doc) for quote in quotes for doc in docs
+    ]
+    difflib_time = time.time() - s_time
+
+    get_index_time = time.time()
+    indexes = [EvidenceIndex(doc) for doc in docs]
+    s_time = time.time()
+    output = [index.longest_match(quote) for quote in quotes for index in indexes]
+    match_time = time.time() - s_time
+    build_time = s_time - get_index_time
+
+    assert output == expected
+    print(f"SequenceMatcher: {difflib_time:.3f}s")
+    print(f"EvidenceIndex: {build_time:.3f}s to build, {match_time:.3f}s to match")
+
+
+if __name__ == "__main__":
+    benchmark()
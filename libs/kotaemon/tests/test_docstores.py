@@ -8,6 +8,7 @@ from kotaemon.base import Document
 from kotaemon.storages import (
     ElasticsearchDocumentStore,
     InMemoryDocumentStore,
+    LanceDBDocumentStore,
     SimpleFileDocumentStore,
 )
 
@@ -322,6 +323,120 @@ def test_simplefile_document_store_base_interfaces(tmp_path):
     os.remove(tmp_path / "default.json")
 
 
+def test_simplefile_document_store_append_only(tmp_path):
+    """Test the log-structured mode of the simple file document store"""
+
+    store = SimpleFileDocumentStore(path=tmp_path, append_only=True)
+    docs = [
+        Document(text=f"Sample text {idx}", metadata={"meta_key": f"meta_value_{idx}"})
+        for idx in range(10)
+    ]
+
+    store.add(docs)
+    assert store.count() == 10, "Document store should have 10 documents"
+    assert not (tmp_path / "default.json").exists(), "JSON should not be written"
+
+    with pytest.raises(ValueError):
+        store.add(docs[0])
+
+    store.add(Document(text="Updated text", id_=docs[0].doc_id), exist_ok=True)
+    assert store.get(docs[0].doc_id)[0].text == "Updated text"
+
+    store.delete([docs[1].doc_id, docs[2].doc_id])
+    assert store.count() == 8, "Document store should have 8 documents"
+
+    # Test reopen from the segment file
+    store2 = SimpleFileDocumentStore(path=tmp_path, append_only=True)
+    assert store2.count() == 8, "Reopened document store should have 8 documents"
+    assert store2.get(docs[3].doc_id)[0].metadata == {"meta_key": "meta_value_3"}
+
+    # Test compaction keeps the live documents only
+    size_before = (tmp_path / "default.log").stat().st_size
+    store2.compact()
+    assert (tmp_path / "default.log").stat().st_size < size_before
+    assert sorted(doc.text for doc in store2.get_all()) == sorted(
+        ["Updated text"] + [doc.text for doc in docs[3:]]
+    )
+
+    # Test save and load keep the JSON format
+    store2.save(tmp_path / "store.json")
+    store3 = InMemoryDocumentStore()
+    store3.load(tmp_path / "store.json")
+    assert store3.count() == 8, "Loaded document store should have 8 documents"
+
+    # Test import of an existing JSON store
+    store4 = SimpleFileDocumentStore(
+        path=tmp_path, collection_name="store", append_only=True
+    )
+    assert store4.count() == 8, "Imported document store should have 8 documents"
+
+
+def test_lancedb_document_store_deferred_fts(tmp_path):
+    """Test the full-text index refresh is deferred until flushed"""
+
+    def fts_stats(store):
+        table = store.db_connection.open_table(store.collection_name)
+        return table.index_stats(table.list_indices()[0].name)
+
+    store = LanceDBDocumentStore(
+        path=str(tmp_path),
+        fts_refresh="deferred",
+        query_consistency="eventual",
+    )
+    docs = [
+        Document(text=f"Sample text about cats {idx}", metadata={"idx": idx})
+        for idx in range(10)
+    ]
+    store.add(docs[:5])
+    store.flush_indices()
+    assert fts_stats(store).num_indexed_rows == 5
+
+    # the new rows wait for the next flush, but are still searchable
+    store.add(docs[5:])
+    assert fts_stats(store).num_unindexed_rows == 5
+    assert len(store.query("cats", top_k=20)) == 10
+
+    # the index is updated incrementally
+    store.flush_indices()
+    stats = fts_stats(store)
+    assert (stats.num_indexed_rows, stats.num_unindexed_rows) == (10, 0)
+
+    store.delete([docs[0].doc_id])
+    assert len(store.query("cats", top_k=20)) == 9
+
+    # strong consistency flushes before querying
+    store.query_consistency = "strong"
+    store.add([Document(text="Dogs")])
+    assert store.query("dogs")[0].text == "Dogs"
+    assert fts_stats(store).num_unindexed_rows == 0
+
+
+def test_lancedb_document_store_quoted_ids(tmp_path):
+    """Test the ids with quotes are escaped in the filters"""
+    store = LanceDBDocumentStore(path=str(tmp_path))
+    docs = [
+        Document(
+            id_=f"it's {idx}",
+            text=f"Sample text about cats {idx}",
+            metadata={"file_id": f"file's {idx % 2}"},
+        )
+        for idx in range(4)
+    ]
+    store.add(docs)
+
+    results = store.query("cats", top_k=10, file_ids=["file's 0", "other"])
+    assert sorted(doc.doc_id for doc in results) == ["it's 0", "it's 2"]
+    results = store.query("cats", top_k=10, doc_ids=["it's 1"])
+    assert [doc.doc_id for doc in results] == ["it's 1"]
+    # a quote can't widen the filter
+    assert store.query("cats", file_ids=["x') or ('1'='1"]) == []
+
+    assert [doc.doc_id for doc in store.get(["it's 3"])] == ["it's 3"]
+    store.delete(["it's 3"])
+    assert store.get(["it's 3"]) == []
+    assert len(store.query("cats", top_k=10)) == 3
+
+
 @patch(
     "elastic_transport.Transport.perform_request",
     side_effect=_elastic_search_responses,
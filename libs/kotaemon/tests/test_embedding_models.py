@@ -2,15 +2,19 @@ import json
 from pathlib import Path
 from unittest.mock import patch
 
+import pytest
+import requests
 from openai.types.create_embedding_response import CreateEmbeddingResponse
 
 from kotaemon.base import Document
 from kotaemon.embeddings import (
     AzureOpenAIEmbeddings,
+    EndpointEmbeddings,
     FastEmbedEmbeddings,
     LCCohereEmbeddings,
     LCHuggingFaceEmbeddings,
     OpenAIEmbeddings,
+    TeiEndpointEmbeddings,
 )
 
 from .conftest import (
@@ -155,3 +159,40 @@ def test_fastembed_embeddings():
     model = FastEmbedEmbeddings()
     output = model("Hello World")
     assert_embedding_result(output)
+
+
+def _tei_embed_response(*args, **kwargs):
+    response = requests.Response()
+    response.status_code = 200
+    inputs = kwargs["json"]["inputs"]
+    response._content = json.dumps([[float(len(text))] for text in inputs]).encode()
+    return response
+
+
+@patch("requests.Session.post", side_effect=_tei_embed_response)
+def test_tei_endpoint_embeddings_batch(tei_call):
+    model = TeiEndpointEmbeddings(
+        endpoint_url="http://tei.local/embed", batch_size=2, concurrency=3
+    )
+    texts = ["a" * i for i in range(1, 8)]
+    output = model(texts)
+
+    assert_embedding_result(output)
+    assert tei_call.call_count == 4, "Expect 7 texts sent in batches of 2"
+    assert [doc.embedding[0] for doc in output] == [float(len(t)) for t in texts]
+
+
+def _short_endpoint_response(*args, **kwargs):
+    response = requests.Response()
+    response.status_code = 200
+    inputs = kwargs["json"]["input"]
+    data = [{"index": idx, "embedding": [0.1]} for idx in range(len(inputs) - 1)]
+    response._content = json.dumps({"data": data}).encode()
+    return response
+
+
+@patch("requests.Session.post", side_effect=_short_endpoint_response)
+def test_endpoint_embeddings_short_response(endpoint_call):
+    model = EndpointEmbeddings(endpoint_url="http://endpoint.local/v1/embeddings")
+    with pytest.raises(ValueError):
+        model(["Hello", "World"])
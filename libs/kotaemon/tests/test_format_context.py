@@ -0,0 +1,66 @@
+from kotaemon.base import RetrievedDocument
+from kotaemon.indices.qa.format_context import (
+    EVIDENCE_MODE_TABLE,
+    EVIDENCE_MODE_TEXT,
+    PrepareEvidencePipeline,
+)
+
+
+def test_prepare_evidence():
+    docs = [
+        RetrievedDocument(text="Hello world", metadata={"file_name": "a.pdf"}),
+        RetrievedDocument(text="Hello world", metadata={"file_name": "b.pdf"}),
+        RetrievedDocument(
+            text="table",
+            metadata={"file_name": "a.pdf", "type": "table", "table_origin": "|a|"},
+        ),
+    ]
+
+    output = PrepareEvidencePipeline()(docs)
+    evidence_mode, evidence, images = output.content
+
+    assert evidence_mode == EVIDENCE_MODE_TABLE
+    assert evidence.count("Hello world") == 1, "Expect duplicated content skipped"
+    assert "<b>Table from a.pdf</b>" in evidence
+    assert images == []
+    assert output.metadata["num_tokens"] > 0
+    assert not output.metadata["truncated"]
+
+
+def test_prepare_evidence_truncate():
+    docs = [
+        RetrievedDocument(text=f"word {i} " * 50, metadata={"file_name": f"{i}.pdf"})
+        for i in range(10)
+    ]
+
+    output = PrepareEvidencePipeline(max_context_length=100)(docs)
+    evidence_mode, evidence, _ = output.content
+
+    assert evidence_mode == EVIDENCE_MODE_TEXT
+    assert 90 < output.metadata["num_tokens"] <= 100
+    assert output.metadata["truncated"]
+    assert "1.pdf" not in evidence
+
+
+def test_prepare_evidence_truncate_whole_words():
+    def evidence_of(text, max_context_length):
+        docs = [RetrievedDocument(text=text, metadata={"file_name": "a.pdf"})]
+        output = PrepareEvidencePipeline(max_context_length=max_context_length)(docs)
+        return output.content[1], output.metadata
+
+    full, metadata = evidence_of("unbelievably " * 20, 1000)
+    for max_tokens in range(1, metadata["num_tokens"]):
+        evidence, metadata = evidence_of("unbelievably " * 20, max_tokens)
+        assert full.startswith(evidence)
+        assert metadata["num_tokens"] <= max_tokens
+        # the words are never split, unless there is no whole word to keep
+        words = evidence.split()
+        if len(words) > 1:
+            assert words == full.split()[: len(words)]
+
+    # a character spanning several tokens is never split
+    full, metadata = evidence_of("😀" * 20, 1000)
+    for max_tokens in range(1, metadata["num_tokens"]):
+        evidence, _ = evidence_of("😀" * 20, max_tokens)
+        assert "\ufffd" not in evidence
+        assert full.startswith(evidence)
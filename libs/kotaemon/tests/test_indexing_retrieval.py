@@ -6,9 +6,14 @@ from unittest.mock import patch
 from openai.types.create_embedding_response import CreateEmbeddingResponse
 
 from kotaemon.base import Document
-from kotaemon.embeddings import AzureOpenAIEmbeddings
+from kotaemon.embeddings import AzureOpenAIEmbeddings, EmbeddingCache
 from kotaemon.indices import VectorIndexing, VectorRetrieval
-from kotaemon.storages import ChromaVectorStore, InMemoryDocumentStore
+from kotaemon.indices.cache import query_embedding_cache
+from kotaemon.storages import (
+    ChromaVectorStore,
+    InMemoryDocumentStore,
+    LanceDBDocumentStore,
+)
 
 with open(Path(__file__).parent / "resources" / "embedding_openai.json") as f:
     openai_embedding = CreateEmbeddingResponse.model_validate(json.load(f))
@@ -65,3 +70,123 @@ def test_retrieving(tmp_path):
 
     assert len(output) == 1, "Expect 1 results"
     assert output == output1, "Expect identical results"
+
+
+@patch(
+    "openai.resources.embeddings.Embeddings.create",
+    side_effect=lambda *args, **kwargs: openai_embedding,
+)
+def test_retrieving_fusion(tmp_path):
+    db = ChromaVectorStore(path=str(tmp_path))
+    doc_store = InMemoryDocumentStore()
+    embedding = AzureOpenAIEmbeddings(
+        azure_deployment="text-embedding-ada-002",
+        azure_endpoint="https://test.openai.azure.com/",
+        api_key="some-key",
+        api_version="version",
+    )
+
+    index_pipeline = VectorIndexing(
+        vector_store=db, embedding=embedding, doc_store=doc_store
+    )
+    retrieval_pipeline = VectorRetrieval(
+        vector_store=db,
+        doc_store=doc_store,
+        embedding=embedding,
+        retrieval_mode="fusion",
+    )
+
+    doc = Document(text="Hello world")
+    index_pipeline(text=doc)
+    with patch.object(doc_store, "query", return_value=[doc]):
+        output = retrieval_pipeline(text="Hello world")
+
+    assert len(output) == 1, "Expect the text and vector hits to be merged"
+    assert output[0].score == 2 / (retrieval_pipeline.rrf_k + 1)
+
+
+def test_retrieving_file_scope(tmp_path):
+    db = ChromaVectorStore(path=str(tmp_path / "vectorstore"))
+    doc_store = LanceDBDocumentStore(path=str(tmp_path / "docstore"))
+    embedding = AzureOpenAIEmbeddings(
+        azure_deployment="text-embedding-ada-002",
+        azure_endpoint="https://test.openai.azure.com/",
+        api_key="some-key",
+        api_version="version",
+    )
+    retrieval_pipeline = VectorRetrieval(
+        vector_store=db,
+        doc_store=doc_store,
+        embedding=embedding,
+        retrieval_mode="text",
+    )
+    doc_store.add(
+        [
+            Document(text=f"Hello world {idx}", metadata={"file_id": file_id})
+            for idx, file_id in enumerate(["a", "b", "a", "c"])
+        ]
+    )
+
+    assert doc_store.supports_file_filter(), "Expect LanceDB to filter by file"
+    assert not InMemoryDocumentStore().supports_file_filter()
+
+    output = retrieval_pipeline(text="hello", top_k=10, file_scope=["a", "c"])
+    assert sorted(doc.metadata["file_id"] for doc in output) == ["a", "a", "c"]
+
+
+def test_retrieving_query_embedding_cache(tmp_path):
+    db = ChromaVectorStore(path=str(tmp_path))
+    doc_store = InMemoryDocumentStore()
+    embedding = AzureOpenAIEmbeddings(
+        azure_deployment="text-embedding-ada-002",
+        azure_endpoint="https://test.openai.azure.com/",
+        api_key="some-key",
+        api_version="version",
+    )
+    retrieval_pipeline = VectorRetrieval(
+        vector_store=db, doc_store=doc_store, embedding=embedding
+    )
+    query_embedding_cache.clear()
+
+    with patch(
+        "openai.resources.embeddings.Embeddings.create",
+        side_effect=lambda *args, **kwargs: openai_embedding,
+    ) as create:
+        VectorIndexing(vector_store=db, embedding=embedding, doc_store=doc_store)(
+            text=Document(text="Hello world")
+        )
+        output = retrieval_pipeline(text="Hello world")
+        output1 = retrieval_pipeline(text="  Hello   world ")
+        assert create.call_count == 2, "Expect the second query embedding cached"
+
+    assert output == output1, "Expect identical results"
+    assert query_embedding_cache.stats()["hits"] == 1
+
+
+def test_indexing_embedding_cache(tmp_path):
+    db = ChromaVectorStore(path=str(tmp_path / "vectorstore"))
+    doc_store = InMemoryDocumentStore()
+    embedding = AzureOpenAIEmbeddings(
+        azure_deployment="text-embedding-ada-002",
+        azure_endpoint="https://test.openai.azure.com/",
+        api_key="some-key",
+        api_version="version",
+    )
+    pipeline = VectorIndexing(
+        vector_store=db,
+        embedding=embedding,
+        doc_store=doc_store,
+        embedding_cache_path=str(tmp_path / "embedding_cache.db"),
+    )
+
+    with patch(
+        "openai.resources.embeddings.Embeddings.create",
+        side_effect=lambda *args, **kwargs: openai_embedding,
+    ) as create:
+        pipeline(text=Document(text="Hello world"))
+        pipeline(text=Document(text="Hello world"))
+        assert create.call_count == 1, "Expect the second embedding cached"
+
+    cache = EmbeddingCache(tmp_path / "embedding_cache.db")
+    assert cache.count() == 1
+    assert cast(ChromaVectorStore, pipeline.vector_store)._collection.count() == 2
@@ -4,7 +4,8 @@ from unittest.mock import patch
 import pytest
 
 from kotaemon.base.schema import AIMessage, HumanMessage, LLMInterface, SystemMessage
-from kotaemon.llms import AzureChatOpenAI, LlamaCppChat
+from kotaemon.embeddings import OpenAIEmbeddings
+from kotaemon.llms import AzureChatOpenAI, ChatOpenAI, LlamaCppChat
 
 try:
     pass
@@ -73,6 +74,35 @@ def test_azureopenai_model(openai_completion):
     openai_completion.assert_called()
 
 
+def test_openai_clients_are_shared():
+    params = {"api_key": "dummy", "base_url": "http://localhost:8000/v1"}
+    client = ChatOpenAI(model="gpt-4o", **params).prepare_client()
+
+    # the same connection settings share the client, whatever the model
+    assert ChatOpenAI(model="gpt-4o-mini", **params).prepare_client() is client
+    assert OpenAIEmbeddings(model="embedding", **params).prepare_client() is client
+    assert (
+        ChatOpenAI(model="gpt-4o", **params, timeout=10).prepare_client() is not client
+    )
+    assert ChatOpenAI(model="gpt-4o", api_key="other").prepare_client() is not client
+
+
+def test_openai_clients_cache_size():
+    from kotaemon.utils import http
+
+    with patch.object(http, "OPENAI_CLIENTS_CACHE_SIZE", 2), patch.dict(
+        http._openai_clients, clear=True
+    ):
+        first = ChatOpenAI(model="gpt-4o", api_key="first").prepare_client()
+        ChatOpenAI(model="gpt-4o", api_key="second").prepare_client()
+        # the first client is used again, the second is the least recently used
+        assert ChatOpenAI(model="gpt-4o", api_key="first").prepare_client() is first
+        ChatOpenAI(model="gpt-4o", api_key="third").prepare_client()
+
+        assert len(http._openai_clients) == 2
+        assert ChatOpenAI(model="gpt-4o", api_key="first").prepare_client() is first
+
+
 @skip_llama_cpp_not_installed
 def test_llamacpp_chat():
     from llama_cpp import Llama
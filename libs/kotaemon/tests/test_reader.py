@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 from unittest.mock import patch
 
@@ -11,8 +12,15 @@ from kotaemon.loaders import (
     DocxReader,
     HtmlReader,
     MhtmlReader,
+    PDFThumbnailReader,
     UnstructuredReader,
 )
+from kotaemon.loaders.pdf_loader import (
+    _get_render_pool,
+    evict_page_thumbnails,
+    load_image_origin,
+    save_page_thumbnails,
+)
 
 from .conftest import skip_when_unstructured_pdf_not_installed
 
@@ -54,6 +62,76 @@ def test_pdf_reader():
     assert len(nodes) > 0
 
 
+def test_pdf_thumbnail_reader_stores_files(tmp_path):
+    reader = PDFThumbnailReader(thumbnail_dir=tmp_path)
+    dirpath = Path(__file__).parent
+    documents = reader.load_data(dirpath / "resources" / "dummy.pdf")
+
+    thumbnails = [doc for doc in documents if doc.metadata.get("type") == "thumbnail"]
+    assert len(thumbnails) == 1
+
+    image_path = Path(thumbnails[0].metadata["image_origin"])
+    assert image_path.parent == tmp_path
+    assert image_path.is_file()
+    assert load_image_origin(str(image_path)).startswith("data:image/jpeg;base64,")
+
+    # the thumbnails are content-addressed
+    reader.load_data(dirpath / "resources" / "dummy.pdf")
+    assert list(tmp_path.iterdir()) == [image_path]
+
+
+def test_save_page_thumbnails_shares_the_pool(tmp_path):
+    pdf_path = Path(__file__).parent / "resources" / "dummy.pdf"
+    _get_render_pool.cache_clear()
+
+    # a single range of pages is rendered in-process
+    paths = save_page_thumbnails(pdf_path, [0], tmp_path, max_workers=2)
+    assert _get_render_pool.cache_info().currsize == 0
+
+    for _ in range(2):
+        assert (
+            save_page_thumbnails(
+                pdf_path, [0, 0], tmp_path, max_workers=2, pages_per_worker=1
+            )
+            == paths * 2
+        )
+    # the rendering processes are created once
+    assert _get_render_pool.cache_info().misses == 1
+    _get_render_pool(2).shutdown()
+    _get_render_pool.cache_clear()
+
+
+def test_evict_page_thumbnails(tmp_path):
+    for idx, name in enumerate(["old.jpeg", "recent.jpeg", "new.jpeg"]):
+        (tmp_path / name).write_bytes(b"x" * 10)
+        os.utime(tmp_path / name, (idx, idx))
+
+    evict_page_thumbnails(tmp_path, 0)
+    assert len(list(tmp_path.iterdir())) == 3
+
+    evict_page_thumbnails(tmp_path, 25)
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "new.jpeg",
+        "recent.jpeg",
+    ]
+
+    # the thumbnails evicted since parsing are rendered again
+    from kotaemon.loaders.cache import ParseCache
+
+    cache = ParseCache(tmp_path / "parse_cache")
+    docs = [
+        Document(
+            text="Page thumbnail",
+            metadata={"type": "thumbnail", "image_origin": str(tmp_path / name)},
+        )
+        for name in ["new.jpeg", "recent.jpeg"]
+    ]
+    cache.set("key", docs)
+    assert cache.get("key") is not None
+    evict_page_thumbnails(tmp_path, 15)
+    assert cache.get("key") is None
+
+
 @skip_when_unstructured_pdf_not_installed
 def test_unstructured_pdf_reader():
     reader = UnstructuredReader()
@@ -93,3 +171,71 @@ def test_azureai_document_intelligence_reader(mock_client):
 
     assert len(docs) == 1
     mock_client.assert_called_once()
+
+
+def test_figures_rendered_per_page_and_captions_cached():
+    import fitz
+
+    from kotaemon.loaders.utils.figures import (
+        caption_figures,
+        crop_figures,
+        image_to_base64,
+    )
+
+    file_path = Path(__file__).parent / "resources" / "dummy.pdf"
+    regions = [(0, [0.0, 0.0, 0.5, 0.5]), (0, [0.5, 0.5, 1.0, 1.0])]
+    with patch.object(
+        fitz.Page, "get_pixmap", autospec=True, side_effect=fitz.Page.get_pixmap
+    ) as get_pixmap:
+        images = crop_figures(file_path, regions)
+    get_pixmap.assert_called_once()
+    assert len(images) == 2
+
+    figures = [image_to_base64(images[0])] * 3 + [image_to_base64(images[1])]
+    with patch(
+        "kotaemon.loaders.utils.figures.generate_single_figure_caption",
+        side_effect=lambda endpoint, figure: f"caption {len(figure)}",
+    ) as generate:
+        captions = caption_figures("http://vlm", figures, max_workers=1)
+    assert captions[:3] == [f"caption {len(figures[0])}"] * 3
+    assert generate.call_count == 2
+
+
+def test_parse_cache(tmp_path):
+    from kotaemon.loaders.cache import ParseCache
+
+    cache = ParseCache(tmp_path)
+    reader = PDFThumbnailReader()
+    key = ParseCache.make_key("filehash", reader)
+    assert key == ParseCache.make_key("filehash", PDFThumbnailReader())
+    assert key != ParseCache.make_key("otherhash", reader)
+    assert key != ParseCache.make_key(
+        "filehash", PDFThumbnailReader(thumbnail_dir=str(tmp_path))
+    )
+    assert key != ParseCache.make_key("filehash", DocxReader())
+    assert cache.get(key) is None
+
+    docs = [
+        Document(text="page 1", metadata={"page_label": 1, "file_id": "a"}),
+        Document(text="page 2", metadata={"page_label": 2, "file_id": "a"}),
+    ]
+    cache.set(key, docs)
+    cached = cache.get(key, extra_info={"file_id": "b"})
+    assert [doc.text for doc in cached] == ["page 1", "page 2"]
+    assert [doc.metadata for doc in cached] == [
+        {"page_label": 1, "file_id": "b"},
+        {"page_label": 2, "file_id": "b"},
+    ]
+    assert {doc.doc_id for doc in cached}.isdisjoint(doc.doc_id for doc in docs)
+
+    # the least recently used entries are evicted beyond the size limit
+    entry_path = tmp_path / f"{key}.json.gz"
+    os.utime(entry_path, (0, 0))
+    cache.max_size = entry_path.stat().st_size
+    cache.set("other", docs)
+    assert cache.get(key) is None
+    assert cache.get("other") is not None
+
+    # empty results are not cached
+    cache.set("empty", [])
+    assert cache.get("empty") is None
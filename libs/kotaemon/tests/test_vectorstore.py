@@ -2,11 +2,14 @@ import json
 import os
 
 import pytest
+from llama_index.core.vector_stores import MetadataFilter, MetadataFilters
 
 from kotaemon.base import DocumentWithEmbedding
 from kotaemon.storages import (
     ChromaVectorStore,
     InMemoryVectorStore,
+    LanceDBVectorStore,
+    MemmapVectorStore,
     MilvusVectorStore,
     QdrantVectorStore,
     SimpleFileVectorStore,
@@ -55,6 +58,16 @@ class TestChromaVectorStore:
         db.delete(ids=["c"])
         assert db._collection.count() == 0, "Expected 0 remaining entry"
 
+    def test_delete_by_file_ids(self, tmp_path):
+        db = ChromaVectorStore(path=str(tmp_path))
+
+        embeddings = [[0.1, 0.2, 0.3], [0.4, 0.5, 0.6], [0.7, 0.8, 0.9]]
+        metadatas = [{"file_id": "x"}, {"file_id": "y"}, {"file_id": "z"}]
+        db.add(embeddings=embeddings, metadatas=metadatas, ids=["a", "b", "c"])
+        db.delete_by_file_ids(["x", "z"])
+        assert db._collection.count() == 1, "Expected 1 remaining entry"
+        assert db._collection.get()["ids"] == ["b"]
+
     def test_query(self, tmp_path):
         db = ChromaVectorStore(path=str(tmp_path))
 
@@ -130,6 +143,16 @@ class TestInMemoryVectorStore:
             0.6,
         ], "load function does not load data completely"
 
+    def test_delete_by_file_ids(self):
+        embeddings = [[0.1, 0.2, 0.3], [0.4, 0.5, 0.6], [0.7, 0.8, 0.9]]
+        metadatas = [{"file_id": "x"}, {"file_id": "y"}, {"file_id": "x"}]
+        db = InMemoryVectorStore()
+        db.add(embeddings=embeddings, metadatas=metadatas, ids=["1", "2", "3"])
+        db.delete_by_file_ids(["x"])
+        assert list(db._client.data.embedding_dict) == ["2"]
+        db.delete(["2", "4"])
+        assert not db._client.data.embedding_dict
+
 
 class TestSimpleFileVectorStore:
     def test_add_delete(self, tmp_path):
@@ -159,6 +182,83 @@ class TestSimpleFileVectorStore:
         os.remove(tmp_path / collection_name)
 
 
+class TestMemmapVectorStore:
+    def test_add_query_delete(self, tmp_path):
+        embeddings = [[0.1, 0.2, 0.3], [0.4, 0.5, 0.6], [0.7, 0.8, 0.9]]
+        metadatas = [{"file_id": "x"}, {"file_id": "y"}, {"file_id": "y"}]
+        ids = ["a", "b", "c"]
+        db = MemmapVectorStore(path=tmp_path, collection_name="test")
+
+        output = db.add(embeddings=embeddings, metadatas=metadatas, ids=ids)
+        assert output == ids, "Expected output to be the same as ids"
+        assert db.count() == 3, "Expected 3 added entries"
+
+        _, sim, out_ids = db.query(embedding=[0.1, 0.2, 0.3], top_k=1)
+        assert abs(sim[0] - 1.0) < 1e-6
+        assert out_ids == ["a"]
+
+        filters = MetadataFilters(
+            filters=[MetadataFilter(key="file_id", value=["y"], operator="in")]
+        )
+        _, _, out_ids = db.query(embedding=[0.1, 0.2, 0.3], top_k=3, filters=filters)
+        assert sorted(out_ids) == ["b", "c"]
+
+        db.delete(["b"])
+        _, _, out_ids = db.query(embedding=[0.4, 0.5, 0.6], top_k=3)
+        assert "b" not in out_ids and len(out_ids) == 2
+
+        db2 = MemmapVectorStore(path=tmp_path, collection_name="test")
+        assert db2.count() == 2, "Expected 2 entries after reloading"
+        assert db2.get("c") == pytest.approx([0.7, 0.8, 0.9])
+
+        db2.compact()
+        assert (tmp_path / "test.f32").stat().st_size == 2 * 3 * 4
+        results = db2.query_batch([[0.1, 0.2, 0.3], [0.7, 0.8, 0.9]], top_k=1)
+        assert [out_ids for _, _, out_ids in results] == [["a"], ["c"]]
+
+        db2.delete_by_file_ids(["x"])
+        assert db2.count() == 1, "Expected 1 entry after deleting file x"
+        _, _, out_ids = db2.query(embedding=[0.1, 0.2, 0.3], top_k=3)
+        assert out_ids == ["c"]
+
+    def test_recover_torn_write(self, tmp_path):
+        db = MemmapVectorStore(path=tmp_path, collection_name="test")
+        db.add(embeddings=[[0.1, 0.2, 0.3], [0.4, 0.5, 0.6]], ids=["a", "b"])
+
+        # simulate a crash in the middle of writing a vector and its record
+        with open(tmp_path / "test.f32", "ab") as f:
+            f.write(b"\x00" * 5)
+        with open(tmp_path / "test.jsonl", "a", encoding="utf-8") as f:
+            f.write('{"id": "c", "row": 2, "meta')
+
+        db2 = MemmapVectorStore(path=tmp_path, collection_name="test")
+        assert db2.count() == 2, "Expected the torn entry to be dropped"
+        assert (tmp_path / "test.f32").stat().st_size == 2 * 3 * 4
+
+        db2.add(embeddings=[[0.7, 0.8, 0.9]], ids=["c"])
+        db3 = MemmapVectorStore(path=tmp_path, collection_name="test")
+        assert db3.count() == 3, "Expected 3 entries after reloading"
+        assert db3.get("c") == pytest.approx([0.7, 0.8, 0.9])
+        _, _, out_ids = db3.query(embedding=[0.7, 0.8, 0.9], top_k=1)
+        assert out_ids == ["c"]
+
+
+class TestLanceDBVectorStore:
+    def test_delete(self, tmp_path):
+        embeddings = [[0.1, 0.2, 0.3], [0.4, 0.5, 0.6], [0.7, 0.8, 0.9]]
+        metadatas = [{"file_id": "x"}, {"file_id": "y"}, {"file_id": "y"}]
+        db = LanceDBVectorStore(path=str(tmp_path))
+        db.delete(["a"])
+        db.add(embeddings=embeddings, metadatas=metadatas, ids=["a", "b", "c"])
+
+        db.delete_by_file_ids(["y"])
+        _, _, out_ids = db.query(embedding=[0.4, 0.5, 0.6], top_k=3)
+        assert out_ids == ["a"]
+
+        db.delete(["a"])
+        assert db._client._table.count_rows() == 0, "Expected 0 remaining entry"
+
+
 class TestMilvusVectorStore:
     def test_add(self, tmp_path):
         """Test that the DB add correctly"""
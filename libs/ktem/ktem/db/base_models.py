@@ -2,7 +2,7 @@ import datetime
 import uuid
 from typing import Optional
 
-from sqlalchemy import JSON, Column
+from sqlalchemy import JSON, Column, Index
 from sqlmodel import Field, SQLModel
 from tzlocal import get_localzone
 
@@ -44,6 +44,37 @@ class BaseConversation(SQLModel):
     )
 
 
+class BaseConversationTurn(SQLModel):
+    """Store a turn of a chat conversation, appended as the conversation goes
+
+    Attributes:
+        id: canonical id to identify the turn
+        conversation_id: the id of the conversation
+        position: the position of the turn in the conversation
+        message: the user message and the bot answer
+        retrieval: the retrieval panel of the answer
+        plot: the plot data of the answer
+        likes: the user feedbacks on the message
+        date_created: the date the turn was created
+    """
+
+    __table_args__ = (
+        Index("ix_conversation_turn_position", "conversation_id", "position"),
+        {"extend_existing": True},
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    conversation_id: str
+    position: int
+    message: list = Field(default=[], sa_column=Column(JSON))
+    retrieval: str = Field(default="")
+    plot: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    likes: list = Field(default=[], sa_column=Column(JSON))
+    date_created: datetime.datetime = Field(
+        default_factory=lambda: datetime.datetime.now(get_localzone())
+    )
+
+
 class BaseUser(SQLModel):
     """Store the user information
 
@@ -0,0 +1,187 @@
+"""Process-wide caches shared by the file index pipelines and UI"""
+import threading
+from collections import OrderedDict
+from copy import deepcopy
+from typing import Hashable, Optional
+
+from ktem.db.engine import engine
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from theflow.settings import settings
+
+from kotaemon.base import RetrievedDocument
+from kotaemon.indices.cache import TTLCache
+
+
+class FileChunkIdsCache:
+    """Cache the docstore chunk ids of each indexed file
+
+    The ids are read from the index table at most once per file and kept until the
+    file is indexed again or deleted, so scoping a retrieval to many selected files
+    doesn't query the database on every question.
+
+    Args:
+        max_files: maximum number of files to keep, least recently used files are
+            evicted first
+    """
+
+    def __init__(self, max_files: int = 4096):
+        self._max_files = max_files
+        self._lock = threading.Lock()
+        self._cache: OrderedDict[tuple[str, str], list[str]] = OrderedDict()
+
+    def get(self, Index, file_ids: list[str]) -> dict[str, list[str]]:
+        """Get the chunk ids of each file
+
+        Args:
+            Index: the SQLAlchemy Index table of the file index
+            file_ids: the ids of the files
+
+        Returns:
+            the mapping of file id to its chunk ids
+        """
+        table = Index.__tablename__
+        output: dict[str, list[str]] = {}
+        missing = []
+        with self._lock:
+            for file_id in file_ids:
+                key = (table, file_id)
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    output[file_id] = self._cache[key]
+                else:
+                    missing.append(file_id)
+
+        if not missing:
+            return output
+
+        fetched: dict[str, list[str]] = {file_id: [] for file_id in missing}
+        with Session(engine) as session:
+            stmt = select(Index.source_id, Index.target_id).where(
+                Index.relation_type == "document",
+                Index.source_id.in_(missing),
+            )
+            for source_id, target_id in session.execute(stmt):
+                fetched[source_id].append(target_id)
+
+        with self._lock:
+            for file_id, chunk_ids in fetched.items():
+                self._cache[(table, file_id)] = chunk_ids
+            while len(self._cache) > self._max_files:
+                self._cache.popitem(last=False)
+
+        output.update(fetched)
+        return output
+
+    def invalidate(self, Index, file_ids: list[str]):
+        """Drop the cached chunk ids of the files
+
+        Args:
+            Index: the SQLAlchemy Index table of the file index
+            file_ids: the ids of the files
+        """
+        table = Index.__tablename__
+        with self._lock:
+            for file_id in file_ids:
+                self._cache.pop((table, file_id), None)
+
+
+class RetrievalResultCache:
+    """Cache the retrieved documents of recent questions
+
+    Each entry is keyed by the question, the selected files and the retrieval
+    settings. Every file carries a generation number that is part of the key and
+    bumped whenever the file is re-indexed or deleted, so stale entries can't be
+    hit anymore and simply age out of the underlying LRU.
+
+    Args:
+        maxsize: maximum number of cached retrievals, 0 to disable the cache
+        ttl: number of seconds a cached retrieval stays valid
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: Optional[float] = 600):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl) if maxsize > 0 else None
+        self._lock = threading.Lock()
+        self._generations: dict[tuple[str, str], int] = {}
+
+    def make_key(
+        self, Index, text: str, file_ids: list[str], options: Hashable
+    ) -> Optional[tuple]:
+        """Build the cache key of a retrieval, None if the cache is disabled
+
+        Args:
+            Index: the SQLAlchemy Index table of the file index
+            text: the question
+            file_ids: the ids of the selected files
+            options: anything else that affects the retrieved documents
+        """
+        if self._cache is None:
+            return None
+
+        table = Index.__tablename__
+        with self._lock:
+            files = tuple(
+                (file_id, self._generations.get((table, file_id), 0))
+                for file_id in sorted(set(file_ids))
+            )
+        return (table, " ".join(text.split()), files, options)
+
+    def get(self, key: Optional[tuple]) -> Optional[list[RetrievedDocument]]:
+        """Get a copy of the cached documents, None on miss"""
+        if key is None or self._cache is None:
+            return None
+        docs = self._cache.get(key)
+        return deepcopy(docs) if docs is not None else None
+
+    def set(self, key: Optional[tuple], docs: list[RetrievedDocument]):
+        """Cache a copy of the retrieved documents"""
+        if key is None or self._cache is None:
+            return
+        self._cache.set(key, deepcopy(docs))
+
+    def invalidate(self, Index, file_ids: list[str]):
+        """Make the cached retrievals involving the files unreachable
+
+        Args:
+            Index: the SQLAlchemy Index table of the file index
+            file_ids: the ids of the files
+        """
+        table = Index.__tablename__
+        with self._lock:
+            for file_id in file_ids:
+                key = (table, file_id)
+                self._generations[key] = self._generations.get(key, 0) + 1
+
+    def stats(self) -> dict:
+        """Return the number of entries, hits and misses of the cache"""
+        if self._cache is None:
+            return {"size": 0, "hits": 0, "misses": 0}
+        return self._cache.stats()
+
+
+def invalidate_file_caches(
+    Index, file_ids: list[str], graph_ids: Optional[list[str]] = None
+):
+    """Drop everything cached about the files after they change
+
+    Args:
+        Index: the index table of the files
+        file_ids: the ids of the files
+        graph_ids: the ids of the graphs built from the files, whose live
+            instances are unloaded
+    """
+    file_chunk_ids.invalidate(Index, file_ids)
+    retrieval_results.invalidate(Index, file_ids)
+    if graph_ids:
+        # imported here, the graph package imports the file index
+        from .graph.registry import graph_instances
+
+        for graph_id in graph_ids:
+            graph_instances.invalidate(graph_id)
+
+
+file_chunk_ids = FileChunkIdsCache()
+retrieval_results = RetrievalResultCache(
+    maxsize=getattr(settings, "KH_RETRIEVAL_CACHE_SIZE", 256),
+    ttl=getattr(settings, "KH_RETRIEVAL_CACHE_TTL", 600),
+)
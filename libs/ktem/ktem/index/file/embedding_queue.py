@@ -0,0 +1,262 @@
+"""Durable queue of the chunks indexed in quick mode, embedded in the background"""
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+from theflow.settings import settings
+
+logger = logging.getLogger(__name__)
+
+EmbedFunc = Callable[[str, list[str]], None]
+ReportFunc = Callable[[str, dict], None]
+
+
+class EmbeddingQueue:
+    """Persistent queue of the chunks waiting for their embeddings, backed by SQLite
+
+    The chunks are queued per index and file once they are in the docstore. A
+    fixed pool of worker threads embeds them in batches with the handler
+    registered for their index. Each chunk keeps its own state, so the queue
+    resumes where it stopped after a crash or a restart, and the failed batches
+    are retried with an exponential backoff.
+
+    Args:
+        path: path to the SQLite database file
+        max_workers: number of worker threads
+        batch_size: maximum number of chunks embedded in a single job
+        max_attempts: number of attempts before a chunk is marked as failed
+        retry_delay: delay in seconds before the first retry, doubled after each
+            failed attempt
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        max_workers: int = 2,
+        batch_size: int = 200,
+        max_attempts: int = 5,
+        retry_delay: float = 5.0,
+    ):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._handlers: dict[str, tuple[EmbedFunc, Optional[ReportFunc]]] = {}
+        self._workers: list[threading.Thread] = []
+
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embedding_jobs ("
+            "index_key TEXT NOT NULL, "
+            "file_id TEXT NOT NULL, "
+            "chunk_id TEXT NOT NULL, "
+            "status TEXT NOT NULL DEFAULT 'pending', "
+            "attempts INTEGER NOT NULL DEFAULT 0, "
+            "available_at REAL NOT NULL DEFAULT 0, "
+            "error TEXT, "
+            "PRIMARY KEY (index_key, chunk_id))"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_embedding_jobs_file "
+            "ON embedding_jobs (index_key, file_id, status)"
+        )
+        # the jobs running when the process stopped are picked up again
+        self._conn.execute(
+            "UPDATE embedding_jobs SET status = 'pending' WHERE status = 'running'"
+        )
+        self._conn.commit()
+
+    def register(
+        self, index_key: str, embed: EmbedFunc, report: Optional[ReportFunc] = None
+    ):
+        """Register the handler of the chunks of an index and start the workers
+
+        Args:
+            index_key: the key of the index, the name of its Index table
+            embed: embed(file_id, chunk_ids) embeds the chunks and stores them
+            report: report(file_id, progress) records the progress of a file
+        """
+        with self._lock:
+            self._handlers[index_key] = (embed, report)
+            while len(self._workers) < self.max_workers:
+                worker = threading.Thread(
+                    target=self._work,
+                    name=f"ktem-embedding-{len(self._workers)}",
+                    daemon=True,
+                )
+                worker.start()
+                self._workers.append(worker)
+        self._wakeup.set()
+
+    def is_registered(self, index_key: str) -> bool:
+        """Check if the chunks of the index can be embedded by the workers"""
+        return index_key in self._handlers
+
+    def enqueue(self, index_key: str, file_id: str, chunk_ids: list[str]):
+        """Queue the chunks of a file for embedding"""
+        if not chunk_ids:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embedding_jobs "
+                "(index_key, file_id, chunk_id) VALUES (?, ?, ?)",
+                [(index_key, file_id, chunk_id) for chunk_id in chunk_ids],
+            )
+            self._conn.commit()
+        self._wakeup.set()
+
+    def remove(self, index_key: str, file_ids: Optional[list[str]] = None):
+        """Drop the queued chunks of the files, or of the whole index"""
+        with self._lock:
+            if file_ids is None:
+                self._conn.execute(
+                    "DELETE FROM embedding_jobs WHERE index_key = ?", (index_key,)
+                )
+            else:
+                self._conn.executemany(
+                    "DELETE FROM embedding_jobs WHERE index_key = ? AND file_id = ?",
+                    [(index_key, file_id) for file_id in file_ids],
+                )
+            self._conn.commit()
+
+    def progress(self, index_key: str, file_id: str) -> dict:
+        """Get the number of total, embedded and failed chunks of a file"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM embedding_jobs "
+                "WHERE index_key = ? AND file_id = ? GROUP BY status",
+                (index_key, file_id),
+            ).fetchall()
+        counts = dict(rows)
+        return {
+            "total": sum(counts.values()),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+        }
+
+    def _claim(self) -> Optional[tuple[str, str, list[str]]]:
+        """Mark the next batch of pending chunks of a file as running"""
+        with self._lock:
+            if not self._handlers:
+                return None
+
+            now = time.time()
+            index_keys = list(self._handlers)
+            marks = ",".join("?" * len(index_keys))
+            row = self._conn.execute(
+                "SELECT index_key, file_id FROM embedding_jobs "
+                f"WHERE status = 'pending' AND available_at <= ? "
+                f"AND index_key IN ({marks}) ORDER BY rowid LIMIT 1",
+                [now, *index_keys],
+            ).fetchone()
+            if row is None:
+                return None
+
+            index_key, file_id = row
+            chunk_ids = [
+                each[0]
+                for each in self._conn.execute(
+                    "SELECT chunk_id FROM embedding_jobs WHERE index_key = ? "
+                    "AND file_id = ? AND status = 'pending' AND available_at <= ? "
+                    "ORDER BY rowid LIMIT ?",
+                    (index_key, file_id, now, self.batch_size),
+                )
+            ]
+            self._conn.executemany(
+                "UPDATE embedding_jobs SET status = 'running' "
+                "WHERE index_key = ? AND chunk_id = ?",
+                [(index_key, chunk_id) for chunk_id in chunk_ids],
+            )
+            self._conn.commit()
+
+        return index_key, file_id, chunk_ids
+
+    def _complete(self, index_key: str, chunk_ids: list[str]):
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE embedding_jobs SET status = 'done', error = NULL "
+                "WHERE index_key = ? AND chunk_id = ? AND status = 'running'",
+                [(index_key, chunk_id) for chunk_id in chunk_ids],
+            )
+            self._conn.commit()
+
+    def _fail(self, index_key: str, chunk_ids: list[str], error: str):
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE embedding_jobs SET attempts = attempts + 1, error = ?, "
+                "status = CASE WHEN attempts + 1 >= ? THEN 'failed' "
+                "ELSE 'pending' END, "
+                "available_at = ? + ? * (1 << attempts) "
+                "WHERE index_key = ? AND chunk_id = ? AND status = 'running'",
+                [
+                    (
+                        error,
+                        self.max_attempts,
+                        time.time(),
+                        self.retry_delay,
+                        index_key,
+                        chunk_id,
+                    )
+                    for chunk_id in chunk_ids
+                ],
+            )
+            self._conn.commit()
+
+    def _report(self, index_key: str, file_id: str, report: Optional[ReportFunc]):
+        progress = self.progress(index_key, file_id)
+        if report is not None:
+            try:
+                report(file_id, progress)
+            except Exception as e:
+                logger.exception(e)
+
+        if progress["done"] == progress["total"]:
+            # the file is fully embedded, its jobs aren't needed anymore
+            with self._lock:
+                self._conn.execute(
+                    "DELETE FROM embedding_jobs WHERE index_key = ? AND file_id = ? "
+                    "AND status = 'done'",
+                    (index_key, file_id),
+                )
+                self._conn.commit()
+
+    def _work(self):
+        while True:
+            job = self._claim()
+            if job is None:
+                self._wakeup.wait(timeout=self.retry_delay)
+                self._wakeup.clear()
+                continue
+
+            index_key, file_id, chunk_ids = job
+            embed, report = self._handlers[index_key]
+            try:
+                embed(file_id, chunk_ids)
+            except Exception as e:
+                logger.exception(e)
+                self._fail(index_key, chunk_ids, str(e))
+            else:
+                self._complete(index_key, chunk_ids)
+            self._report(index_key, file_id, report)
+
+
+embedding_queue = EmbeddingQueue(
+    path=getattr(
+        settings,
+        "KH_EMBEDDING_QUEUE_PATH",
+        Path(getattr(settings, "KH_APP_DATA_DIR", ".")) / "embedding_queue.db",
+    ),
+    max_workers=getattr(settings, "KH_EMBEDDING_QUEUE_WORKERS", 2),
+    batch_size=getattr(settings, "KH_EMBEDDING_QUEUE_BATCH_SIZE", 200),
+    max_attempts=getattr(settings, "KH_EMBEDDING_QUEUE_MAX_ATTEMPTS", 5),
+)
@@ -0,0 +1,65 @@
+"""Run the blocking kotaemon models from the async GraphRAG libraries"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+
+from theflow.settings import settings
+
+
+class RateLimiter:
+    """Space the calls out to at most `max_calls_per_minute`, 0 for no limit"""
+
+    def __init__(self, max_calls_per_minute: int = 0):
+        self.interval = 60.0 / max_calls_per_minute if max_calls_per_minute else 0.0
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
+class ModelCallPool:
+    """Offload the blocking model calls to a bounded thread pool
+
+    The coroutines awaiting the calls don't block the event loop, so the
+    `asyncio.gather` of the GraphRAG libraries actually runs the calls
+    concurrently. The pool isn't tied to an event loop, so it bounds the calls
+    of all the graphs being indexed or queried at the same time.
+
+    Args:
+        max_workers: maximum number of model calls running at the same time
+        max_calls_per_minute: rate limit of the model calls, 0 for no limit
+    """
+
+    def __init__(self, max_workers: int = 8, max_calls_per_minute: int = 0):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="graphrag-model"
+        )
+        self._rate_limiter = RateLimiter(max_calls_per_minute)
+
+    def _call(self, func: Callable, *args, **kwargs) -> Any:
+        self._rate_limiter.wait()
+        return func(*args, **kwargs)
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run func(*args, **kwargs) in the pool and wait for its result"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, partial(self._call, func, *args, **kwargs)
+        )
+
+
+model_calls = ModelCallPool(
+    max_workers=getattr(settings, "KH_GRAPHRAG_MODEL_CONCURRENCY", 8),
+    max_calls_per_minute=getattr(settings, "KH_GRAPHRAG_MODEL_RPM", 0),
+)
@@ -18,7 +18,9 @@ from kotaemon.base import Document, Param, RetrievedDocument
 from kotaemon.base.schema import AIMessage, HumanMessage, SystemMessage
 
 from ..pipelines import BaseFileIndexRetriever
+from .concurrency import model_calls
 from .pipelines import GraphRAGIndexingPipeline
+from .registry import get_embedding_dim, graph_instances
 from .visualize import create_knowledge_graph, visualize_graph
 
 try:
@@ -70,7 +72,8 @@ def get_llm_func(model):
             if if_cache_return is not None:
                 return if_cache_return["return"]
 
-        output = model(input_messages).text
+        # call run() directly, the theflow call bookkeeping isn't thread-safe
+        output = (await model_calls.run(model.run, input_messages)).text
 
         print("-" * 50)
         print(output, "\n", "-" * 50)
@@ -85,7 +88,7 @@ def get_llm_func(model):
 
 def get_embedding_func(model):
     async def embedding_func(texts: list[str]) -> np.ndarray:
-        outputs = model(texts)
+        outputs = await model_calls.run(model.run, texts)
         embedding_outputs = np.array([doc.embedding for doc in outputs])
 
         return embedding_outputs
@@ -96,7 +99,7 @@ def get_embedding_func(model):
 def get_default_models_wrapper():
     # setup model functions
     default_embedding = embeddings.get_default()
-    default_embedding_dim = len(default_embedding(["Hi"])[0].embedding)
+    default_embedding_dim = get_embedding_dim(default_embedding)
     embedding_func = EmbeddingFunc(
         embedding_dim=default_embedding_dim,
         max_token_size=8192,
@@ -110,6 +113,21 @@ def get_default_models_wrapper():
     return llm_func, embedding_func, default_llm, default_embedding
 
 
+def get_graph_version(default_embedding) -> tuple:
+    """Identify the models a graph instance is built with
+
+    The versions of the model managers change whenever a model is edited, e.g.
+    the endpoint or key of the default LLM under the same name.
+    """
+    return (
+        "lightrag",
+        llms.get_default_name(),
+        llms.version,
+        embeddings.version,
+        default_embedding.get_model_id(),
+    )
+
+
 def prepare_graph_index_path(graph_id: str):
     root_path = Path(filestorage_path) / graph_id
     input_path = root_path / "input"
@@ -246,10 +264,12 @@ class LightRAGIndexingPipeline(GraphRAGIndexingPipeline):
             text="[GraphRAG] Creating index... This can take a long time.",
         )
 
-        # remove all .json files in the input_path directory (previous cache)
-        json_files = glob.glob(f"{input_path}/*.json")
-        for json_file in json_files:
-            os.remove(json_file)
+        # remove all .json files in the input_path directory (previous cache),
+        # unless the docs are appended to a graph already indexed
+        if not (input_path / "graph_chunk_entity_relation.graphml").exists():
+            json_files = glob.glob(f"{input_path}/*.json")
+            for json_file in json_files:
+                os.remove(json_file)
 
         # indexing
         graphrag_func = build_graphrag(
@@ -278,6 +298,11 @@ class LightRAGIndexingPipeline(GraphRAGIndexingPipeline):
                 ),
             )
 
+        # share the freshly indexed graph with the retrievers
+        graph_instances.set(
+            graph_id, get_graph_version(default_embedding), graphrag_func
+        )
+
         yield Document(
             channel="debug",
             text="[GraphRAG] Indexing finished.",
@@ -318,11 +343,15 @@ class LightRAGRetrieverPipeline(BaseFileIndexRetriever):
         _, input_path = prepare_graph_index_path(graph_id)
         input_path.mkdir(parents=True, exist_ok=True)
 
-        llm_func, embedding_func, _, _ = get_default_models_wrapper()
-        graphrag_func = build_graphrag(
-            input_path,
-            llm_func=llm_func,
-            embedding_func=embedding_func,
+        llm_func, embedding_func, _, default_embedding = get_default_models_wrapper()
+        graphrag_func = graph_instances.get(
+            graph_id,
+            get_graph_version(default_embedding),
+            lambda: build_graphrag(
+                input_path,
+                llm_func=llm_func,
+                embedding_func=embedding_func,
+            ),
         )
         query_params = QueryParam(mode="local", only_need_context=True)
 
@@ -1,9 +1,14 @@
+import asyncio
 import os
+import queue
 import shutil
 import subprocess
+import sys
+import threading
+from collections import OrderedDict
 from pathlib import Path
 from shutil import rmtree
-from typing import Generator
+from typing import Generator, Optional
 from uuid import uuid4
 
 import pandas as pd
@@ -20,6 +25,8 @@ from ..pipelines import BaseFileIndexRetriever, IndexDocumentPipeline, IndexPipe
 from .visualize import create_knowledge_graph, visualize_graph
 
 try:
+    from graphrag.api import build_index
+    from graphrag.config import create_graphrag_config
     from graphrag.query.context_builder.entity_extraction import EntityVectorStoreKey
     from graphrag.query.indexer_adapters import (
         read_indexer_entities,
@@ -48,6 +55,22 @@ filestorage_path = Path(settings.KH_FILESTORAGE_PATH) / "graphrag"
 filestorage_path.mkdir(parents=True, exist_ok=True)
 
 
+COMMUNITY_REPORT_TABLE = "create_final_community_reports"
+ENTITY_TABLE = "create_final_nodes"
+ENTITY_EMBEDDING_TABLE = "create_final_entities"
+RELATIONSHIP_TABLE = "create_final_relationships"
+TEXT_UNIT_TABLE = "create_final_text_units"
+GRAPH_TABLES = [
+    COMMUNITY_REPORT_TABLE,
+    ENTITY_TABLE,
+    ENTITY_EMBEDDING_TABLE,
+    RELATIONSHIP_TABLE,
+    TEXT_UNIT_TABLE,
+]
+COMMUNITY_LEVEL = 2
+ENTITY_EMBEDDING_COLLECTION = "entity_description_embeddings"
+
+
 def prepare_graph_index_path(graph_id: str):
     root_path = Path(filestorage_path) / graph_id
     input_path = root_path / "input"
@@ -55,6 +78,227 @@ def prepare_graph_index_path(graph_id: str):
     return root_path, input_path
 
 
+def load_entity_embedding_store(output_path: Path, entities=None):
+    """Load the LanceDB store of the entity description embeddings
+
+    The store is (re)built from the GraphRAG output only when it's missing or
+    older than the entity embedding table, otherwise it's opened as is.
+
+    Args:
+        output_path: the GraphRAG output directory
+        entities: the indexer entities, read from the output if not provided
+    """
+    lancedb_uri = output_path / "lancedb"
+    # the mtime of the entity embedding table the store was built from
+    marker = output_path / "lancedb.source_mtime"
+    source_mtime = str(
+        os.path.getmtime(output_path / f"{ENTITY_EMBEDDING_TABLE}.parquet")
+    )
+
+    store = LanceDBVectorStore(collection_name=ENTITY_EMBEDDING_COLLECTION)
+    if lancedb_uri.is_dir() and marker.is_file() and marker.read_text() == source_mtime:
+        store.connect(db_uri=str(lancedb_uri))
+        store.document_collection = store.db_connection.open_table(
+            ENTITY_EMBEDDING_COLLECTION
+        )
+        return store
+
+    if entities is None:
+        entities = read_indexer_entities(
+            pd.read_parquet(output_path / f"{ENTITY_TABLE}.parquet"),
+            pd.read_parquet(output_path / f"{ENTITY_EMBEDDING_TABLE}.parquet"),
+            COMMUNITY_LEVEL,
+        )
+    if lancedb_uri.is_dir():
+        rmtree(lancedb_uri)
+    store.connect(db_uri=str(lancedb_uri))
+    store_entity_semantic_embeddings(entities=entities, vectorstore=store)
+    marker.write_text(source_mtime)
+    return store
+
+
+class GraphContextBuilderCache:
+    """Keep the loaded local-search context builders of the recently used graphs
+
+    Builders are keyed by the graph id and the modification times of the
+    GraphRAG output tables and settings, so re-indexing a graph invalidates its
+    entry. The least recently used builders are evicted once the estimated
+    memory footprint of the loaded tables exceeds `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._cache: OrderedDict[str, tuple[tuple, object, int]] = OrderedDict()
+        self._total_bytes = 0
+
+    def get(self, graph_id: str, version: tuple):
+        with self._lock:
+            item = self._cache.get(graph_id)
+            if item is None or item[0] != version:
+                return None
+            self._cache.move_to_end(graph_id)
+            return item[1]
+
+    def set(self, graph_id: str, version: tuple, builder, n_bytes: int):
+        with self._lock:
+            if graph_id in self._cache:
+                self._total_bytes -= self._cache.pop(graph_id)[2]
+            self._cache[graph_id] = (version, builder, n_bytes)
+            self._total_bytes += n_bytes
+            # always keep the newest builder, even if it alone exceeds the limit
+            while self._total_bytes > self.max_bytes and len(self._cache) > 1:
+                _, (_, _, evicted_bytes) = self._cache.popitem(last=False)
+                self._total_bytes -= evicted_bytes
+
+
+context_builders = GraphContextBuilderCache(
+    max_bytes=getattr(settings, "KH_GRAPHRAG_CACHE_MAX_BYTES", 2 * 1024**3)
+)
+
+
+class _QueueProgressReporter:
+    """GraphRAG progress reporter forwarding the events as text into a queue"""
+
+    def __init__(self, events: queue.Queue, prefix: str = ""):
+        self._events = events
+        self._prefix = prefix
+        self._last = ""
+
+    def _put(self, text: str):
+        if text != self._last:
+            self._last = text
+            self._events.put(f"[GraphRAG] {self._prefix}{text}")
+
+    def __call__(self, update):
+        description = getattr(update, "description", None) or ""
+        total = getattr(update, "total_items", None)
+        completed = getattr(update, "completed_items", None)
+        if total:
+            self._put(f"{description} {completed or 0}/{total}".strip())
+        elif description:
+            self._put(description)
+
+    def child(self, prefix: str, transient: bool = True):
+        return _QueueProgressReporter(self._events, f"{self._prefix}{prefix} ")
+
+    def info(self, message: str):
+        self._put(message)
+
+    def success(self, message: str):
+        self._put(message)
+
+    def warning(self, message: str):
+        self._put(f"Warning: {message}")
+
+    def error(self, message: str):
+        self._put(f"Error: {message}")
+
+    def dispose(self):
+        pass
+
+    def force_refresh(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+def init_graphrag_project(root_path: Path, reporter=None):
+    """Write the default settings and prompts of a new GraphRAG project"""
+    try:
+        from graphrag.index.cli import _initialize_project_at
+    except ImportError:
+        # private helper of graphrag, fall back to its CLI when it moves
+        subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "graphrag.index",
+                "--root",
+                str(root_path),
+                "--init",
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    else:
+        _initialize_project_at(str(root_path), reporter)
+
+
+def run_graphrag_index(
+    root_path: Path, update: bool = False
+) -> Generator[Document, None, None]:
+    """Index the input of a GraphRAG project in-process, streaming the progress
+
+    The project is initialized on first use.
+
+    Args:
+        root_path: the root of the GraphRAG project
+        update: whether to update the existing output with the new input files,
+            with graphrag's update run. Versions of graphrag without it index the
+            whole input again, the unchanged text units then hit its LLM cache.
+    """
+    events: queue.Queue = queue.Queue()
+    reporter = _QueueProgressReporter(events)
+
+    if not (root_path / "settings.yaml").is_file():
+        init_graphrag_project(root_path, reporter)
+
+    # copy customized GraphRAG config file if it exists
+    if config("USE_CUSTOMIZED_GRAPHRAG_SETTING", default="value").lower() == "true":
+        setting_file_path = os.path.join(os.getcwd(), "settings.yaml.example")
+        destination_file_path = os.path.join(root_path, "settings.yaml")
+        try:
+            shutil.copy(setting_file_path, destination_file_path)
+        except shutil.Error:
+            # Handle the error if the file copy fails
+            print("failed to copy customized GraphRAG config file. ")
+
+    with open(root_path / "settings.yaml", "r", encoding="utf-8") as f:
+        graphrag_config = create_graphrag_config(yaml.safe_load(f), str(root_path))
+
+    errors: list[Exception] = []
+
+    def _index():
+        try:
+            kwargs = {"is_update_run": True} if update else {}
+            try:
+                run = build_index(
+                    config=graphrag_config,
+                    run_id=str(uuid4()),
+                    progress_reporter=reporter,
+                    **kwargs,
+                )
+            except TypeError:
+                if not kwargs:
+                    raise
+                reporter.warning("update run not supported, indexing all the files")
+                run = build_index(
+                    config=graphrag_config,
+                    run_id=str(uuid4()),
+                    progress_reporter=reporter,
+                )
+            outputs = asyncio.run(run)
+            for output in outputs:
+                for error in output.errors or []:
+                    reporter.error(f"{output.workflow}: {error}")
+        except Exception as e:
+            errors.append(e)
+        finally:
+            events.put(None)
+
+    thread = threading.Thread(target=_index, daemon=True)
+    thread.start()
+    while (event := events.get()) is not None:
+        yield Document(channel="debug", text=event)
+    thread.join()
+
+    if errors:
+        raise errors[0]
+
+
 class GraphRAGIndexingPipeline(IndexDocumentPipeline):
     """GraphRAG specific indexing pipeline"""
 
@@ -65,10 +309,33 @@ class GraphRAGIndexingPipeline(IndexDocumentPipeline):
 
         return pipeline
 
-    def store_file_id_with_graph_id(self, file_ids: list[str | None]):
-        # create new graph_id and assign them to doc_id in self.Index
-        # record in the index
-        graph_id = str(uuid4())
+    def get_graph_id(self, file_ids: list[str]) -> Optional[str]:
+        """Get the graph the files are indexed into, None if there's none
+
+        Raises:
+            ValueError: if the files are indexed into several graphs
+        """
+        if not file_ids:
+            return None
+
+        with Session(engine) as session:
+            graph_ids = {
+                graph_id
+                for graph_id, in session.query(self.Index.target_id)
+                .filter(self.Index.source_id.in_(file_ids))
+                .filter(self.Index.relation_type == "graph")
+                .distinct()
+            }
+        if len(graph_ids) > 1:
+            raise ValueError("The files are indexed into several graphs")
+        return graph_ids.pop() if graph_ids else None
+
+    def store_file_id_with_graph_id(
+        self, file_ids: list[str | None], graph_id: Optional[str] = None
+    ):
+        # create new graph_id (unless appending to an existing graph) and assign
+        # them to doc_id in self.Index record in the index
+        graph_id = graph_id or str(uuid4())
         with Session(engine) as session:
             nodes = []
             for file_id in file_ids:
@@ -99,58 +366,49 @@ class GraphRAGIndexingPipeline(IndexDocumentPipeline):
         return root_path
 
     def call_graphrag_index(self, graph_id: str, all_docs: list[Document]):
-        # call GraphRAG index with docs and graph_id
-        input_path = self.write_docs_to_files(graph_id, all_docs)
-        input_path = str(input_path.absolute())
-
-        # Construct the command
-        command = [
-            "python",
-            "-m",
-            "graphrag.index",
-            "--root",
-            input_path,
-            "--reporter",
-            "rich",
-            "--init",
-        ]
+        # call GraphRAG index with docs and graph_id, updating the graph already
+        # indexed when the docs are appended to it
+        root_path, _ = prepare_graph_index_path(graph_id)
+        update = all(
+            (root_path / "output" / f"{table}.parquet").is_file()
+            for table in GRAPH_TABLES
+        )
+        root_path = self.write_docs_to_files(graph_id, all_docs).absolute()
 
-        # Run the command
         yield Document(
             channel="debug",
-            text="[GraphRAG] Creating index... This can take a long time.",
+            text=(
+                f"[GraphRAG] {'Updating' if update else 'Creating'} index... "
+                "This can take a long time."
+            ),
         )
-        result = subprocess.run(command, capture_output=True, text=True)
-        print(result.stdout)
-        command = command[:-1]
-
-        # copy customized GraphRAG config file if it exists
-        if config("USE_CUSTOMIZED_GRAPHRAG_SETTING", default="value").lower() == "true":
-            setting_file_path = os.path.join(os.getcwd(), "settings.yaml.example")
-            destination_file_path = os.path.join(input_path, "settings.yaml")
-            try:
-                shutil.copy(setting_file_path, destination_file_path)
-            except shutil.Error:
-                # Handle the error if the file copy fails
-                print("failed to copy customized GraphRAG config file. ")
+        yield from run_graphrag_index(root_path, update=update)
 
-        # Run the command and stream stdout
-        with subprocess.Popen(command, stdout=subprocess.PIPE, text=True) as process:
-            if process.stdout:
-                for line in process.stdout:
-                    yield Document(channel="debug", text=line)
+        # embed the entity descriptions once, instead of on every question
+        try:
+            load_entity_embedding_store(root_path / "output")
+        except Exception as e:
+            print(f"[GraphRAG] Failed to store the entity embeddings: {e}")
 
     def stream(
-        self, file_paths: str | Path | list[str | Path], reindex: bool = False, **kwargs
+        self,
+        file_paths: str | Path | list[str | Path],
+        reindex: bool = False,
+        group_file_ids: Optional[list[str]] = None,
+        **kwargs,
     ) -> Generator[
         Document, None, tuple[list[str | None], list[str | None], list[Document]]
     ]:
+        """Index the files into a new graph, or append them to the graph of the
+        files of the group `group_file_ids` they are added to
+        """
+        graph_id = self.get_graph_id(group_file_ids or [])
         file_ids, errors, all_docs = yield from super().stream(
             file_paths, reindex=reindex, **kwargs
         )
 
         # assign graph_id to file_ids
-        graph_id = self.store_file_id_with_graph_id(file_ids)
+        graph_id = self.store_file_id_with_graph_id(file_ids, graph_id)
         # call GraphRAG index with docs and graph_id
         yield from self.call_graphrag_index(graph_id, all_docs)
 
@@ -176,33 +434,42 @@ class GraphRAGRetrieverPipeline(BaseFileIndexRetriever):
         }
 
     def _build_graph_search(self):
-        assert (
-            len(self.file_ids) <= 1
-        ), "GraphRAG retriever only supports one file_id at a time"
-
-        file_id = self.file_ids[0]
-        # retrieve the graph_id from the index
+        # retrieve the graph_id from the index, the selected files can span a
+        # single graph, e.g. the files indexed together
         with Session(engine) as session:
-            graph_id = (
-                session.query(self.Index.target_id)
-                .filter(self.Index.source_id == file_id)
+            graph_ids = {
+                graph_id
+                for graph_id, in session.query(self.Index.target_id)
+                .filter(self.Index.source_id.in_(self.file_ids))
                 .filter(self.Index.relation_type == "graph")
-                .first()
-            )
-            graph_id = graph_id[0] if graph_id else None
-            assert graph_id, f"GraphRAG index not found for file_id: {file_id}"
+                .distinct()
+            }
+        assert graph_ids, f"GraphRAG index not found for file_ids: {self.file_ids}"
+        assert (
+            len(graph_ids) == 1
+        ), "GraphRAG retriever only supports files of one graph at a time"
+        graph_id = graph_ids.pop()
 
         root_path, _ = prepare_graph_index_path(graph_id)
         output_path = root_path / "output"
+        settings_yaml_path = Path(root_path) / "settings.yaml"
+        use_customized_setting = (
+            config("USE_CUSTOMIZED_GRAPHRAG_SETTING", default="value").lower() == "true"
+        )
+
+        version = tuple(
+            os.path.getmtime(output_path / f"{table}.parquet") for table in GRAPH_TABLES
+        ) + (
+            use_customized_setting,
+            settings_yaml_path.stat().st_mtime if settings_yaml_path.is_file() else 0,
+            os.getenv("GRAPHRAG_EMBEDDING_MODEL"),
+            os.getenv("GRAPHRAG_API_KEY"),
+        )
+        context_builder = context_builders.get(graph_id, version)
+        if context_builder is not None:
+            return context_builder
 
         INPUT_DIR = output_path
-        LANCEDB_URI = str(INPUT_DIR / "lancedb")
-        COMMUNITY_REPORT_TABLE = "create_final_community_reports"
-        ENTITY_TABLE = "create_final_nodes"
-        ENTITY_EMBEDDING_TABLE = "create_final_entities"
-        RELATIONSHIP_TABLE = "create_final_relationships"
-        TEXT_UNIT_TABLE = "create_final_text_units"
-        COMMUNITY_LEVEL = 2
 
         # read nodes table to get community and degree data
         entity_df = pd.read_parquet(f"{INPUT_DIR}/{ENTITY_TABLE}.parquet")
@@ -213,17 +480,9 @@ class GraphRAGRetrieverPipeline(BaseFileIndexRetriever):
             entity_df, entity_embedding_df, COMMUNITY_LEVEL
         )
 
-        # load description embeddings to an in-memory lancedb vectorstore
-        # to connect to a remote db, specify url and port values.
-        description_embedding_store = LanceDBVectorStore(
-            collection_name="entity_description_embeddings",
-        )
-        description_embedding_store.connect(db_uri=LANCEDB_URI)
-        if Path(LANCEDB_URI).is_dir():
-            rmtree(LANCEDB_URI)
-        _ = store_entity_semantic_embeddings(
-            entities=entities, vectorstore=description_embedding_store
-        )
+        # open the description embeddings stored at index time, rebuilding them
+        # only for graphs indexed before they were stored
+        description_embedding_store = load_entity_embedding_store(output_path, entities)
         print(f"Entity count: {len(entity_df)}")
 
         # Read relationships
@@ -238,6 +497,18 @@ class GraphRAGRetrieverPipeline(BaseFileIndexRetriever):
         text_unit_df = pd.read_parquet(f"{INPUT_DIR}/{TEXT_UNIT_TABLE}.parquet")
         text_units = read_indexer_text_units(text_unit_df)
 
+        # estimate the memory held by the builder from its source tables
+        n_bytes = sum(
+            int(df.memory_usage(deep=True).sum())
+            for df in [
+                entity_df,
+                entity_embedding_df,
+                relationship_df,
+                report_df,
+                text_unit_df,
+            ]
+        )
+
         # initialize default settings
         embedding_model = os.getenv(
             "GRAPHRAG_EMBEDDING_MODEL", "text-embedding-3-small"
@@ -246,8 +517,7 @@ class GraphRAGRetrieverPipeline(BaseFileIndexRetriever):
         embedding_api_base = None
 
         # use customized GraphRAG settings if the flag is set
-        if config("USE_CUSTOMIZED_GRAPHRAG_SETTING", default="value").lower() == "true":
-            settings_yaml_path = Path(root_path) / "settings.yaml"
+        if use_customized_setting:
             with open(settings_yaml_path, "r") as f:
                 settings = yaml.safe_load(f)
             if settings["embeddings"]["llm"]["model"]:
@@ -280,6 +550,7 @@ class GraphRAGRetrieverPipeline(BaseFileIndexRetriever):
             text_embedder=text_embedder,
             token_encoder=token_encoder,
         )
+        context_builders.set(graph_id, version, context_builder, n_bytes)
         return context_builder
 
     def _to_document(self, header: str, context_text: str) -> RetrievedDocument:
@@ -0,0 +1,78 @@
+"""Live NanoGraphRAG/LightRAG instances shared across requests"""
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+from theflow.settings import settings
+
+from kotaemon.embeddings import BaseEmbeddings
+
+_embedding_dims: dict[str, int] = {}
+_embedding_dims_lock = threading.Lock()
+
+
+def get_embedding_dim(embedding: BaseEmbeddings) -> int:
+    """Get the dimension of the embedding model, probed once per model"""
+    model_id = embedding.get_model_id()
+    with _embedding_dims_lock:
+        if model_id in _embedding_dims:
+            return _embedding_dims[model_id]
+
+    dim = len(embedding(["Hi"])[0].embedding)
+    with _embedding_dims_lock:
+        _embedding_dims[model_id] = dim
+    return dim
+
+
+class GraphInstanceRegistry:
+    """Keep the loaded graph instances of the recently used graphs
+
+    Loading a graph reads its graphml and KV stores from disk, so the instances
+    are kept alive and shared by all the retrievals of the same graph.
+
+    Args:
+        max_graphs: maximum number of graphs to keep, the least recently used
+            graphs are unloaded first
+    """
+
+    def __init__(self, max_graphs: int = 8):
+        self.max_graphs = max_graphs
+        self._lock = threading.Lock()
+        self._graphs: OrderedDict[str, tuple[Hashable, Any]] = OrderedDict()
+
+    def get(self, graph_id: str, version: Hashable, build: Callable[[], Any]) -> Any:
+        """Get the instance of the graph, building it if needed
+
+        Args:
+            graph_id: the id of the graph
+            version: anything the instance depends on besides the graph, e.g. the
+                models it uses; a different version rebuilds the instance
+            build: the function to build the instance
+        """
+        with self._lock:
+            item = self._graphs.get(graph_id)
+            if item is not None and item[0] == version:
+                self._graphs.move_to_end(graph_id)
+                return item[1]
+
+        instance = build()
+        self.set(graph_id, version, instance)
+        return instance
+
+    def set(self, graph_id: str, version: Hashable, instance: Any):
+        """Register the instance of the graph, e.g. right after indexing"""
+        with self._lock:
+            self._graphs[graph_id] = (version, instance)
+            self._graphs.move_to_end(graph_id)
+            while len(self._graphs) > self.max_graphs:
+                self._graphs.popitem(last=False)
+
+    def invalidate(self, graph_id: str):
+        """Unload the instance of the graph"""
+        with self._lock:
+            self._graphs.pop(graph_id, None)
+
+
+graph_instances = GraphInstanceRegistry(
+    max_graphs=getattr(settings, "KH_GRAPH_INSTANCE_CACHE_SIZE", 8)
+)
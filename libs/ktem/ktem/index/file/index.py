@@ -5,9 +5,12 @@ from typing import Any, Optional, Type
 from ktem.components import filestorage_path, get_docstore, get_vectorstore
 from ktem.db.engine import engine
 from ktem.index.base import BaseIndex
-from sqlalchemy import JSON, Column, DateTime, Integer, String, UniqueConstraint
+from sqlalchemy import JSON, Column, DateTime
+from sqlalchemy import Index as SQLIndex
+from sqlalchemy import Integer, String, UniqueConstraint, inspect, select
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.mutable import MutableDict
+from sqlalchemy.orm import Session
 from theflow.settings import settings as flowsettings
 from theflow.utils.modules import import_dotted_string
 from tzlocal import get_localzone
@@ -15,6 +18,7 @@ from tzlocal import get_localzone
 from kotaemon.storages import BaseDocumentStore, BaseVectorStore
 
 from .base import BaseFileIndexIndexing, BaseFileIndexRetriever
+from .embedding_queue import embedding_queue
 
 
 class FileIndex(BaseIndex):
@@ -113,6 +117,18 @@ class FileIndex(BaseIndex):
             (Base,),
             {
                 "__tablename__": f"index__{self.id}__index",
+                "__table_args__": (
+                    SQLIndex(
+                        f"ix_index__{self.id}__index_source",
+                        "source_id",
+                        "relation_type",
+                    ),
+                    SQLIndex(
+                        f"ix_index__{self.id}__index_target",
+                        "target_id",
+                        "relation_type",
+                    ),
+                ),
                 "id": Column(Integer, primary_key=True, autoincrement=True),
                 "source_id": Column(String),
                 "target_id": Column(String),
@@ -319,6 +335,15 @@ class FileIndex(BaseIndex):
         self._resources["FileGroup"].metadata.create_all(engine)  # type: ignore
         self._fs_path.mkdir(parents=True, exist_ok=True)
 
+    def _migrate_resources(self):
+        """Create the database indices missing from tables of older deployments"""
+        Index = self._resources["Index"]
+        if not inspect(engine).has_table(Index.__tablename__):
+            return
+
+        for index in Index.__table__.indexes:
+            index.create(engine, checkfirst=True)
+
     def on_delete(self):
         """Clean up the index when the user delete it"""
         import shutil
@@ -329,15 +354,56 @@ class FileIndex(BaseIndex):
         self._resources["FileGroup"].__table__.drop(engine)  # type: ignore
         self._vs.drop()
         self._docstore.drop()
+        embedding_queue.remove(self._resources["Index"].__tablename__)
         shutil.rmtree(self._fs_path)
 
     def on_start(self):
         """Setup the classes and hooks"""
         self._setup_resources()
+        self._migrate_resources()
         self._setup_indexing_cls()
         self._setup_retriever_cls()
         self._setup_file_index_ui_cls()
         self._setup_file_selector_ui_cls()
+        embedding_queue.register(
+            self._resources["Index"].__tablename__,
+            self._embed_queued_chunks,
+            self._record_embedding_progress,
+        )
+
+    def _embed_queued_chunks(self, file_id: str, chunk_ids: list[str]):
+        """Embed the chunks queued by the quick index mode"""
+        from ktem.embeddings.manager import embedding_models_manager
+
+        from .pipelines import IndexPipeline
+
+        pipeline = IndexPipeline(
+            loader=None,
+            splitter=None,
+            Source=self._resources["Source"],
+            Index=self._resources["Index"],
+            VS=self._vs,
+            DS=self._docstore,
+            FSPath=self._fs_path,
+            embedding=embedding_models_manager[
+                self.config.get(
+                    "embedding", embedding_models_manager.get_default_name()
+                )
+            ],
+        )
+        pipeline.embed_queued_chunks(file_id, chunk_ids)
+
+    def _record_embedding_progress(self, file_id: str, progress: dict):
+        """Record the progress of the background embedding in the file note"""
+        Source = self._resources["Source"]
+        with Session(engine) as session:
+            item = session.execute(
+                select(Source).where(Source.id == file_id)
+            ).scalar_one_or_none()
+            if item is None:
+                return
+            item.note["embedding"] = progress
+            session.commit()
 
     def get_selector_component_ui(self):
         if self._selector_ui is None:
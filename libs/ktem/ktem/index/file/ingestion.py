@@ -0,0 +1,204 @@
+"""Scheduling helpers to ingest many files concurrently"""
+import multiprocessing
+import pickle
+import queue
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from copy import deepcopy
+from typing import Any, Callable, Generator, Iterator, Optional
+
+from theflow.settings import settings
+
+from kotaemon.base import Document
+
+_reader_pool: Optional[ProcessPoolExecutor] = None
+_reader_pool_lock = threading.Lock()
+_picklable_readers: dict[type, bool] = {}
+_shared_locks: dict[int, threading.RLock] = {}
+_shared_locks_lock = threading.Lock()
+_thread_state = threading.local()
+
+
+def _get_shared_lock(obj) -> threading.RLock:
+    """Get the lock of an object, dropped once the object is garbage collected"""
+    key = id(obj)
+    lock = _shared_locks.get(key)
+    if lock is None:
+        lock = _shared_locks[key] = threading.RLock()
+        # the id can only be reused after the object is collected
+        weakref.finalize(obj, _shared_locks.pop, key, None)
+    return lock
+
+
+@contextmanager
+def serialized(*objs):
+    """Call into objects shared by the indexing threads one thread at a time
+
+    theflow components keep the state of their current run on the instance and
+    the stores are not thread-safe, so the embedding model, the readers and the
+    stores shared by the files indexed at the same time are locked. The locks
+    are always taken in the order of `objs`, None objects are skipped.
+    """
+    with _shared_locks_lock:
+        locks = [_get_shared_lock(obj) for obj in objs if obj is not None]
+
+    with ExitStack() as stack:
+        for lock in locks:
+            stack.enter_context(lock)
+        yield
+
+
+def thread_copy(obj):
+    """Get a copy of a shared component, private to the current indexing thread
+
+    The readers keep the state of their current run on the instance, so each
+    thread of `stream_in_order` parses with its own copy, made once per thread,
+    and the files are parsed concurrently. Outside of these threads, or if the
+    component can't be copied, the component itself is returned.
+    """
+    copies: Optional[dict] = getattr(_thread_state, "copies", None)
+    if copies is None or obj is None:
+        return obj
+
+    item = copies.get(id(obj))
+    if item is None:
+        try:
+            copied = deepcopy(obj)
+        except Exception:
+            copied = obj
+        # keep the original, so that its id isn't reused while the copy is cached
+        item = copies[id(obj)] = (obj, copied)
+    return item[1]
+
+
+def _get_reader_pool() -> Optional[ProcessPoolExecutor]:
+    global _reader_pool
+
+    n_processes = getattr(settings, "KH_INGESTION_READER_PROCESSES", 0)
+    if not n_processes:
+        return None
+
+    with _reader_pool_lock:
+        if _reader_pool is None:
+            # spawn rather than fork, the app process runs many threads
+            _reader_pool = ProcessPoolExecutor(
+                max_workers=n_processes,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _reader_pool
+
+
+def _is_picklable(reader) -> bool:
+    cls = type(reader)
+    if cls not in _picklable_readers:
+        try:
+            pickle.dumps(reader)
+            _picklable_readers[cls] = True
+        except Exception:
+            _picklable_readers[cls] = False
+    return _picklable_readers[cls]
+
+
+def _load_data(reader, file_path, extra_info: dict) -> list[Document]:
+    return reader.load_data(file_path, extra_info=extra_info)
+
+
+def load_data(reader, file_path, extra_info: dict) -> list[Document]:
+    """Load the file with the reader
+
+    The CPU-bound parsing runs in the reader process pool when it's enabled with
+    `KH_INGESTION_READER_PROCESSES` and the reader can be sent to another
+    process, otherwise it runs in the calling thread, one thread at a time per
+    reader. Pass a `thread_copy` of a shared reader to parse concurrently.
+    """
+    pool = _get_reader_pool()
+    if pool is None or not _is_picklable(reader):
+        with serialized(reader):
+            return _load_data(reader, file_path, extra_info)
+    return pool.submit(_load_data, reader, file_path, extra_info).result()
+
+
+def stream_in_order(
+    streams: list[Callable[[], Generator[Document, None, Any]]],
+    max_workers: int = 4,
+    buffer_size: int = 64,
+) -> Iterator[tuple[int, str, Any]]:
+    """Run the streams concurrently, emitting their outputs in the streams order
+
+    Each stream runs in a worker thread and its documents are buffered in a
+    bounded queue, so a stream ahead of the one being emitted pauses once its
+    buffer is full. The outputs of a stream are emitted only after the outputs
+    of all the streams before it.
+
+    Args:
+        streams: functions creating the generators to run
+        max_workers: maximum number of streams running at the same time
+        buffer_size: maximum number of documents buffered per stream
+
+    Yields:
+        (index of the stream, kind, payload) where kind is "doc" with a yielded
+        document, then either "return" with the return value of the stream or
+        "error" with the exception it raised
+    """
+    if max_workers <= 1:
+        for idx, stream in enumerate(streams):
+            try:
+                gen = stream()
+                while True:
+                    try:
+                        doc = next(gen)
+                    except StopIteration as e:
+                        output = e.value
+                        break
+                    yield idx, "doc", doc
+                yield idx, "return", output
+            except Exception as e:
+                yield idx, "error", e
+        return
+
+    cancelled = threading.Event()
+    buffers: list[queue.Queue] = [queue.Queue(maxsize=buffer_size) for _ in streams]
+
+    def _put(buffer: queue.Queue, item):
+        while not cancelled.is_set():
+            try:
+                buffer.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _run(idx: int):
+        buffer = buffers[idx]
+        if getattr(_thread_state, "copies", None) is None:
+            # the copies live as long as the thread, i.e. until the files are indexed
+            _thread_state.copies = {}
+        try:
+            gen = streams[idx]()
+            while not cancelled.is_set():
+                try:
+                    doc = next(gen)
+                except StopIteration as e:
+                    _put(buffer, ("return", e.value))
+                    return
+                _put(buffer, ("doc", doc))
+        except Exception as e:
+            _put(buffer, ("error", e))
+
+    executor = ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="ktem-ingestion"
+    )
+    try:
+        for idx in range(len(streams)):
+            executor.submit(_run, idx)
+
+        for idx, buffer in enumerate(buffers):
+            while True:
+                kind, payload = buffer.get()
+                yield idx, kind, payload
+                if kind != "doc":
+                    break
+    finally:
+        cancelled.set()
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -3,7 +3,6 @@ from __future__ import annotations
 import json
 import logging
 import shutil
-import threading
 import time
 import warnings
 from collections import defaultdict
@@ -27,7 +26,7 @@ from llama_index.core.vector_stores import (
     MetadataFilters,
 )
 from llama_index.core.vector_stores.types import VectorStoreQueryMode
-from sqlalchemy import delete, select
+from sqlalchemy import delete, insert, select
 from sqlalchemy.orm import Session
 from theflow.settings import settings
 from theflow.utils.modules import import_dotted_string
@@ -45,8 +44,12 @@ from kotaemon.indices.ingests.files import (
 )
 from kotaemon.indices.rankings import BaseReranking, LLMReranking, LLMTrulensScoring
 from kotaemon.indices.splitters import BaseSplitter, TokenSplitter
+from kotaemon.loaders.cache import ParseCache, get_parse_cache
 
 from .base import BaseFileIndexIndexing, BaseFileIndexRetriever
+from .cache import file_chunk_ids, invalidate_file_caches, retrieval_results
+from .embedding_queue import embedding_queue
+from .ingestion import load_data, serialized, stream_in_order, thread_copy
 
 logger = logging.getLogger(__name__)
 
@@ -76,6 +79,49 @@ def dev_settings():
 _default_token_func = tiktoken.encoding_for_model("gpt-3.5-turbo").encode
 
 
+def _get_parse_cache() -> Optional[ParseCache]:
+    """Get the cache of the parsed files, None if disabled"""
+    path = getattr(settings, "KH_PARSE_CACHE_DIR", None)
+    if not path:
+        return None
+    max_size_mb = getattr(settings, "KH_PARSE_CACHE_SIZE_MB", 1024)
+    return get_parse_cache(str(path), max_size_mb * 1024**2)
+
+
+def delete_file_chunks(
+    VS,
+    DS,
+    file_ids: list[str],
+    vs_ids: list[str],
+    ds_ids: list[str],
+    batch_size: int = 1000,
+):
+    """Delete the chunks of files from the vector store and the doc store
+
+    The ids are deleted in bulk, `batch_size` at a time. The vector store also
+    deletes by the `file_id` metadata when it supports it, which catches the
+    embeddings written in the background but not recorded in the index yet.
+
+    Args:
+        VS: the vector store, None if the index has none
+        DS: the doc store
+        file_ids: the ids of the files
+        vs_ids: the ids of the chunks of the files in the vector store
+        ds_ids: the ids of the chunks of the files in the doc store
+        batch_size: maximum number of ids per delete
+    """
+    if VS:
+        try:
+            VS.delete_by_file_ids(file_ids)
+        except NotImplementedError:
+            pass
+        for start in range(0, len(vs_ids), batch_size):
+            VS.delete(vs_ids[start : start + batch_size])
+
+    for start in range(0, len(ds_ids), batch_size):
+        DS.delete(ds_ids[start : start + batch_size])
+
+
 class DocumentRetrievalPipeline(BaseFileIndexRetriever):
     """Retrieve relevant document
 
@@ -98,6 +144,8 @@ class DocumentRetrievalPipeline(BaseFileIndexRetriever):
     mmr: bool = False
     top_k: int = 5
     retrieval_mode: str = "hybrid"
+    fusion_method: str = "rrf"
+    fusion_weights: tuple[float, float] = (1.0, 1.0)
 
     @Node.auto(depends_on=["embedding", "VS", "DS"])
     def vector_retrieval(self) -> VectorRetrieval:
@@ -106,6 +154,8 @@ class DocumentRetrievalPipeline(BaseFileIndexRetriever):
             vector_store=self.VS,
             doc_store=self.DS,
             retrieval_mode=self.retrieval_mode,  # type: ignore
+            fusion_method=self.fusion_method,  # type: ignore
+            fusion_weights=self.fusion_weights,  # type: ignore
             rerankers=self.rerankers,
         )
 
@@ -140,18 +190,48 @@ class DocumentRetrievalPipeline(BaseFileIndexRetriever):
             logger.info(f"Skip retrieval because of no selected files: {self}")
             return []
 
+        cache_key = retrieval_results.make_key(
+            self.Index, text, doc_ids, self._cache_options()
+        )
+        docs = retrieval_results.get(cache_key)
+        if docs is not None:
+            logger.debug(f"Retrieval cache hit: {retrieval_results.stats()}")
+            return docs
+
+        docs = self._retrieve(text, doc_ids)
+        retrieval_results.set(cache_key, docs)
+        return docs
+
+    def _cache_options(self) -> tuple:
+        """Settings that affect the retrieved documents, part of the cache key"""
+        return (
+            self.get_from_path("embedding").get_model_id(),
+            tuple(
+                (reranker.__class__.__name__, str(reranker.dump().get("params")))
+                for reranker in self.rerankers
+            ),
+            self.get_extra_table,
+            self.mmr,
+            self.top_k,
+            self.retrieval_mode,
+            self.fusion_method,
+            tuple(self.fusion_weights),
+        )
+
+    def _retrieve(self, text: str, doc_ids: list[str]) -> list[RetrievedDocument]:
         retrieval_kwargs: dict = {}
-        with Session(engine) as session:
-            stmt = select(self.Index).where(
-                self.Index.relation_type == "document",
-                self.Index.source_id.in_(doc_ids),
-            )
-            results = session.execute(stmt)
-            chunk_ids = [r[0].target_id for r in results.all()]
 
         # do first round top_k extension
         retrieval_kwargs["do_extend"] = True
-        retrieval_kwargs["scope"] = chunk_ids
+        if self.DS.supports_file_filter():
+            # the docstore filters by file natively
+            retrieval_kwargs["file_scope"] = doc_ids
+        else:
+            retrieval_kwargs["scope"] = [
+                chunk_id
+                for file_chunk_ids_ in file_chunk_ids.get(self.Index, doc_ids).values()
+                for chunk_id in file_chunk_ids_
+            ]
         retrieval_kwargs["filters"] = MetadataFilters(
             filters=[
                 MetadataFilter(
@@ -247,9 +327,28 @@ class DocumentRetrievalPipeline(BaseFileIndexRetriever):
             "retrieval_mode": {
                 "name": "Retrieval mode",
                 "value": "hybrid",
-                "choices": ["vector", "text", "hybrid"],
+                "choices": ["vector", "text", "hybrid", "fusion"],
                 "component": "dropdown",
             },
+            "fusion_method": {
+                "name": "Fusion method (fusion retrieval mode)",
+                "value": "rrf",
+                "choices": [
+                    ("Reciprocal rank fusion", "rrf"),
+                    ("Weighted score", "weighted"),
+                ],
+                "component": "dropdown",
+            },
+            "fusion_vector_weight": {
+                "name": "Weight of vector results (fusion retrieval mode)",
+                "value": 1.0,
+                "component": "number",
+            },
+            "fusion_text_weight": {
+                "name": "Weight of full-text results (fusion retrieval mode)",
+                "value": 1.0,
+                "component": "number",
+            },
             "prioritize_table": {
                 "name": "Prioritize table",
                 "value": False,
@@ -296,6 +395,11 @@ class DocumentRetrievalPipeline(BaseFileIndexRetriever):
                 )
             ],
             retrieval_mode=user_settings["retrieval_mode"],
+            fusion_method=user_settings.get("fusion_method", "rrf"),
+            fusion_weights=(
+                float(user_settings.get("fusion_vector_weight", 1.0)),
+                float(user_settings.get("fusion_text_weight", 1.0)),
+            ),
             llm_scorer=(LLMTrulensScoring() if use_llm_reranking else None),
             rerankers=[
                 reranking_models_manager[
@@ -393,6 +497,10 @@ class IndexPipeline(BaseComponent):
                 f" => [{file_name}] Processed {n_chunks} chunks",
                 channel="debug",
             )
+        # the full-text index is refreshed once per file
+        if self.DS:
+            with serialized(self.DS):
+                self.DS.flush_indices()
 
         def insert_chunks_to_vectorstore():
             chunks = []
@@ -408,12 +516,17 @@ class IndexPipeline(BaseComponent):
                         channel="debug",
                     )
 
-        # run vector indexing in thread if specified
-        if self.run_embedding_in_thread:
-            print("Running embedding in thread")
-            threading.Thread(
-                target=lambda: list(insert_chunks_to_vectorstore())
-            ).start()
+        # queue the vector indexing for the background workers if specified
+        index_key = self.Index.__tablename__
+        if (
+            self.run_embedding_in_thread
+            and self.VS
+            and embedding_queue.is_registered(index_key)
+        ):
+            print("Queueing embedding in background")
+            embedding_queue.enqueue(
+                index_key, file_id, [chunk.doc_id for chunk in to_index_chunks]
+            )
         else:
             yield from insert_chunks_to_vectorstore()
 
@@ -423,42 +536,61 @@ class IndexPipeline(BaseComponent):
     def handle_chunks_docstore(self, chunks, file_id):
         """Run chunks"""
         # run embedding, add to both vector store and doc store
-        self.vector_indexing.add_to_docstore(chunks)
+        with serialized(self.DS):
+            self.vector_indexing.add_to_docstore(chunks)
 
         # record in the index
-        with Session(engine) as session:
-            nodes = []
-            for chunk in chunks:
-                nodes.append(
-                    self.Index(
-                        source_id=file_id,
-                        target_id=chunk.doc_id,
-                        relation_type="document",
-                    )
-                )
-            session.add_all(nodes)
-            session.commit()
+        self.add_to_index(file_id, [chunk.doc_id for chunk in chunks], "document")
+        invalidate_file_caches(self.Index, [file_id])
 
     def handle_chunks_vectorstore(self, chunks, file_id):
         """Run chunks"""
-        # run embedding, add to both vector store and doc store
-        self.vector_indexing.add_to_vectorstore(chunks)
+        # the embedding model parallelizes its own requests, so the files take
+        # turns calling it, while another file is written to the vector store
+        if self.VS:
+            with serialized(self.embedding):
+                embeddings = self.vector_indexing.embed(chunks)
+            with serialized(self.VS):
+                self.VS.add(
+                    embeddings=embeddings, ids=[chunk.doc_id for chunk in chunks]
+                )
         self.vector_indexing.write_chunk_to_file(chunks)
 
         if self.VS:
             # record in the index
-            with Session(engine) as session:
-                nodes = []
-                for chunk in chunks:
-                    nodes.append(
-                        self.Index(
-                            source_id=file_id,
-                            target_id=chunk.doc_id,
-                            relation_type="vector",
-                        )
-                    )
-                session.add_all(nodes)
-                session.commit()
+            self.add_to_index(file_id, [chunk.doc_id for chunk in chunks], "vector")
+
+    def embed_queued_chunks(self, file_id: str, chunk_ids: list[str]):
+        """Embed the chunks of a file queued in quick index mode"""
+        with serialized(self.DS):
+            chunks = self.DS.get(chunk_ids)
+        self.handle_chunks_vectorstore(chunks, file_id)
+        invalidate_file_caches(self.Index, [file_id])
+
+    def add_to_index(self, file_id: str, target_ids: list[str], relation_type: str):
+        """Record the relations between a file and its chunks in a single insert
+
+        Args:
+            file_id: the file id
+            target_ids: the ids of the chunks in the docstore or vectorstore
+            relation_type: "document" or "vector"
+        """
+        if not target_ids:
+            return
+
+        with Session(engine) as session:
+            session.execute(
+                insert(self.Index),
+                [
+                    {
+                        "source_id": file_id,
+                        "target_id": target_id,
+                        "relation_type": relation_type,
+                    }
+                    for target_id in target_ids
+                ],
+            )
+            session.commit()
 
     def get_id_if_exists(self, file_path: str | Path) -> Optional[str]:
         """Check if the file is already indexed
@@ -509,17 +641,23 @@ class IndexPipeline(BaseComponent):
 
         return file_id
 
-    def store_file(self, file_path: Path) -> str:
+    def get_file_hash(self, file_path: Path) -> str:
+        """Get the sha256 of the file content"""
+        with file_path.open("rb") as fi:
+            return sha256(fi.read()).hexdigest()
+
+    def store_file(self, file_path: Path, file_hash: Optional[str] = None) -> str:
         """Store file into the database and storage, return the file id
 
         Args:
             file_path: the path to the file
+            file_hash: the sha256 of the file content, computed if not given
 
         Returns:
             the file id
         """
-        with file_path.open("rb") as fi:
-            file_hash = sha256(fi.read()).hexdigest()
+        if file_hash is None:
+            file_hash = self.get_file_hash(file_path)
 
         shutil.copy(file_path, self.FSPath / file_hash)
         source = self.Source(
@@ -558,10 +696,15 @@ class IndexPipeline(BaseComponent):
 
             # populate the note
             item.note["loader"] = self.get_from_path("loader").__class__.__name__
+            if embedding_queue.is_registered(self.Index.__tablename__):
+                progress = embedding_queue.progress(self.Index.__tablename__, file_id)
+                if progress["total"]:
+                    item.note["embedding"] = progress
 
             session.add(item)
             session.commit()
 
+        invalidate_file_caches(self.Index, [file_id])
         return file_id
 
     def get_token_func(self):
@@ -576,22 +719,26 @@ class IndexPipeline(BaseComponent):
         """
         with Session(engine) as session:
             session.execute(delete(self.Source).where(self.Source.id == file_id))
-            vs_ids, ds_ids = [], []
+            vs_ids, ds_ids, graph_ids = [], [], []
             index = session.execute(
-                select(self.Index).where(self.Index.source_id == file_id)
+                select(self.Index.target_id, self.Index.relation_type).where(
+                    self.Index.source_id == file_id
+                )
             ).all()
-            for each in index:
-                if each[0].relation_type == "vector":
-                    vs_ids.append(each[0].target_id)
-                elif each[0].relation_type == "document":
-                    ds_ids.append(each[0].target_id)
-                session.delete(each[0])
+            for target_id, relation_type in index:
+                if relation_type == "vector":
+                    vs_ids.append(target_id)
+                elif relation_type == "document":
+                    ds_ids.append(target_id)
+                elif relation_type == "graph":
+                    graph_ids.append(target_id)
+            session.execute(delete(self.Index).where(self.Index.source_id == file_id))
             session.commit()
 
-        if vs_ids and self.VS:
-            self.VS.delete(vs_ids)
-        if ds_ids:
-            self.DS.delete(ds_ids)
+        invalidate_file_caches(self.Index, [file_id], graph_ids)
+        embedding_queue.remove(self.Index.__tablename__, [file_id])
+        with serialized(self.VS, self.DS):
+            delete_file_chunks(self.VS, self.DS, [file_id], vs_ids, ds_ids)
 
     def run(
         self, file_path: str | Path, reindex: bool, **kwargs
@@ -607,7 +754,9 @@ class IndexPipeline(BaseComponent):
 
         file_id = self.get_id_if_exists(file_path)
 
+        file_hash = None
         if isinstance(file_path, Path):
+            file_hash = self.get_file_hash(file_path)
             if file_id is not None:
                 if not reindex:
                     raise ValueError(
@@ -620,10 +769,10 @@ class IndexPipeline(BaseComponent):
                         f" => Removing old {file_path.name}", channel="debug"
                     )
                     self.delete_file(file_id)
-                    file_id = self.store_file(file_path)
+                    file_id = self.store_file(file_path, file_hash)
             else:
                 # add record to db
-                file_id = self.store_file(file_path)
+                file_id = self.store_file(file_path, file_hash)
         else:
             if file_id is not None:
                 raise ValueError(f"URL {file_path} already indexed.")
@@ -642,9 +791,24 @@ class IndexPipeline(BaseComponent):
         extra_info["file_id"] = file_id
         extra_info["collection_name"] = self.collection_name
 
-        yield Document(f" => Converting {file_name} to text", channel="debug")
-        docs = self.loader.load_data(file_path, extra_info=extra_info)
-        yield Document(f" => Converted {file_name} to text", channel="debug")
+        # reuse the documents parsed from a file with the same content, unless
+        # reindexing, which parses the file again and refreshes the entry
+        parse_cache, cache_key, docs = _get_parse_cache(), None, None
+        if parse_cache is not None and file_hash is not None:
+            cache_key = ParseCache.make_key(file_hash, self.loader)
+            if not reindex:
+                docs = parse_cache.get(cache_key, extra_info)
+
+        if docs is not None:
+            yield Document(
+                f" => Reused the parsed content of {file_name}", channel="debug"
+            )
+        else:
+            yield Document(f" => Converting {file_name} to text", channel="debug")
+            docs = load_data(self.loader, file_path, extra_info=extra_info)
+            if parse_cache is not None and cache_key is not None:
+                parse_cache.set(cache_key, docs)
+            yield Document(f" => Converted {file_name} to text", channel="debug")
         yield from self.handle_docs(docs, file_id, file_name)
 
         self.finish(file_id, file_path)
@@ -668,6 +832,10 @@ class IndexDocumentPipeline(BaseFileIndexIndexing):
     reader_mode: str = Param("default", help="The reader mode")
     embedding: BaseEmbeddings
     run_embedding_in_thread: bool = False
+    max_concurrent_files: int = Param(
+        getattr(settings, "KH_INGESTION_CONCURRENCY", 4),
+        help="Maximum number of files indexed at the same time",
+    )
 
     @Param.auto(depends_on="reader_mode")
     def readers(self):
@@ -746,7 +914,8 @@ class IndexDocumentPipeline(BaseFileIndexIndexing):
 
         print("Using reader", reader)
         pipeline: IndexPipeline = IndexPipeline(
-            loader=reader,
+            # the files indexed concurrently are parsed with their own readers
+            loader=thread_copy(reader),
             splitter=TokenSplitter(
                 chunk_size=chunk_size or 1024,
                 chunk_overlap=chunk_overlap if chunk_overlap is not None else 256,
@@ -784,24 +953,42 @@ class IndexDocumentPipeline(BaseFileIndexIndexing):
         errors: list[str | None] = []
         all_docs = []
 
-        n_files = len(file_paths)
-        for idx, file_path in enumerate(file_paths):
-            if self.is_url(file_path):
-                file_name = file_path
-            else:
-                file_path = Path(file_path)
-                file_name = file_path.name
+        file_paths = [
+            file_path if self.is_url(file_path) else Path(file_path)
+            for file_path in file_paths
+        ]
 
-            yield Document(
-                content=f"Indexing [{idx + 1}/{n_files}]: {file_name}",
-                channel="debug",
-            )
+        def _index_file(file_path):
+            def _stream():
+                with serialized(self):
+                    pipeline = self.route(file_path)
+                return (
+                    yield from pipeline.stream(file_path, reindex=reindex, **kwargs)
+                )
 
-            try:
-                pipeline = self.route(file_path)
-                file_id, docs = yield from pipeline.stream(
-                    file_path, reindex=reindex, **kwargs
+            return _stream
+
+        # the files are indexed concurrently, their progress is emitted file by file
+        n_files = len(file_paths)
+        last_idx = -1
+        for idx, kind, payload in stream_in_order(
+            [_index_file(file_path) for file_path in file_paths],
+            max_workers=self.max_concurrent_files,
+        ):
+            file_path = file_paths[idx]
+            file_name = file_path if self.is_url(file_path) else file_path.name
+
+            if idx != last_idx:
+                last_idx = idx
+                yield Document(
+                    content=f"Indexing [{idx + 1}/{n_files}]: {file_name}",
+                    channel="debug",
                 )
+
+            if kind == "doc":
+                yield payload
+            elif kind == "return":
+                file_id, docs = payload
                 all_docs.extend(docs)
                 file_ids.append(file_id)
                 errors.append(None)
@@ -813,16 +1000,16 @@ class IndexDocumentPipeline(BaseFileIndexIndexing):
                     },
                     channel="index",
                 )
-            except Exception as e:
-                logger.exception(e)
+            else:
+                logger.error(payload, exc_info=payload)
                 file_ids.append(None)
-                errors.append(str(e))
+                errors.append(str(payload))
                 yield Document(
                     content={
                         "file_path": file_path,
                         "file_name": file_name,
                         "status": "failed",
-                        "message": str(e),
+                        "message": str(payload),
                     },
                     channel="index",
                 )
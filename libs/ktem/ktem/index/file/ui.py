@@ -15,10 +15,14 @@ from gradio.utils import NamedString
 from ktem.app import BasePage
 from ktem.db.engine import engine
 from ktem.utils.render import Render
-from sqlalchemy import select
+from sqlalchemy import delete, select
 from sqlalchemy.orm import Session
 from theflow.settings import settings as flowsettings
 
+from .cache import invalidate_file_caches
+from .embedding_queue import embedding_queue
+from .pipelines import delete_file_chunks
+
 DOWNLOAD_MESSAGE = "Press again to download"
 MAX_FILENAME_LENGTH = 20
 
@@ -133,9 +137,10 @@ class FileIndexPage(BasePage):
                 "size",
                 "tokens",
                 "loader",
+                "embedding",
                 "date_created",
             ],
-            column_widths=["0%", "50%", "8%", "7%", "15%", "20%"],
+            column_widths=["0%", "45%", "8%", "7%", "13%", "10%", "17%"],
             interactive=False,
             wrap=False,
             elem_id="file_list_view",
@@ -265,6 +270,12 @@ class FileIndexPage(BasePage):
                             self.reindex = gr.Checkbox(
                                 value=False, label="Force reindex file", container=False
                             )
+                        self.upload_group = gr.Dropdown(
+                            label="Add to group",
+                            choices=[],
+                            value=None,
+                            info="The files are appended to the group",
+                        )
 
                     self.upload_button = gr.Button(
                         "Upload and Index", variant="primary"
@@ -406,23 +417,28 @@ class FileIndexPage(BasePage):
                 file_name = source[0].name
                 session.delete(source[0])
 
-            vs_ids, ds_ids = [], []
+            Index = self._index._resources["Index"]
+            vs_ids, ds_ids, graph_ids = [], [], []
             index = session.execute(
-                select(self._index._resources["Index"]).where(
-                    self._index._resources["Index"].source_id == file_id
+                select(Index.target_id, Index.relation_type).where(
+                    Index.source_id == file_id
                 )
             ).all()
-            for each in index:
-                if each[0].relation_type == "vector":
-                    vs_ids.append(each[0].target_id)
-                elif each[0].relation_type == "document":
-                    ds_ids.append(each[0].target_id)
-                session.delete(each[0])
+            for target_id, relation_type in index:
+                if relation_type == "vector":
+                    vs_ids.append(target_id)
+                elif relation_type == "document":
+                    ds_ids.append(target_id)
+                elif relation_type == "graph":
+                    graph_ids.append(target_id)
+            session.execute(delete(Index).where(Index.source_id == file_id))
             session.commit()
 
-        if vs_ids:
-            self._index._vs.delete(vs_ids)
-        self._index._docstore.delete(ds_ids)
+        invalidate_file_caches(self._index._resources["Index"], [file_id], graph_ids)
+        embedding_queue.remove(self._index._resources["Index"].__tablename__, [file_id])
+        delete_file_chunks(
+            self._index._vs, self._index._docstore, [file_id], vs_ids, ds_ids
+        )
 
         gr.Info(f"File {file_name} has been deleted")
 
@@ -649,6 +665,7 @@ class FileIndexPage(BasePage):
                     self.reindex,
                     self._app.settings_state,
                     self._app.user_id,
+                    self.upload_group,
                 ],
                 outputs=[self.upload_result, self.upload_info],
                 concurrency_limit=20,
@@ -906,6 +923,15 @@ class FileIndexPage(BasePage):
             onGroupDeleted = onGroupDeleted.then(**event)
             onGroupSaved = onGroupSaved.then(**event)
 
+        self.group_list_state.change(
+            fn=lambda groups: gr.update(
+                choices=[group["name"] for group in groups or []]
+            ),
+            inputs=[self.group_list_state],
+            outputs=[self.upload_group],
+            show_progress="hidden",
+        )
+
     def _on_app_created(self):
         """Called when the app is created"""
         self._app.app.load(
@@ -946,7 +972,7 @@ class FileIndexPage(BasePage):
         return remaining_files
 
     def index_fn(
-        self, files, urls, reindex: bool, settings, user_id
+        self, files, urls, reindex: bool, settings, user_id, group_name=None
     ) -> Generator[tuple[str, str], None, None]:
         """Upload and index the files
 
@@ -956,6 +982,7 @@ class FileIndexPage(BasePage):
             reindex: whether to reindex the files
             selected_files: the list of files already selected
             settings: the settings of the app
+            group_name: the group the indexed files are appended to, if any
         """
         if urls:
             files = [it.strip() for it in urls.split("\n")]
@@ -979,9 +1006,15 @@ class FileIndexPage(BasePage):
         # get the pipeline
         indexing_pipeline = self._index.get_indexing_pipeline(settings, user_id)
 
+        # the files of the group are passed along, e.g. for the graph indices to
+        # add the new files to the graph of the group
+        kwargs = {}
+        if group_name:
+            kwargs["group_file_ids"] = self.get_group_files(group_name)
+
         outputs, debugs = [], []
         # stream the output
-        output_stream = indexing_pipeline.stream(files, reindex=reindex)
+        output_stream = indexing_pipeline.stream(files, reindex=reindex, **kwargs)
         try:
             while True:
                 response = next(output_stream)
@@ -1008,6 +1041,8 @@ class FileIndexPage(BasePage):
         n_successes = len([_ for _ in results if _])
         if n_successes:
             gr.Info(f"Successfully index {n_successes} files")
+            if group_name:
+                self.add_files_to_group(group_name, [_ for _ in results if _])
         n_errors = len([_ for _ in errors if _])
         if n_errors:
             gr.Warning(f"Have errors for {n_errors} files")
@@ -1155,6 +1190,18 @@ class FileIndexPage(BasePage):
             num /= 1024.0
         return f"{num:.0f}Yi{suffix}"
 
+    def format_embedding_progress(self, progress: dict | None) -> str:
+        """Format the progress of the background embedding of a file"""
+        if not progress:
+            return "-"
+        if progress["failed"]:
+            return (
+                f"{progress['done']}/{progress['total']} ({progress['failed']} failed)"
+            )
+        if progress["done"] == progress["total"]:
+            return "done"
+        return f"{progress['done']}/{progress['total']}"
+
     def list_file(self, user_id, name_pattern=""):
         if user_id is None:
             # not signed in
@@ -1166,6 +1213,7 @@ class FileIndexPage(BasePage):
                         "size": "-",
                         "tokens": "-",
                         "loader": "-",
+                        "embedding": "-",
                         "date_created": "-",
                     }
                 ]
@@ -1187,6 +1235,9 @@ class FileIndexPage(BasePage):
                         each[0].note.get("tokens", "-"), suffix=""
                     ),
                     "loader": each[0].note.get("loader", "-"),
+                    "embedding": self.format_embedding_progress(
+                        each[0].note.get("embedding")
+                    ),
                     "date_created": each[0].date_created.strftime("%Y-%m-%d %H:%M:%S"),
                 }
                 for each in session.execute(statement).all()
@@ -1203,6 +1254,7 @@ class FileIndexPage(BasePage):
                         "size": "-",
                         "tokens": "-",
                         "loader": "-",
+                        "embedding": "-",
                         "date_created": "-",
                     }
                 ]
@@ -1323,6 +1375,28 @@ class FileIndexPage(BasePage):
         gr.Info(f"Group {group_name} has been saved")
         return group_id
 
+    def get_group_files(self, group_name) -> list[str]:
+        """Get the ids of the files of a group"""
+        FileGroup = self._index._resources["FileGroup"]
+        with Session(engine) as session:
+            group = session.query(FileGroup).filter_by(name=group_name).first()
+            if group is None:
+                raise gr.Error(f"Group {group_name} not found")
+            return list(group.data.get("files", []))
+
+    def add_files_to_group(self, group_name, file_ids: list[str]):
+        """Append the files to a group"""
+        FileGroup = self._index._resources["FileGroup"]
+        with Session(engine) as session:
+            group = session.query(FileGroup).filter_by(name=group_name).first()
+            if group is None:
+                return
+            files = list(group.data.get("files", []))
+            group.data["files"] = files + [
+                file_id for file_id in file_ids if file_id not in files
+            ]
+            session.commit()
+
     def delete_group(self, group_name):
         FileGroup = self._index._resources["FileGroup"]
         group_id = None
@@ -18,6 +18,8 @@ class LLMManager:
         self._info: dict[str, dict] = {}
         self._default: str = ""
         self._vendors: list[Type] = []
+        # bumped on every reload, to tell apart the model pools
+        self.version: int = 0
 
         if hasattr(flowsettings, "KH_LLMS"):
             for name, model in flowsettings.KH_LLMS.items():
@@ -39,6 +41,7 @@ class LLMManager:
     def load(self):
         """Load the model pool from database"""
         self._models, self._info, self._default = {}, {}, ""
+        self.version += 1
         with Session(engine) as session:
             stmt = select(LLMTable)
             items = session.execute(stmt)
@@ -7,26 +7,35 @@ from typing import Optional
 import gradio as gr
 from ktem.app import BasePage
 from ktem.components import reasonings
-from ktem.db.models import Conversation, engine
+from ktem.db.models import Conversation, User, engine
+from ktem.embeddings.manager import embedding_models_manager
 from ktem.index.file.ui import File
+from ktem.llms.manager import llms
 from ktem.reasoning.prompt_optimization.suggest_conversation_name import (
     SuggestConvNamePipeline,
 )
 from ktem.reasoning.prompt_optimization.suggest_followup_chat import (
     SuggestFollowupQuesPipeline,
 )
+from ktem.rerankings.manager import reranking_models_manager
 from plotly.io import from_json
 from sqlmodel import Session, select
 from theflow.settings import settings as flowsettings
 
-from kotaemon.base import Document
 from kotaemon.indices.ingests.files import KH_DEFAULT_FILE_EXTRACTORS
 
 from ...utils import SUPPORTED_LANGUAGE_MAP
+from ...utils.conversation import (
+    load_conversation_turn,
+    migrate_conversation_turns,
+    save_conversation_turn,
+)
 from .chat_panel import ChatPanel
 from .common import STATE
 from .control import ConversationControl
+from .pool import pipeline_pool
 from .report import ReportIssue
+from .streaming import coalesce_chat_stream
 
 DEFAULT_SETTING = "(default)"
 INFO_PANEL_SCALES = {True: 8, False: 4}
@@ -245,6 +254,12 @@ class ChatPage(BasePage):
                     self.plot_panel = gr.Plot(visible=False)
                     self.info_panel = gr.HTML(elem_id="html-info-panel")
 
+        # components of the delta streaming API, not shown in the UI
+        self._api_message = gr.Textbox(visible=False)
+        self._api_history = gr.JSON(visible=False)
+        self._api_event = gr.JSON(visible=False)
+        self._api_trigger = gr.Button(visible=False)
+
     def _json_to_plot(self, json_dict: dict | None):
         if json_dict:
             plot = from_json(json_dict)
@@ -394,6 +409,21 @@ class ChatPage(BasePage):
             outputs=[self.info_column, self._info_panel_expanded],
         )
 
+        # delta streaming for the clients outside the chat UI, served by the
+        # gradio API at /call/chat_stream
+        self._api_trigger.click(
+            fn=self.chat_stream_api,
+            inputs=[
+                self._api_message,
+                self._api_history,
+                self._app.settings_state,
+            ]
+            + self._indices_input,
+            outputs=self._api_event,
+            api_name="chat_stream",
+            concurrency_limit=20,
+        )
+
         self.chat_panel.chatbot.like(
             fn=self.is_liked,
             inputs=[self.chat_control.conversation_id],
@@ -523,6 +553,7 @@ class ChatPage(BasePage):
         self.chat_panel.chatbot.select(
             self.message_selected,
             inputs=[
+                self.chat_control.conversation_id,
                 self.state_retrieval_history,
                 self.state_plot_history,
             ],
@@ -731,20 +762,19 @@ class ChatPage(BasePage):
         with Session(engine) as session:
             statement = select(Conversation).where(Conversation.id == convo_id)
             result = session.exec(statement).one()
+            migrate_conversation_turns(session, result)
 
-            data_source = result.data_source
+            data_source = deepcopy(result.data_source)
             old_selecteds = data_source.get("selected", {})
             is_owner = result.user == user_id
 
-            # Write down to db
-            result.data_source = {
-                "selected": selecteds_ if is_owner else old_selecteds,
-                "messages": messages,
-                "retrieval_messages": retrival_history,
-                "plot_history": plot_history,
-                "state": state,
-                "likes": deepcopy(data_source.get("likes", [])),
-            }
+            # Write down to db, only the last turn and the conversation settings
+            save_conversation_turn(
+                session, convo_id, messages, retrieval_msg, plot_data
+            )
+            data_source["selected"] = selecteds_ if is_owner else old_selecteds
+            data_source["state"] = state
+            result.data_source = data_source
             session.add(result)
             session.commit()
 
@@ -757,20 +787,23 @@ class ChatPage(BasePage):
         return reasoning_type
 
     def is_liked(self, convo_id, liked: gr.LikeData):
+        index = liked.index[0] if isinstance(liked.index, list) else liked.index
         with Session(engine) as session:
             statement = select(Conversation).where(Conversation.id == convo_id)
             result = session.exec(statement).one()
+            if migrate_conversation_turns(session, result):
+                session.commit()
 
-            data_source = deepcopy(result.data_source)
-            likes = data_source.get("likes", [])
-            likes.append([liked.index, liked.value, liked.liked])
-            data_source["likes"] = likes
-
-            result.data_source = data_source
-            session.add(result)
+            turn = load_conversation_turn(session, convo_id, index)
+            if turn is None:
+                return
+            turn.likes = turn.likes + [[liked.index, liked.value, liked.liked]]
+            session.add(turn)
             session.commit()
 
-    def message_selected(self, retrieval_history, plot_history, msg: gr.SelectData):
+    def message_selected(
+        self, convo_id, retrieval_history, plot_history, msg: gr.SelectData
+    ):
         index = msg.index[0]
         try:
             retrieval_content, plot_content = (
@@ -778,9 +811,16 @@ class ChatPage(BasePage):
                 plot_history[index],
             )
         except IndexError:
-            retrieval_content, plot_content = gr.update(), None
+            return gr.update(), None
+
+        if retrieval_content is None and convo_id:
+            # the evidence of the older turns is loaded on demand
+            with Session(engine) as session:
+                turn = load_conversation_turn(session, convo_id, index)
+            if turn is not None:
+                retrieval_content, plot_content = turn.retrieval, turn.plot
 
-        return retrieval_content, plot_content
+        return retrieval_content or "", plot_content
 
     def create_pipeline(
         self,
@@ -846,8 +886,13 @@ class ChatPage(BasePage):
         if session_language not in (DEFAULT_SETTING, None):
             settings["reasoning.lang"] = session_language
 
-        # get retrievers
-        retrievers = []
+        # prepare states
+        reasoning_state = {
+            "app": deepcopy(state["app"]),
+            "pipeline": deepcopy(state.get(reasoning_id, {})),
+        }
+
+        index_selecteds = []
         for index in self._app.index_manager.indices:
             index_selected = []
             if isinstance(index.selector, int):
@@ -855,21 +900,50 @@ class ChatPage(BasePage):
             if isinstance(index.selector, tuple):
                 for i in index.selector:
                     index_selected.append(selecteds[i])
-            iretrievers = index.get_retriever_pipelines(
-                settings, user_id, index_selected
-            )
-            retrievers += iretrievers
+            index_selecteds.append((index, index_selected))
+
+        def build_pipeline():
+            # get retrievers
+            retrievers = []
+            for index, index_selected in index_selecteds:
+                iretrievers = index.get_retriever_pipelines(
+                    settings, user_id, index_selected
+                )
+                retrievers += iretrievers
 
-        # prepare states
-        reasoning_state = {
-            "app": deepcopy(state["app"]),
-            "pipeline": deepcopy(state.get(reasoning_id, {})),
-        }
+            return reasoning_cls.get_pipeline(settings, reasoning_state, retrievers)
 
-        pipeline = reasoning_cls.get_pipeline(settings, reasoning_state, retrievers)
+        # reuse a pipeline built from the same settings, files and models
+        pipeline_key = pipeline_pool.make_key(
+            reasoning_mode,
+            settings,
+            user_id,
+            reasoning_state["app"].get("regen", False),
+            [
+                self._resolve_selected(index, index_selected)
+                for index, index_selected in index_selecteds
+            ],
+            [
+                manager.version
+                for manager in (
+                    llms,
+                    embedding_models_manager,
+                    reranking_models_manager,
+                )
+            ],
+        )
+        pipeline = pipeline_pool.acquire(pipeline_key, build_pipeline)
 
         return pipeline, reasoning_state
 
+    def _resolve_selected(self, index, selected):
+        """Resolve the selection of an index to the ids it stands for, e.g. when
+        all the files are selected"""
+        selector = index.get_selector_component_ui()
+        if hasattr(selector, "get_selected_ids"):
+            return selector.get_selected_ids(selected)
+        return selected
+
     def chat_fn(
         self,
         conversation_id,
@@ -908,7 +982,32 @@ class ChatPage(BasePage):
         )
         print("Reasoning state", reasoning_state)
         pipeline.set_output_queue(queue)
+        try:
+            yield from self._stream_chat(
+                pipeline,
+                reasoning_state,
+                conversation_id,
+                chat_input,
+                chat_history,
+                state,
+            )
+        except BaseException:
+            pipeline_pool.release(pipeline, reusable=False)
+            raise
+        else:
+            pipeline.set_output_queue(None)
+            pipeline_pool.release(pipeline)
 
+    def _stream_chat(
+        self,
+        pipeline,
+        reasoning_state,
+        conversation_id,
+        chat_input,
+        chat_history,
+        state,
+    ):
+        """Stream the answer of the pipeline to the chat panel"""
         text, refs, plot, plot_gr = "", "", None, gr.update(visible=False)
         msg_placeholder = getattr(
             flowsettings, "KH_CHAT_MSG_PLACEHOLDER", "Thinking ..."
@@ -922,37 +1021,33 @@ class ChatPage(BasePage):
             state,
         )
 
-        for response in pipeline.stream(chat_input, conversation_id, chat_history):
-
-            if not isinstance(response, Document):
-                continue
-
-            if response.channel is None:
-                continue
-
-            if response.channel == "chat":
-                if response.content is None:
-                    text = ""
-                else:
-                    text += response.content
+        # the tokens are coalesced and the unchanged outputs aren't sent again
+        for event in coalesce_chat_stream(
+            pipeline.stream(chat_input, conversation_id, chat_history),
+            interval=getattr(flowsettings, "KH_CHAT_STREAM_INTERVAL", 0.05),
+        ):
+            chat_update = info_update = plot_update = plot_state_update = gr.update()
 
-            if response.channel == "info":
-                if response.content is None:
-                    refs = ""
-                else:
-                    refs += response.content
+            if event["type"] == "text":
+                text += event["delta"]
+            elif event["type"] == "text_reset":
+                text = ""
+            elif event["type"] == "info":
+                refs = info_update = event["html"]
+            elif event["type"] == "plot":
+                plot = plot_state_update = event["plot"]
+                plot_gr = plot_update = self._json_to_plot(plot)
 
-            if response.channel == "plot":
-                plot = response.content
-                plot_gr = self._json_to_plot(plot)
+            if event["type"] in ("text", "text_reset"):
+                chat_update = chat_history + [(chat_input, text or msg_placeholder)]
 
             state[pipeline.get_info()["id"]] = reasoning_state["pipeline"]
 
             yield (
-                chat_history + [(chat_input, text or msg_placeholder)],
-                refs,
-                plot_gr,
-                plot,
+                chat_update,
+                info_update,
+                plot_update,
+                plot_state_update,
                 state,
             )
 
@@ -969,6 +1064,71 @@ class ChatPage(BasePage):
                 state,
             )
 
+    def api_user_id(self, request: Optional[gr.Request]) -> int:
+        """Get the id of the user calling the chat stream API
+
+        The login page of the app only signs in the browser session, so the API
+        clients can't use it. With user management, the app must be launched
+        with gradio authentication (`launch(auth=...)`), and the gradio username
+        is mapped to the app user of the same name. Without user management, the
+        API is as open as the chat UI and runs as the default user.
+        """
+        if not self._app.f_user_management:
+            return 1
+
+        username = getattr(request, "username", None)
+        if not username:
+            raise gr.Error(
+                "The chat stream API requires the app to be launched with gradio "
+                "authentication"
+            )
+        with Session(engine) as session:
+            user = session.exec(
+                select(User).where(User.username_lower == username.lower().strip())
+            ).first()
+        if user is None:
+            raise gr.Error(f"Unknown user: {username}")
+        return user.id
+
+    def chat_stream_api(
+        self, request: gr.Request, message, history, settings, *selecteds
+    ):
+        """Stream the answer as delta events, see `coalesce_chat_stream`
+
+        Args:
+            request: the API request, injected by gradio
+            message: the user message
+            history: the previous [user message, answer] pairs
+            settings: the settings of the app
+            selecteds: the selection of each index
+        """
+        user_id = self.api_user_id(request)
+        if not message:
+            raise gr.Error("Input is empty")
+
+        history = [tuple(each) for each in history or []]
+        pipeline, _ = self.create_pipeline(
+            settings,
+            DEFAULT_SETTING,
+            DEFAULT_SETTING,
+            DEFAULT_SETTING,
+            DEFAULT_SETTING,
+            DEFAULT_SETTING,
+            deepcopy(STATE),
+            user_id,
+            *selecteds,
+        )
+
+        reusable = False
+        try:
+            yield from coalesce_chat_stream(
+                pipeline.stream(message, "", history),
+                interval=getattr(flowsettings, "KH_CHAT_STREAM_INTERVAL", 0.05),
+            )
+            reusable = True
+        finally:
+            pipeline_pool.release(pipeline, reusable=reusable)
+
     def check_and_suggest_name_conv(self, chat_history):
         suggest_pipeline = SuggestConvNamePipeline()
         new_name = gr.update()
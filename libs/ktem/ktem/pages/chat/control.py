@@ -9,7 +9,12 @@ from sqlmodel import Session, or_, select
 
 import flowsettings
 
-from ...utils.conversation import sync_retrieval_n_message
+from ...utils.conversation import (
+    delete_conversation_turns,
+    load_conversation_messages,
+    load_conversation_turn,
+    migrate_conversation_turns,
+)
 from .chat_suggestion import ChatSuggestion
 from .common import STATE
 
@@ -224,6 +229,7 @@ class ConversationControl(BasePage):
             result = session.exec(statement).one()
 
             session.delete(result)
+            delete_conversation_turns(session, conversation_id)
             session.commit()
 
         history = self.load_chat_history(user_id)
@@ -250,22 +256,30 @@ class ConversationControl(BasePage):
                 else:
                     selected = {}
 
-                chats = result.data_source.get("messages", [])
+                if migrate_conversation_turns(session, result):
+                    session.commit()
+                    session.refresh(result)
+
+                chats = load_conversation_messages(session, id_)
 
                 chat_suggestions = result.data_source.get("chat_suggestions", [])
 
-                retrieval_history: list[str] = result.data_source.get(
-                    "retrieval_messages", []
+                # only the evidence of the last turn is loaded, the others are
+                # loaded when their message is selected
+                retrieval_history: list[str | None] = [None] * len(chats)
+                plot_history: list[dict | None] = [None] * len(chats)
+                last_turn = (
+                    load_conversation_turn(session, id_, len(chats) - 1)
+                    if chats
+                    else None
                 )
-                plot_history: list[dict] = result.data_source.get("plot_history", [])
-
-                # On initialization
-                # Ensure len of retrieval and messages are equal
-                retrieval_history = sync_retrieval_n_message(chats, retrieval_history)
+                if last_turn is not None:
+                    retrieval_history[-1] = last_turn.retrieval
+                    plot_history[-1] = last_turn.plot
 
                 info_panel = (
                     retrieval_history[-1]
-                    if retrieval_history
+                    if retrieval_history and retrieval_history[-1]
                     else "<h5><b>No evidence found.</b></h5>"
                 )
                 plot_data = plot_history[-1] if plot_history else None
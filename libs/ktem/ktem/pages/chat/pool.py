@@ -0,0 +1,97 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+from theflow.settings import settings
+
+
+class PipelinePool:
+    """Reuse the reasoning pipelines across the chat turns
+
+    Building a reasoning pipeline instantiates its retrievers and all their
+    sub-components on every message. The built pipelines are kept per key of
+    everything they are built from, and leased to a single request at a time, so
+    their per-request state is never shared between concurrent chats.
+
+    Args:
+        max_keys: maximum number of pipeline configurations to keep, the least
+            recently used are evicted first, 0 to disable the pool
+        max_idle: maximum number of idle pipelines kept per configuration
+        ttl: number of seconds an idle pipeline stays reusable
+    """
+
+    def __init__(self, max_keys: int = 64, max_idle: int = 2, ttl: float = 600):
+        self.max_keys = max_keys
+        self.max_idle = max_idle
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._idle: OrderedDict[str, list[tuple[float, Any]]] = OrderedDict()
+        self._leased: dict[int, tuple[str, float]] = {}
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """Hash the parts a pipeline is built from into its pool key"""
+        dumped = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(dumped.encode("utf-8")).hexdigest()
+
+    def acquire(self, key: str, build: Callable[[], Any]) -> Any:
+        """Lease an idle pipeline of the key, or build a new one
+
+        Args:
+            key: the pool key of the pipeline
+            build: the function to build the pipeline
+        """
+        pipeline, created = None, 0.0
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                created, candidate = idle.pop()
+                if time.monotonic() - created < self.ttl:
+                    pipeline = candidate
+                    break
+            if key in self._idle:
+                self._idle.move_to_end(key)
+
+        if pipeline is None:
+            pipeline, created = build(), time.monotonic()
+
+        with self._lock:
+            self._leased[id(pipeline)] = (key, created)
+        return pipeline
+
+    def release(self, pipeline: Any, reusable: bool = True):
+        """Return a leased pipeline to the pool
+
+        Args:
+            pipeline: the pipeline returned by `acquire`
+            reusable: False to drop the pipeline, e.g. when its run failed
+        """
+        with self._lock:
+            leased = self._leased.pop(id(pipeline), None)
+            if leased is None or not reusable or self.max_keys <= 0:
+                return
+
+            key, created = leased
+            if time.monotonic() - created >= self.ttl:
+                return
+
+            idle = self._idle.setdefault(key, [])
+            self._idle.move_to_end(key)
+            if len(idle) < self.max_idle:
+                idle.append((created, pipeline))
+            while len(self._idle) > self.max_keys:
+                self._idle.popitem(last=False)
+
+    def clear(self):
+        """Drop all the idle pipelines"""
+        with self._lock:
+            self._idle.clear()
+
+
+pipeline_pool = PipelinePool(
+    max_keys=getattr(settings, "KH_PIPELINE_POOL_SIZE", 64),
+    ttl=getattr(settings, "KH_PIPELINE_POOL_TTL", 600),
+)
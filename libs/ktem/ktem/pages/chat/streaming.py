@@ -0,0 +1,74 @@
+import time
+from typing import Iterable, Iterator
+
+from kotaemon.base import Document
+
+
+def coalesce_chat_stream(
+    responses: Iterable, interval: float = 0.05, max_chars: int = 512
+) -> Iterator[dict]:
+    """Turn the outputs of a reasoning pipeline into coalesced delta events
+
+    The answer tokens are buffered and sent as a single delta once `interval`
+    seconds passed since the last delta or `max_chars` characters are buffered.
+    The information panel and the plot are sent only when they change.
+
+    Args:
+        responses: the documents streamed by the reasoning pipeline
+        interval: maximum number of seconds the tokens are buffered
+        max_chars: maximum number of characters buffered
+
+    Yields:
+        the events, one of:
+            - {"type": "text", "delta": str}: text appended to the answer
+            - {"type": "text_reset"}: the answer is cleared
+            - {"type": "info", "html": str}: the whole new information panel
+            - {"type": "plot", "plot": dict | None}: the new plot
+    """
+    buffer: list[str] = []
+    n_chars = 0
+    last_flush = time.monotonic()
+    refs, sent_refs = "", ""
+
+    def flush_text():
+        nonlocal buffer, n_chars, last_flush
+        last_flush = time.monotonic()
+        if buffer:
+            delta = "".join(buffer)
+            buffer, n_chars = [], 0
+            return [{"type": "text", "delta": delta}]
+        return []
+
+    def flush_info():
+        nonlocal sent_refs
+        if refs != sent_refs:
+            sent_refs = refs
+            return [{"type": "info", "html": refs}]
+        return []
+
+    for response in responses:
+        if not isinstance(response, Document) or response.channel is None:
+            continue
+
+        if response.channel == "chat":
+            if response.content is None:
+                buffer, n_chars = [], 0
+                yield {"type": "text_reset"}
+            else:
+                buffer.append(response.content)
+                n_chars += len(response.content)
+        elif response.channel == "info":
+            refs = "" if response.content is None else refs + response.content
+        elif response.channel == "plot":
+            yield from flush_text()
+            yield {"type": "plot", "plot": response.content}
+            continue
+        else:
+            continue
+
+        if n_chars >= max_chars or time.monotonic() - last_flush >= interval:
+            yield from flush_text()
+            yield from flush_info()
+
+    yield from flush_text()
+    yield from flush_info()
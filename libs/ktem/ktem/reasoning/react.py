@@ -1,5 +1,6 @@
 import html
 import logging
+from copy import deepcopy
 from typing import AnyStr, Optional, Type
 
 from ktem.llms.manager import llms
@@ -279,7 +280,8 @@ class ReactAgentPipeline(BaseReasoning):
 
         tools = []
         for tool_name in settings[f"reasoning.options.{_id}.tools"]:
-            tool = TOOL_REGISTRY[tool_name]
+            # a copy, the pooled pipelines must not share their retrievers
+            tool = deepcopy(TOOL_REGISTRY[tool_name])
             if tool_name == "SearchDoc":
                 tool.retrievers = retrievers
             elif tool_name == "LLM":
@@ -1,5 +1,6 @@
 import html
 import logging
+from copy import deepcopy
 from difflib import SequenceMatcher
 from typing import AnyStr, Generator, Optional, Type
 
@@ -405,7 +406,8 @@ class RewooAgentPipeline(BaseReasoning):
 
         tools = []
         for tool_name in settings[f"{prefix}.tools"]:
-            tool = TOOL_REGISTRY[tool_name]
+            # a copy, the pooled pipelines must not share their retrievers
+            tool = deepcopy(TOOL_REGISTRY[tool_name])
             if tool_name == "SearchDoc":
                 tool.retrievers = retrievers
             elif tool_name == "LLM":
@@ -18,6 +18,8 @@ class RerankingManager:
         self._info: dict[str, dict] = {}
         self._default: str = ""
         self._vendors: list[Type] = []
+        # bumped on every reload, to tell apart the model pools
+        self.version: int = 0
 
         # populate the pool if empty
         if hasattr(flowsettings, "KH_RERANKINGS"):
@@ -37,6 +39,7 @@ class RerankingManager:
     def load(self):
         """Load the model pool from database"""
         self._models, self._info, self._default = {}, {}, ""
+        self.version += 1
         with Session(engine) as sess:
             stmt = select(RerankingTable)
             items = sess.execute(stmt)
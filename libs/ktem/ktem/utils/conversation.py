@@ -1,3 +1,14 @@
+from collections import defaultdict
+from typing import Optional
+
+from ktem.db.models import ConversationTurn
+from sqlalchemy import delete
+from sqlmodel import Session, func, select
+
+# keys of the data source holding the turns before they got their own table
+LEGACY_TURN_KEYS = ("messages", "retrieval_messages", "plot_history", "likes")
+
+
 def sync_retrieval_n_message(
     messages: list[list[str]],
     retrievals: list[str],
@@ -16,5 +27,142 @@ def sync_retrieval_n_message(
     return retrievals
 
 
+def migrate_conversation_turns(session: Session, conversation) -> bool:
+    """Move the turns stored in the data source of a conversation to their table
+
+    Conversations created before the turn table kept all their messages,
+    retrieval panels and plots in the data source. They are migrated the first
+    time they are loaded or updated. The caller commits the session.
+
+    Returns:
+        True if the conversation was migrated
+    """
+    data_source = conversation.data_source or {}
+    if "messages" not in data_source:
+        return False
+
+    messages = data_source.get("messages", [])
+    retrievals = sync_retrieval_n_message(
+        messages, data_source.get("retrieval_messages", [])
+    )
+    plots = data_source.get("plot_history", [])
+    likes = defaultdict(list)
+    for like in data_source.get("likes", []):
+        index = like[0]
+        likes[index[0] if isinstance(index, list) else index].append(like)
+
+    session.add_all(
+        [
+            ConversationTurn(
+                conversation_id=conversation.id,
+                position=position,
+                message=list(message),
+                retrieval=retrievals[position] or "",
+                plot=plots[position] if position < len(plots) else None,
+                likes=likes.get(position, []),
+            )
+            for position, message in enumerate(messages)
+        ]
+    )
+    conversation.data_source = {
+        key: value for key, value in data_source.items() if key not in LEGACY_TURN_KEYS
+    }
+    session.add(conversation)
+    return True
+
+
+def load_conversation_messages(session: Session, conversation_id: str) -> list:
+    """Load the messages of all the turns, without their retrievals and plots"""
+    statement = (
+        select(ConversationTurn.message)
+        .where(ConversationTurn.conversation_id == conversation_id)
+        .order_by(ConversationTurn.position)
+    )
+    return [list(message) for message in session.exec(statement)]
+
+
+def load_conversation_turn(
+    session: Session, conversation_id: str, position: int
+) -> Optional[ConversationTurn]:
+    """Load a single turn of the conversation"""
+    statement = select(ConversationTurn).where(
+        ConversationTurn.conversation_id == conversation_id,
+        ConversationTurn.position == position,
+    )
+    return session.exec(statement).first()
+
+
+def save_conversation_turn(
+    session: Session,
+    conversation_id: str,
+    messages: list,
+    retrieval: str,
+    plot: Optional[dict],
+):
+    """Persist the last turn of the conversation
+
+    Only the last turn is written, so the cost doesn't grow with the length of the
+    conversation. A regenerated answer overwrites the last turn. The caller
+    commits the session.
+
+    Args:
+        conversation_id: the id of the conversation
+        messages: all the messages of the conversation, the last one is saved
+        retrieval: the retrieval panel of the last answer
+        plot: the plot data of the last answer
+    """
+    position = len(messages) - 1
+    if position < 0:
+        return
+
+    last_position = session.exec(
+        select(func.max(ConversationTurn.position)).where(
+            ConversationTurn.conversation_id == conversation_id
+        )
+    ).one()
+    if last_position is None:
+        last_position = -1
+
+    if last_position > position:
+        # the chat got shorter than what is stored
+        session.execute(
+            delete(ConversationTurn).where(
+                ConversationTurn.conversation_id == conversation_id,
+                ConversationTurn.position > position,
+            )
+        )
+
+    # fill in the turns that failed to be saved, without their evidence
+    session.add_all(
+        [
+            ConversationTurn(
+                conversation_id=conversation_id,
+                position=missing,
+                message=list(messages[missing]),
+            )
+            for missing in range(last_position + 1, position)
+        ]
+    )
+
+    turn = None
+    if last_position >= position:
+        turn = load_conversation_turn(session, conversation_id, position)
+    if turn is None:
+        turn = ConversationTurn(conversation_id=conversation_id, position=position)
+    turn.message = list(messages[-1])
+    turn.retrieval = retrieval or ""
+    turn.plot = plot
+    session.add(turn)
+
+
+def delete_conversation_turns(session: Session, conversation_id: str):
+    """Delete all the turns of the conversation. The caller commits the session."""
+    session.execute(
+        delete(ConversationTurn).where(
+            ConversationTurn.conversation_id == conversation_id
+        )
+    )
+
+
 if __name__ == "__main__":
     print(sync_retrieval_n_message([[""], [""], [""]], []))
@@ -112,6 +112,9 @@ class Render:
     @staticmethod
     def image(url: str, text: str = "") -> str:
         """Render an image"""
+        if url and not url.startswith(("data:", "http://", "https://", "/file=")):
+            # image stored as a file, served by gradio when displayed
+            url = f"/file={url}"
         img = f'<img src="{url}"><br>'
         if text:
             caption = f"<p>{text}</p>"
@@ -0,0 +1,113 @@
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import gradio as gr
+import pytest
+from ktem.db.models import User
+from ktem.pages import chat as chat_module
+from ktem.pages.chat import ChatPage
+from ktem.pages.chat import streaming as streaming_module
+from ktem.pages.chat.streaming import coalesce_chat_stream
+from sqlmodel import Session, SQLModel, create_engine
+
+from kotaemon.base import Document
+
+
+def _chat(text):
+    return Document(channel="chat", content=text)
+
+
+def _info(html):
+    return Document(channel="info", content=html)
+
+
+def test_flush_on_interval():
+    responses = [_chat("a"), _chat("b"), _chat("c"), _chat("d")]
+    # one tick of the clock per token, flushed every 2 ticks
+    clock = iter(range(100))
+    with patch.object(
+        streaming_module.time, "monotonic", side_effect=lambda: next(clock)
+    ):
+        events = list(coalesce_chat_stream(responses, interval=2))
+
+    assert events == [
+        {"type": "text", "delta": "ab"},
+        {"type": "text", "delta": "cd"},
+    ]
+
+
+def test_flush_on_size():
+    responses = [_chat("abc"), _chat("de"), _chat("f"), _chat("ghijk"), _chat("l")]
+    events = list(coalesce_chat_stream(responses, interval=3600, max_chars=5))
+
+    assert events == [
+        {"type": "text", "delta": "abcde"},
+        {"type": "text", "delta": "fghijk"},
+        {"type": "text", "delta": "l"},
+    ]
+
+
+def test_text_reset():
+    responses = [_chat("draft"), _chat(None), _chat("final"), _chat(" answer")]
+    events = list(coalesce_chat_stream(responses, interval=3600))
+
+    # the buffered draft is dropped, not sent before the reset
+    assert events == [
+        {"type": "text_reset"},
+        {"type": "text", "delta": "final answer"},
+    ]
+
+
+def test_info_sent_only_on_change():
+    responses = [
+        _info("<p>1</p>"),
+        _chat("a"),
+        _chat("b"),
+        _info("<p>2</p>"),
+        _chat("c"),
+        _info(None),
+        _info("<p>3</p>"),
+        Document(channel="plot", content={"data": []}),
+        _chat("d"),
+        Document(content="no channel"),
+        "not a document",
+    ]
+    events = list(coalesce_chat_stream(responses, interval=0))
+
+    assert events == [
+        {"type": "info", "html": "<p>1</p>"},
+        {"type": "text", "delta": "a"},
+        {"type": "text", "delta": "b"},
+        {"type": "info", "html": "<p>1</p><p>2</p>"},
+        {"type": "text", "delta": "c"},
+        {"type": "info", "html": ""},
+        {"type": "info", "html": "<p>3</p>"},
+        {"type": "plot", "plot": {"data": []}},
+        {"type": "text", "delta": "d"},
+    ]
+
+
+def test_api_user_id(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sql.db'}")
+    SQLModel.metadata.create_all(engine, tables=[User.__table__])
+    with Session(engine) as session:
+        user = User(username="Alice", username_lower="alice", password="hashed")
+        session.add(user)
+        session.commit()
+        user_id = user.id
+
+    def page(user_management):
+        return SimpleNamespace(_app=SimpleNamespace(f_user_management=user_management))
+
+    # without user management, the API runs as the default user like the chat UI
+    assert ChatPage.api_user_id(page(False), None) == 1
+
+    with patch.object(chat_module, "engine", engine):
+        assert (
+            ChatPage.api_user_id(page(True), SimpleNamespace(username="Alice"))
+            == user_id
+        )
+        with pytest.raises(gr.Error):
+            ChatPage.api_user_id(page(True), SimpleNamespace(username="bob"))
+        with pytest.raises(gr.Error):
+            ChatPage.api_user_id(page(True), SimpleNamespace(username=None))
@@ -0,0 +1,129 @@
+from ktem.db.models import Conversation, ConversationTurn
+from ktem.utils.conversation import (
+    delete_conversation_turns,
+    load_conversation_messages,
+    load_conversation_turn,
+    migrate_conversation_turns,
+    save_conversation_turn,
+)
+from sqlmodel import Session, SQLModel, create_engine, select
+
+
+def _create_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sql.db'}")
+    SQLModel.metadata.create_all(
+        engine, tables=[Conversation.__table__, ConversationTurn.__table__]
+    )
+    return engine
+
+
+def test_conversation_turns_round_trip(tmp_path):
+    engine = _create_engine(tmp_path)
+    conversation = Conversation(user=1)
+    convo_id = conversation.id
+    with Session(engine) as session:
+        session.add(conversation)
+        session.commit()
+
+    messages: list = []
+    for idx in range(3):
+        messages.append([f"question {idx}", f"answer {idx}"])
+        with Session(engine) as session:
+            save_conversation_turn(
+                session, convo_id, messages, f"evidence {idx}", {"plot": idx}
+            )
+            session.commit()
+
+    # regenerate the last answer
+    messages[-1] = ["question 2", "better answer 2"]
+    with Session(engine) as session:
+        save_conversation_turn(session, convo_id, messages, "new evidence", None)
+        turn = load_conversation_turn(session, convo_id, 1)
+        turn.likes = turn.likes + [[[1, 1], "answer 1", True]]
+        session.add(turn)
+        session.commit()
+
+    with Session(engine) as session:
+        assert load_conversation_messages(session, convo_id) == messages
+        turns = session.exec(
+            select(ConversationTurn)
+            .where(ConversationTurn.conversation_id == convo_id)
+            .order_by(ConversationTurn.position)
+        ).all()
+        assert [turn.position for turn in turns] == [0, 1, 2]
+        assert [turn.retrieval for turn in turns] == [
+            "evidence 0",
+            "evidence 1",
+            "new evidence",
+        ]
+        assert [turn.plot for turn in turns] == [{"plot": 0}, {"plot": 1}, None]
+        assert [turn.likes for turn in turns] == [[], [[[1, 1], "answer 1", True]], []]
+
+    # the chat got shorter, the extra turns are dropped
+    with Session(engine) as session:
+        save_conversation_turn(session, convo_id, messages[:1], "only", None)
+        session.commit()
+        assert load_conversation_messages(session, convo_id) == messages[:1]
+        assert load_conversation_turn(session, convo_id, 0).retrieval == "only"
+
+    with Session(engine) as session:
+        delete_conversation_turns(session, convo_id)
+        session.commit()
+        assert load_conversation_messages(session, convo_id) == []
+
+
+def test_save_conversation_turn_fills_missing_turns(tmp_path):
+    engine = _create_engine(tmp_path)
+    messages = [["q0", "a0"], ["q1", "a1"], ["q2", "a2"]]
+    with Session(engine) as session:
+        save_conversation_turn(session, "convo", messages, "evidence", None)
+        session.commit()
+
+        assert load_conversation_messages(session, "convo") == messages
+        assert load_conversation_turn(session, "convo", 0).retrieval == ""
+        assert load_conversation_turn(session, "convo", 2).retrieval == "evidence"
+
+
+def test_migrate_legacy_conversation(tmp_path):
+    engine = _create_engine(tmp_path)
+    conversation = Conversation(
+        user=1,
+        data_source={
+            "selected": {"1": ["all", [], 1]},
+            "messages": [["q0", "a0"], ["q1", "a1"]],
+            "retrieval_messages": ["evidence 0"],
+            "plot_history": [None, {"plot": 1}],
+            "likes": [[[1, 1], "a1", True], [[0, 0], "q0", False]],
+            "state": {"app": {"regen": False}},
+        },
+    )
+    convo_id = conversation.id
+    with Session(engine) as session:
+        session.add(conversation)
+        session.commit()
+
+    with Session(engine) as session:
+        result = session.get(Conversation, convo_id)
+        assert migrate_conversation_turns(session, result)
+        session.commit()
+
+    with Session(engine) as session:
+        result = session.get(Conversation, convo_id)
+        # the other settings of the conversation are kept
+        assert result.data_source == {
+            "selected": {"1": ["all", [], 1]},
+            "state": {"app": {"regen": False}},
+        }
+        # migrated only once
+        assert not migrate_conversation_turns(session, result)
+
+        assert load_conversation_messages(session, convo_id) == [
+            ["q0", "a0"],
+            ["q1", "a1"],
+        ]
+        first = load_conversation_turn(session, convo_id, 0)
+        second = load_conversation_turn(session, convo_id, 1)
+        assert (first.retrieval, first.plot) == ("evidence 0", None)
+        assert first.likes == [[[0, 0], "q0", False]]
+        assert (second.retrieval, second.plot) == ("", {"plot": 1})
+        assert second.likes == [[[1, 1], "a1", True]]
@@ -0,0 +1,195 @@
+import importlib
+import subprocess
+import sys
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from ktem.index.file.graph import pipelines as graph_pipelines
+from sqlalchemy import Column, Integer, String, create_engine
+from sqlalchemy.orm import Session, declarative_base
+
+from kotaemon.base import Document
+
+Base = declarative_base()
+
+
+class Index(Base):  # type: ignore
+    __tablename__ = "test_graphrag_index__index"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    source_id = Column(String)
+    target_id = Column(String)
+    relation_type = Column(String)
+    user = Column(Integer, default=1)
+
+
+def _consume(gen):
+    try:
+        while True:
+            next(gen)
+    except StopIteration as e:
+        return e.value
+
+
+def _fake_init(args, **kwargs):
+    root_path = args[args.index("--root") + 1]
+    with open(f"{root_path}/settings.yaml", "w") as f:
+        f.write("llm: {}\n")
+    return subprocess.CompletedProcess(args, 0)
+
+
+async def _fake_build_index(config, run_id, progress_reporter):
+    progress_reporter(
+        SimpleNamespace(
+            description="create_base_text_units", total_items=2, completed_items=1
+        )
+    )
+    progress_reporter.child("create_final_entities").info("done")
+    return [SimpleNamespace(workflow="create_final_entities", errors=["boom"])]
+
+
+@patch.dict(sys.modules, {"graphrag.index.cli": None})
+def test_run_graphrag_index_in_process(tmp_path):
+    with patch.object(
+        graph_pipelines.subprocess, "run", side_effect=_fake_init
+    ) as run, patch.object(
+        graph_pipelines, "create_graphrag_config", create=True, return_value="cfg"
+    ) as create_config, patch.object(
+        graph_pipelines, "build_index", create=True, side_effect=_fake_build_index
+    ) as build_index:
+        messages = [doc.text for doc in graph_pipelines.run_graphrag_index(tmp_path)]
+
+    # the project is initialized through the CLI without the private helper
+    assert "--init" in run.call_args.args[0]
+    create_config.assert_called_once_with({"llm": {}}, str(tmp_path))
+    assert build_index.call_args.kwargs["config"] == "cfg"
+    assert messages == [
+        "[GraphRAG] create_base_text_units 1/2",
+        "[GraphRAG] create_final_entities done",
+        "[GraphRAG] Error: create_final_entities: boom",
+    ]
+
+
+def test_run_graphrag_index_error(tmp_path):
+    (tmp_path / "settings.yaml").write_text("llm: {}\n")
+
+    async def failed_build_index(config, run_id, progress_reporter):
+        progress_reporter.info("started")
+        raise RuntimeError("LLM unavailable")
+
+    with patch.object(
+        graph_pipelines, "create_graphrag_config", create=True, return_value="cfg"
+    ), patch.object(
+        graph_pipelines, "build_index", create=True, side_effect=failed_build_index
+    ):
+        messages = []
+        with pytest.raises(RuntimeError):
+            for doc in graph_pipelines.run_graphrag_index(tmp_path):
+                messages.append(doc.text)
+
+    assert messages == ["[GraphRAG] started"]
+
+
+def test_run_graphrag_index_update(tmp_path):
+    (tmp_path / "settings.yaml").write_text("llm: {}\n")
+    calls = []
+
+    async def update_build_index(config, run_id, progress_reporter, **kwargs):
+        calls.append(kwargs)
+        return []
+
+    async def old_build_index(config, run_id, progress_reporter):
+        calls.append({})
+        return []
+
+    for build_index in [update_build_index, old_build_index]:
+        with patch.object(
+            graph_pipelines, "create_graphrag_config", create=True, return_value="cfg"
+        ), patch.object(
+            graph_pipelines, "build_index", create=True, side_effect=build_index
+        ):
+            messages = [
+                doc.text
+                for doc in graph_pipelines.run_graphrag_index(tmp_path, update=True)
+            ]
+
+    # graphrag without the update run indexes all the files again
+    assert calls == [{"is_update_run": True}, {}]
+    assert messages == [
+        "[GraphRAG] Warning: update run not supported, indexing all the files"
+    ]
+
+
+def test_append_files_to_group_graph(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sql.db'}")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all(
+            [
+                Index(source_id="old-1", target_id="graph-1", relation_type="graph"),
+                Index(source_id="old-2", target_id="graph-1", relation_type="graph"),
+                Index(source_id="other", target_id="graph-2", relation_type="graph"),
+            ]
+        )
+        session.commit()
+
+    # graph-1 was indexed before
+    output_path = tmp_path / "graphrag" / "graph-1" / "output"
+    output_path.mkdir(parents=True)
+    for table in graph_pipelines.GRAPH_TABLES:
+        (output_path / f"{table}.parquet").touch()
+
+    def indexed(self, file_paths, reindex=False, **kwargs):
+        assert "group_file_ids" not in kwargs
+        yield Document(channel="debug", text="indexing")
+        return ["new-1", None], [None, "error"], [Document(text="new content")]
+
+    updates = []
+
+    def run_index(root_path, update=False):
+        updates.append((root_path, update))
+        yield Document(channel="debug", text="[GraphRAG] done")
+
+    pipeline = graph_pipelines.GraphRAGIndexingPipeline()
+    pipeline.Index = Index
+    with patch.object(graph_pipelines, "engine", engine), patch.object(
+        graph_pipelines, "filestorage_path", tmp_path / "graphrag"
+    ), patch.object(
+        graph_pipelines.IndexDocumentPipeline, "stream", indexed
+    ), patch.object(
+        graph_pipelines, "run_graphrag_index", side_effect=run_index
+    ), patch.object(
+        graph_pipelines, "load_entity_embedding_store"
+    ):
+        file_ids, _, _ = _consume(
+            pipeline.stream(["new.txt"], group_file_ids=["old-1", "old-2"])
+        )
+        assert file_ids == ["new-1", None]
+        assert pipeline.get_graph_id(["new-1"]) == "graph-1"
+
+        # a group without graph gets a new one
+        _consume(pipeline.stream(["new.txt"], group_file_ids=["unknown"]))
+
+        with pytest.raises(ValueError):
+            pipeline.get_graph_id(["old-1", "other"])
+
+    root_path = (tmp_path / "graphrag" / "graph-1").absolute()
+    assert updates[0] == (root_path, True)
+    assert (root_path / "input").is_dir()
+    assert updates[1][0] != root_path and updates[1][1] is False
+
+
+@pytest.mark.parametrize("module", ["nano_pipelines", "lightrag_pipelines"])
+def test_graph_version_follows_model_edits(module):
+    module = importlib.import_module(f"ktem.index.file.graph.{module}")
+    embedding = SimpleNamespace(get_model_id=lambda: "embedding-id")
+
+    with patch.object(module.llms, "get_default_name", return_value="default"):
+        version = module.get_graph_version(embedding)
+        assert module.get_graph_version(embedding) == version
+        # e.g. the default LLM edited under the same name
+        module.llms.load()
+        assert module.get_graph_version(embedding) != version
+        version = module.get_graph_version(embedding)
+        module.embeddings.load()
+        assert module.get_graph_version(embedding) != version
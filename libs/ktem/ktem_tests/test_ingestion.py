@@ -0,0 +1,226 @@
+import gc
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from unittest.mock import patch
+
+from ktem.index.file import ingestion
+from ktem.index.file import pipelines as file_pipelines
+from ktem.index.file.pipelines import IndexDocumentPipeline
+from sqlalchemy import JSON, Column, Integer, String, create_engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.mutable import MutableDict
+from sqlalchemy.orm import Session
+
+from kotaemon.base import DocumentWithEmbedding
+from kotaemon.embeddings import BaseEmbeddings
+from kotaemon.indices import VectorIndexing
+from kotaemon.loaders import TxtReader
+from kotaemon.loaders.cache import ParseCache
+from kotaemon.storages import InMemoryDocumentStore, InMemoryVectorStore
+
+Base = declarative_base()
+
+
+class Source(Base):  # type: ignore
+    __tablename__ = "test_ingestion__source"
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    name = Column(String, unique=True)
+    path = Column(String)
+    size = Column(Integer, default=0)
+    user = Column(Integer, default=1)
+    note = Column(MutableDict.as_mutable(JSON), default={})  # type: ignore
+
+
+class Index(Base):  # type: ignore
+    __tablename__ = "test_ingestion__index"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    source_id = Column(String)
+    target_id = Column(String)
+    relation_type = Column(String)
+    user = Column(Integer, default=1)
+
+
+_active_calls: dict = defaultdict(lambda: {"now": 0, "max": 0})
+_active_calls_lock = threading.Lock()
+
+
+@contextmanager
+def _track(name: str):
+    """Count the calls running at the same time, slowly so that the files overlap"""
+    calls = _active_calls[name]
+    with _active_calls_lock:
+        calls["now"] += 1
+        calls["max"] = max(calls["max"], calls["now"])
+    time.sleep(0.05)
+    try:
+        yield
+    finally:
+        with _active_calls_lock:
+            calls["now"] -= 1
+
+
+class SlowEmbeddings(BaseEmbeddings):
+    """Embed the texts by their length"""
+
+    def invoke(self, text, *args, **kwargs):
+        with _track("embedding"):
+            pass
+        return [
+            DocumentWithEmbedding(content=doc, embedding=[float(len(doc.text)), 1.0])
+            for doc in self.prepare_input(text)
+        ]
+
+
+class SlowTxtReader(TxtReader):
+    def load_data(self, *args, **kwargs):
+        with _track("parsing"):
+            return super().load_data(*args, **kwargs)
+
+
+def _make_pipeline(tmp_path, **params) -> IndexDocumentPipeline:
+    (tmp_path / "files").mkdir()
+    pipeline = IndexDocumentPipeline(embedding=SlowEmbeddings(), **params)
+    pipeline.Source = Source
+    pipeline.Index = Index
+    pipeline.VS = InMemoryVectorStore()
+    pipeline.DS = InMemoryDocumentStore()
+    pipeline.FSPath = tmp_path / "files"
+    pipeline.user_id = 1
+    return pipeline
+
+
+def _index(pipeline, file_paths, engine, parse_cache=None, **kwargs):
+    with patch.object(file_pipelines, "engine", engine), patch.object(
+        file_pipelines, "_get_parse_cache", return_value=parse_cache
+    ), patch.object(VectorIndexing, "embedding_cache_path", None), patch.object(
+        VectorIndexing, "cache_dir", None
+    ), patch.dict(
+        file_pipelines.KH_DEFAULT_FILE_EXTRACTORS, {".txt": SlowTxtReader()}
+    ):
+        gen = pipeline.stream(file_paths, **kwargs)
+        try:
+            while True:
+                next(gen)
+        except StopIteration as e:
+            return e.value
+
+
+def test_index_files_concurrently(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sql.db'}")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(Source(name="indexed.txt", path="hash"))
+        session.commit()
+
+    file_paths = []
+    for idx, name in enumerate(["a", "b", "indexed", "c", "d", "e"]):
+        file_path = tmp_path / f"{name}.txt"
+        file_path.write_text(f"Content of file {name} " * (idx + 1))
+        file_paths.append(file_path)
+
+    pipeline = _make_pipeline(tmp_path, max_concurrent_files=4)
+    file_ids, errors, _ = _index(pipeline, file_paths, engine)
+
+    assert _active_calls["embedding"]["max"] == 1, "Expect the embedding serialized"
+    assert _active_calls["parsing"]["max"] > 1, "Expect the files parsed concurrently"
+
+    # the outputs are in the order of the files
+    assert [error is None for error in errors] == [True, True, False, True, True, True]
+    assert "already indexed" in errors[2]
+    assert file_ids[2] is None
+
+    with Session(engine) as session:
+        names = {
+            source.id: source.name
+            for source in session.query(Source).filter(Source.id.in_(file_ids))
+        }
+        relations = session.query(Index.source_id, Index.relation_type).all()
+    assert [names.get(file_id) for file_id in file_ids] == [
+        "a.txt",
+        "b.txt",
+        None,
+        "c.txt",
+        "d.txt",
+        "e.txt",
+    ]
+
+    # each file has its chunks stored, in both the doc store and vector store
+    chunks = pipeline.DS.get_all()
+    assert sorted(chunk.metadata["file_name"] for chunk in chunks) == [
+        "a.txt",
+        "b.txt",
+        "c.txt",
+        "d.txt",
+        "e.txt",
+    ]
+    for chunk in chunks:
+        assert names[chunk.metadata["file_id"]] == chunk.metadata["file_name"]
+        assert chunk.text.startswith(
+            f"Content of file {chunk.metadata['file_name'][0]}"
+        )
+        assert (chunk.metadata["file_id"], "document") in relations
+        assert (chunk.metadata["file_id"], "vector") in relations
+        assert pipeline.VS.get(chunk.doc_id)[0] == len(chunk.text)
+
+
+def test_reindex_bypasses_parse_cache(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sql.db'}")
+    Base.metadata.create_all(engine)
+    file_path = tmp_path / "a.txt"
+    file_path.write_text("Content of file a")
+
+    pipeline = _make_pipeline(tmp_path)
+    parse_cache = ParseCache(tmp_path / "parse_cache")
+    with patch.object(
+        file_pipelines, "load_data", wraps=file_pipelines.load_data
+    ) as load_data:
+        file_ids, errors, _ = _index(pipeline, [file_path], engine, parse_cache)
+        assert errors == [None]
+        assert load_data.call_count == 1
+        assert len(list(parse_cache.path.glob("*.json.gz"))) == 1
+
+        # reindexing parses the file again instead of reusing the cached entry
+        file_ids, errors, docs = _index(
+            pipeline, [file_path], engine, parse_cache, reindex=True
+        )
+        assert errors == [None]
+        assert load_data.call_count == 2
+
+    assert [doc.text for doc in docs] == ["Content of file a"]
+    assert {chunk.metadata["file_id"] for chunk in pipeline.DS.get_all()} == {
+        file_ids[0]
+    }
+
+
+def test_serialized_locks_are_released():
+    class Shared:
+        pass
+
+    shared = Shared()
+    with ingestion.serialized(shared, None):
+        assert id(shared) in ingestion._shared_locks
+
+    key = id(shared)
+    del shared
+    gc.collect()
+    assert key not in ingestion._shared_locks
+
+
+def test_thread_copy():
+    reader = SlowTxtReader()
+    # outside of the indexing threads, the shared reader is used
+    assert ingestion.thread_copy(reader) is reader
+
+    def _stream():
+        yield ingestion.thread_copy(reader)
+        return ingestion.thread_copy(reader)
+
+    outputs = list(ingestion.stream_in_order([_stream, _stream], max_workers=2))
+    copies = [payload for _, _, payload in outputs]
+    assert reader not in copies
+    # a copy per thread, reused within the thread
+    assert copies[0] is copies[1]
+    assert copies[2] is copies[3]
@@ -0,0 +1,149 @@
+import importlib
+from unittest.mock import patch
+
+import pytest
+from ktem.pages.chat import pool as pool_module
+from ktem.pages.chat.pool import PipelinePool
+
+
+class Pipeline:
+    pass
+
+
+def test_make_key():
+    key = PipelinePool.make_key("simple", {"a": 1, "b": 2}, [1, 2])
+    assert key == PipelinePool.make_key("simple", {"b": 2, "a": 1}, [1, 2])
+    assert key != PipelinePool.make_key("simple", {"a": 1, "b": 2}, [1, 3])
+
+
+def test_lease_pipeline():
+    pool = PipelinePool()
+    first = pool.acquire("key", Pipeline)
+    # a leased pipeline is never handed to another request
+    second = pool.acquire("key", Pipeline)
+    assert first is not second
+
+    pool.release(first)
+    assert pool.acquire("key", Pipeline) is first
+    assert pool.acquire("key", Pipeline) is not first
+    assert pool.acquire("other", Pipeline) is not first
+
+
+def test_keep_max_idle():
+    pool = PipelinePool(max_idle=2)
+    pipelines = [pool.acquire("key", Pipeline) for _ in range(3)]
+    for pipeline in pipelines:
+        pool.release(pipeline)
+
+    reused = {id(pool.acquire("key", Pipeline)) for _ in range(3)}
+    assert len(reused & {id(pipeline) for pipeline in pipelines}) == 2
+
+
+def test_ttl_expiry():
+    pool = PipelinePool(ttl=10)
+    with patch.object(pool_module.time, "monotonic", return_value=100.0):
+        pipeline = pool.acquire("key", Pipeline)
+        pool.release(pipeline)
+    with patch.object(pool_module.time, "monotonic", return_value=105.0):
+        assert pool.acquire("key", Pipeline) is pipeline
+        pool.release(pipeline)
+    with patch.object(pool_module.time, "monotonic", return_value=110.0):
+        assert pool.acquire("key", Pipeline) is not pipeline
+
+        # released after its ttl, it is dropped
+        pool.release(pipeline)
+        assert pool.acquire("key", Pipeline) is not pipeline
+
+
+def test_lru_eviction():
+    pool = PipelinePool(max_keys=2)
+    pipelines = {key: pool.acquire(key, Pipeline) for key in ["a", "b"]}
+    pool.release(pipelines["a"])
+    pool.release(pipelines["b"])
+
+    # "a" is used again, so "b" is the least recently used
+    pipelines["a"] = pool.acquire("a", Pipeline)
+    pool.release(pipelines["a"])
+    pool.release(pool.acquire("c", Pipeline))
+
+    assert pool.acquire("a", Pipeline) is pipelines["a"]
+    assert pool.acquire("b", Pipeline) is not pipelines["b"]
+
+
+def test_no_reuse_after_failure():
+    pool = PipelinePool()
+    pipeline = pool.acquire("key", Pipeline)
+    pool.release(pipeline, reusable=False)
+    assert pool.acquire("key", Pipeline) is not pipeline
+
+    # released twice, e.g. by the error handler then the stream, it is not kept
+    pipeline = pool.acquire("key", Pipeline)
+    pool.release(pipeline, reusable=False)
+    pool.release(pipeline)
+    assert pool.acquire("key", Pipeline) is not pipeline
+
+
+def test_disabled_pool():
+    pool = PipelinePool(max_keys=0)
+    pipeline = pool.acquire("key", Pipeline)
+    pool.release(pipeline)
+    assert pool.acquire("key", Pipeline) is not pipeline
+
+
+def test_clear():
+    pool = PipelinePool()
+    pipeline = pool.acquire("key", Pipeline)
+    pool.release(pipeline)
+    pool.clear()
+    assert pool.acquire("key", Pipeline) is not pipeline
+
+
+def test_model_managers_version():
+    from ktem.embeddings.manager import embedding_models_manager
+    from ktem.llms.manager import llms
+    from ktem.rerankings.manager import reranking_models_manager
+
+    for manager in [llms, embedding_models_manager, reranking_models_manager]:
+        version = manager.version
+        manager.load()
+        # the pipelines built from the previous models are not reused
+        assert manager.version > version
+
+
+@pytest.mark.parametrize("reasoning_module", ["react", "rewoo"])
+def test_pooled_agents_keep_their_retrievers(reasoning_module):
+    module = importlib.import_module(f"ktem.reasoning.{reasoning_module}")
+    reasoning_cls = {
+        "react": "ReactAgentPipeline",
+        "rewoo": "RewooAgentPipeline",
+    }[reasoning_module]
+    reasoning_cls = getattr(module, reasoning_cls)
+    prefix = f"reasoning.options.{reasoning_cls.get_info()['id']}"
+    settings = {
+        f"{prefix}.{key}": value["value"]
+        for key, value in reasoning_cls.get_user_settings().items()
+    }
+    settings[f"{prefix}.tools"] = ["SearchDoc"]
+    settings["reasoning.lang"] = "en"
+
+    def search_tool(pipeline):
+        return pipeline.agent.plugins[0]
+
+    pool = PipelinePool()
+    first = pool.acquire(
+        "first", lambda: reasoning_cls.get_pipeline(settings, {}, ["first"])
+    )
+    pool.release(first)
+    second = pool.acquire(
+        "second", lambda: reasoning_cls.get_pipeline(settings, {}, ["second"])
+    )
+
+    reacquired = pool.acquire("first", Pipeline)
+    assert reacquired is first
+    assert search_tool(reacquired).retrievers == ["first"]
+    assert search_tool(second).retrievers == ["second"]
+    # the registry tool isn't touched
+    assert module.TOOL_REGISTRY["SearchDoc"] not in [
+        search_tool(first),
+        search_tool(second),
+    ]